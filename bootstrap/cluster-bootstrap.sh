@@ -68,6 +68,14 @@ apply_with_substitution manifests/applications/ray-operator.yaml
 echo "[+] Applying Argo CD application: ray-sample-cluster"
 apply_with_substitution manifests/applications/ray-cluster.yaml
 
+# The node-local dataset cache is opt-in, enable it with ENABLE_DATASET_CACHE=true
+# along with singleuser.datasetCache / datasetCache in the JupyterHub and Ray
+# chart values.
+if [[ "${ENABLE_DATASET_CACHE:-false}" == "true" ]]; then
+  echo "[+] Applying Argo CD application: dataset-cache"
+  apply_with_substitution manifests/applications/dataset-cache.yaml
+fi
+
 echo "[✔] Cluster bootstrap complete. Access Argo CD UI via:"
 echo "    kubectl -n argocd port-forward svc/argocd-server 8080:443"
 initial_pw=$(kubectl -n argocd get secret argocd-initial-admin-secret -o jsonpath="{.data.password}" | base64 -d)
@@ -0,0 +1,699 @@
+"""
+Node-local read-through cache for datasets in S3 compatible object storage.
+
+Runs on every node as part of the dataset-cache DaemonSet and serves unsigned
+S3 GET/HEAD requests from pods on the same node, fetching objects from the
+upstream object store (MinIO) on first use. Objects are stored once per
+content hash under blobs/, and hard linked into objects/<bucket>/<key> so the
+cache directory can also be mounted read-only into pods. Least recently used
+blobs are evicted when the cache grows past its size budget. Only the
+buckets it is configured with are served, as every pod on the node can read
+them with the cache's credentials.
+
+Only the Python standard library is used so the cache runs on a stock python
+image with this file mounted from a ConfigMap.
+"""
+
+import contextlib
+import datetime
+import hashlib
+import hmac
+import json
+import os
+import re
+import ssl
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFETCH_ANNOTATION = "dataset-cache.microplat.io/prefetch"
+_QUANTITY_SUFFIXES = {
+    "Ki": 2**10,
+    "Mi": 2**20,
+    "Gi": 2**30,
+    "Ti": 2**40,
+    "k": 10**3,
+    "M": 10**6,
+    "G": 10**9,
+    "T": 10**12,
+}
+
+
+def parse_quantity(quantity):
+    """Parse a k8s resource quantity like 100Gi into bytes."""
+    quantity = str(quantity).strip()
+    for suffix, factor in _QUANTITY_SUFFIXES.items():
+        if quantity.endswith(suffix):
+            return int(float(quantity[: -len(suffix)]) * factor)
+    return int(float(quantity))
+
+
+def sign_request(method, url, headers, access_key, secret_key, region):
+    """Add AWS signature version 4 headers for an unsigned payload request."""
+    parsed = urllib.parse.urlsplit(url)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    date = now.strftime("%Y%m%d")
+
+    headers["host"] = parsed.netloc
+    headers["x-amz-date"] = amz_date
+    headers["x-amz-content-sha256"] = "UNSIGNED-PAYLOAD"
+    signed_headers = ";".join(sorted(name.lower() for name in headers))
+    canonical_headers = "".join(
+        f"{name.lower()}:{str(headers[name]).strip()}\n"
+        for name in sorted(headers, key=str.lower)
+    )
+    query = urllib.parse.parse_qsl(parsed.query, keep_blank_values=True)
+    canonical_query = "&".join(
+        f"{urllib.parse.quote(k, safe='-_.~')}={urllib.parse.quote(v, safe='-_.~')}"
+        for k, v in sorted(query)
+    )
+    canonical_request = "\n".join(
+        [
+            method,
+            urllib.parse.quote(parsed.path or "/", safe="/-_.~"),
+            canonical_query,
+            canonical_headers,
+            signed_headers,
+            "UNSIGNED-PAYLOAD",
+        ]
+    )
+    scope = f"{date}/{region}/s3/aws4_request"
+    string_to_sign = "\n".join(
+        [
+            "AWS4-HMAC-SHA256",
+            amz_date,
+            scope,
+            hashlib.sha256(canonical_request.encode()).hexdigest(),
+        ]
+    )
+    key = f"AWS4{secret_key}".encode()
+    for part in (date, region, "s3", "aws4_request"):
+        key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+    signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+    headers["authorization"] = (
+        f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, "
+        f"SignedHeaders={signed_headers}, Signature={signature}"
+    )
+    return headers
+
+
+class Upstream:
+    """The object store the cache reads through to."""
+
+    def __init__(self, endpoint, access_key=None, secret_key=None, region="us-east-1"):
+        self.endpoint = endpoint.rstrip("/")
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+
+    def request(self, method, path, query=""):
+        url = f"{self.endpoint}{urllib.parse.quote(path)}"
+        if query:
+            url = f"{url}?{query}"
+        headers = {}
+        if self.access_key and self.secret_key:
+            sign_request(
+                method, url, headers, self.access_key, self.secret_key, self.region
+            )
+        headers.pop("host", None)
+        return urllib.request.urlopen(
+            urllib.request.Request(url, method=method, headers=headers), timeout=60
+        )
+
+    def list_keys(self, bucket, prefix):
+        """Returns the keys of all objects in a bucket under a prefix."""
+        keys = []
+        token = None
+        while True:
+            params = {"list-type": "2", "prefix": prefix}
+            if token:
+                params["continuation-token"] = token
+            with self.request("GET", f"/{bucket}", urllib.parse.urlencode(params)) as r:
+                root = ET.fromstring(r.read())
+            ns = root.tag[: root.tag.index("}") + 1] if root.tag.startswith("{") else ""
+            keys.extend(e.text for e in root.iter(f"{ns}Key"))
+            if root.findtext(f"{ns}IsTruncated") != "true":
+                return keys
+            token = root.findtext(f"{ns}NextContinuationToken")
+
+
+class DatasetCache:
+    """
+    Content addressed object cache with LRU eviction under a size budget.
+
+    Concurrent misses of the same object are coalesced into a single upstream
+    fetch, so many pods opening the same dataset only read it once from the
+    object store.
+    """
+
+    def __init__(
+        self, cache_dir, size_budget, upstream, revalidate_after=300, buckets=None
+    ):
+        self.cache_dir = cache_dir
+        self.size_budget = size_budget
+        self.upstream = upstream
+        self.revalidate_after = revalidate_after
+        # the buckets served, all when None
+        self.buckets = None if buckets is None else set(buckets)
+        self.blobs_dir = os.path.join(cache_dir, "blobs")
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.index_path = os.path.join(cache_dir, "index.json")
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # orders index writes, which happen outside _lock
+        self._index_lock = threading.Lock()
+        self._index_version = 0
+        self._index_written = 0
+        self._fetch_locks = {}
+        # "bucket/key" -> {"etag", "sha256", "size", "validated"}
+        self.objects = {}
+        # sha256 -> size, in least to most recently used order
+        self.blobs = OrderedDict()
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "deduplicated": 0,
+            "evictions": 0,
+            "upstream_bytes": 0,
+            "served_bytes": 0,
+        }
+        self._load_index()
+        # left behind by fetches and evictions interrupted by a restart
+        for name in os.listdir(cache_dir):
+            if name.startswith((".fetch-", ".evicted-")):
+                os.remove(os.path.join(cache_dir, name))
+
+    @property
+    def size(self):
+        return sum(self.blobs.values())
+
+    def _load_index(self):
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        for sha256, size in index.get("blobs", []):
+            if os.path.exists(os.path.join(self.blobs_dir, sha256)):
+                self.blobs[sha256] = size
+        for key, entry in index.get("objects", {}).items():
+            if entry["sha256"] in self.blobs:
+                self.objects[key] = entry
+
+    def _save_index(self):
+        """Writes a snapshot of the index, unless a newer one was written."""
+        with self._lock:
+            self._index_version += 1
+            version = self._index_version
+            index = json.dumps(
+                {"blobs": list(self.blobs.items()), "objects": self.objects}
+            )
+        with self._index_lock:
+            if version < self._index_written:
+                return
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(index)
+            os.replace(tmp_path, self.index_path)
+            self._index_written = version
+
+    def _object_path(self, key):
+        path = os.path.normpath(os.path.join(self.objects_dir, key))
+        if not path.startswith(self.objects_dir + os.sep):
+            raise ValueError(f"Invalid object key {key}")
+        return path
+
+    def check_bucket(self, bucket):
+        """Raises PermissionError unless the bucket is served."""
+        if self.buckets is not None and bucket not in self.buckets:
+            raise PermissionError(f"Bucket {bucket} is not served by the cache")
+
+    @contextlib.contextmanager
+    def _fetch_lock(self, key):
+        """Holds the lock of key, dropped once no thread is waiting on it."""
+        with self._lock:
+            lock, users = self._fetch_locks.get(key, (None, 0))
+            lock = lock or threading.Lock()
+            self._fetch_locks[key] = (lock, users + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._lock:
+                lock, users = self._fetch_locks[key]
+                if users == 1:
+                    del self._fetch_locks[key]
+                else:
+                    self._fetch_locks[key] = (lock, users - 1)
+
+    def get(self, key):
+        """
+        Returns the cache entry and blob path of an object, fetching it from
+        upstream on a miss or when its ETag changed upstream. The blob may be
+        evicted once it returns, open() it to read it.
+        """
+        entry, f = self.open(key)
+        f.close()
+        return entry, f.name
+
+    def open(self, key):
+        """
+        Returns the cache entry of an object and its blob opened for reading,
+        fetching it from upstream on a miss or when its ETag changed upstream.
+        The open file stays readable when the blob is evicted meanwhile.
+        """
+        self.check_bucket(key.split("/", 1)[0])
+        with self._fetch_lock(key):
+            with self._lock:
+                entry = self.objects.get(key)
+            if entry and time.time() - entry["validated"] > self.revalidate_after:
+                try:
+                    with self.upstream.request("HEAD", f"/{key}") as r:
+                        etag = r.headers.get("ETag")
+                except urllib.error.HTTPError:
+                    etag = None
+                except urllib.error.URLError:
+                    # serve the cached copy while upstream is unreachable
+                    etag = entry["etag"]
+                if etag == entry["etag"]:
+                    entry["validated"] = time.time()
+                else:
+                    self._remove_object(key)
+                    entry = None
+            if entry is not None:
+                with self._lock:
+                    f = self._open_blob(entry["sha256"])
+                    if f is not None:
+                        self.stats["hits"] += 1
+                        return entry, f
+                # evicted by the fetch of another object meanwhile
+            return self._fetch(key)
+
+    def _open_blob(self, sha256):
+        """Opens a blob, if still cached, as most recently used. Holds _lock."""
+        if sha256 not in self.blobs:
+            return None
+        self.blobs.move_to_end(sha256)
+        return open(os.path.join(self.blobs_dir, sha256), "rb")
+
+    def _fetch(self, key):
+        with self._lock:
+            self.stats["misses"] += 1
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".fetch-")
+        try:
+            with os.fdopen(fd, "wb") as f, self.upstream.request("GET", f"/{key}") as r:
+                etag = r.headers.get("ETag")
+                while chunk := r.read(1 << 20):
+                    digest.update(chunk)
+                    f.write(chunk)
+            size = os.path.getsize(tmp_path)
+            sha256 = digest.hexdigest()
+            blob_path = os.path.join(self.blobs_dir, sha256)
+            with self._lock:
+                self.stats["upstream_bytes"] += size
+                if sha256 in self.blobs:
+                    self.stats["deduplicated"] += 1
+                else:
+                    os.chmod(tmp_path, 0o444)
+                    os.replace(tmp_path, blob_path)
+                    self.blobs[sha256] = size
+                object_path = self._object_path(key)
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                if os.path.exists(object_path):
+                    os.remove(object_path)
+                os.link(blob_path, object_path)
+                entry = {
+                    "etag": etag,
+                    "sha256": sha256,
+                    "size": size,
+                    "validated": time.time(),
+                }
+                self.objects[key] = entry
+                evicted = self._evict(keep=sha256)
+                f = self._open_blob(sha256)
+            self._delete(evicted)
+            self._save_index()
+            return entry, f
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def served(self, size):
+        """Counts size bytes served to a client."""
+        with self._lock:
+            self.stats["served_bytes"] += size
+
+    def _remove_object(self, key):
+        with self._lock:
+            entry = self.objects.pop(key, None)
+            if entry is None:
+                return
+            self._unlink_object(key)
+            removed = []
+            if not any(e["sha256"] == entry["sha256"] for e in self.objects.values()):
+                removed.append(self._remove_blob(entry["sha256"]))
+        self._delete(removed)
+        self._save_index()
+
+    def _unlink_object(self, key):
+        try:
+            os.remove(self._object_path(key))
+        except OSError:
+            pass
+
+    def _remove_blob(self, sha256):
+        """
+        Drops a blob, moving it aside to be deleted with _delete() once _lock
+        is released, as freeing a large file can take a while. Holds _lock.
+        """
+        self.blobs.pop(sha256, None)
+        removed = os.path.join(self.cache_dir, f".evicted-{uuid.uuid4().hex}")
+        try:
+            os.rename(os.path.join(self.blobs_dir, sha256), removed)
+        except OSError:
+            return None
+        return removed
+
+    def _delete(self, paths):
+        """Deletes the blobs moved aside by _remove_blob()."""
+        for path in paths:
+            if path is None:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _evict(self, keep):
+        """
+        Evict least recently used blobs until the cache fits its budget,
+        returning them to be deleted with _delete(). Holds _lock.
+        """
+        removed = []
+        size = self.size
+        for sha256 in list(self.blobs):
+            if size <= self.size_budget:
+                break
+            if sha256 == keep:
+                continue
+            size -= self.blobs[sha256]
+            for key in [k for k, e in self.objects.items() if e["sha256"] == sha256]:
+                del self.objects[key]
+                self._unlink_object(key)
+            removed.append(self._remove_blob(sha256))
+            self.stats["evictions"] += 1
+        return removed
+
+    def prefetch(self, uri):
+        """Warm the cache with an s3://bucket/key or s3://bucket/prefix/ URI."""
+        parsed = urllib.parse.urlsplit(uri)
+        bucket, path = parsed.netloc, parsed.path.lstrip("/")
+        self.check_bucket(bucket)
+        if not path or path.endswith("/") or "*" in path:
+            prefix = path.split("*", 1)[0]
+            pattern = re.compile(
+                "^" + ".*".join(re.escape(part) for part in path.split("*")) + "$"
+            )
+            keys = [
+                k
+                for k in self.upstream.list_keys(bucket, prefix)
+                if "*" not in path or pattern.match(k)
+            ]
+        else:
+            keys = [path]
+        for key in keys:
+            self.get(f"{bucket}/{key}")
+        return len(keys)
+
+    def metrics(self):
+        lines = []
+        with self._lock:
+            counters = dict(self.stats)
+            gauges = {
+                "size_bytes": self.size,
+                "budget_bytes": self.size_budget,
+                "objects": len(self.objects),
+                "blobs": len(self.blobs),
+            }
+        for name, value in counters.items():
+            lines.append(f"# TYPE dataset_cache_{name}_total counter")
+            lines.append(f"dataset_cache_{name}_total {value}")
+        for name, value in gauges.items():
+            lines.append(f"# TYPE dataset_cache_{name} gauge")
+            lines.append(f"dataset_cache_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class CacheHandler(BaseHTTPRequestHandler):
+    """Serves the S3 GET/HEAD subset that dataset readers need."""
+
+    protocol_version = "HTTP/1.1"
+    cache = None
+    prefetcher = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_text(self, status, message):
+        body = message.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_upstream_error(self, e):
+        # unreachable, e.g. restarting, or timed out
+        reason = getattr(e, "reason", e)
+        if isinstance(reason, TimeoutError):
+            return self._send_text(504, f"The object store timed out: {reason}")
+        self._send_text(502, f"The object store is unavailable: {reason}")
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head=False):
+        url = urllib.parse.urlsplit(self.path)
+        path = urllib.parse.unquote(url.path).lstrip("/")
+        if path == "metrics":
+            body = self.cache.metrics().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if path == "health":
+            return self._send_text(200, "ok")
+        if "/" not in path.strip("/"):
+            # bucket level requests, e.g. ListObjectsV2, are passed through
+            return self._proxy(path, url.query, head)
+
+        try:
+            entry, f = self.cache.open(path)
+        except urllib.error.HTTPError as e:
+            return self._send_text(e.code, e.reason)
+        except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+            return self._send_upstream_error(e)
+        except PermissionError as e:
+            return self._send_text(403, str(e))
+        except ValueError as e:
+            return self._send_text(400, str(e))
+        with f:
+            self._send_blob(entry, f, head)
+
+    def _send_blob(self, entry, f, head):
+        start, end = 0, entry["size"] - 1
+        status = 200
+        range_header = self.headers.get("Range")
+        match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header or "")
+        # bytes=- is no range, and the header is ignored as invalid
+        if match and (match[1] or match[2]) and entry["size"]:
+            if match[1]:
+                start = int(match[1])
+                end = min(int(match[2]), end) if match[2] else end
+            else:
+                start = max(entry["size"] - int(match[2]), 0)
+            if start > end:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{entry['size']}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+
+        self.send_response(status)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Accept-Ranges", "bytes")
+        if entry["etag"]:
+            self.send_header("ETag", entry["etag"])
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{entry['size']}")
+        self.end_headers()
+        if head:
+            return
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(remaining, 1 << 20))
+            if not chunk:
+                break
+            self.wfile.write(chunk)
+            remaining -= len(chunk)
+        self.cache.served(end - start + 1)
+
+    def _proxy(self, path, query, head):
+        try:
+            self.cache.check_bucket(path.strip("/"))
+        except PermissionError as e:
+            return self._send_text(403, str(e))
+        try:
+            with self.cache.upstream.request(
+                "HEAD" if head else "GET", f"/{path}", query
+            ) as r:
+                body = r.read()
+                status = r.status
+                content_type = r.headers.get("Content-Type", "application/xml")
+        except urllib.error.HTTPError as e:
+            body, status = e.read(), e.code
+            content_type = e.headers.get("Content-Type", "application/xml")
+        except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+            return self._send_upstream_error(e)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def do_POST(self):
+        """POST /_prefetch with {"uris": ["s3://bucket/prefix/", ...]}"""
+        if urllib.parse.urlsplit(self.path).path != "/_prefetch":
+            return self._send_text(405, "The dataset cache is read-only")
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            uris = json.loads(self.rfile.read(length))["uris"]
+        except (ValueError, KeyError, TypeError):
+            return self._send_text(400, 'Expected {"uris": [...]}')
+        for uri in uris:
+            self.prefetcher.submit(uri)
+        self._send_text(202, f"Prefetching {len(uris)} URIs")
+
+    def do_PUT(self):
+        self._send_text(405, "The dataset cache is read-only")
+
+    do_DELETE = do_PUT
+
+
+class Prefetcher:
+    """Prefetches URIs in the background, once per URI."""
+
+    def __init__(self, cache, workers=4):
+        self.cache = cache
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.seen = set()
+
+    def submit(self, uri):
+        uri = uri.strip()
+        if not uri or uri in self.seen:
+            return
+        self.seen.add(uri)
+        self.executor.submit(self._prefetch, uri)
+
+    def _prefetch(self, uri):
+        start = time.perf_counter()
+        try:
+            count = self.cache.prefetch(uri)
+        except Exception as e:
+            self.seen.discard(uri)
+            print(f"Prefetching {uri} failed: {e}", file=sys.stderr)
+        else:
+            print(
+                f"Prefetched {count} objects of {uri} in {time.perf_counter() - start:.1f}s"
+            )
+
+    def watch_pods(self, node_name, interval):
+        """
+        Prefetch the URIs listed in the dataset-cache.microplat.io/prefetch
+        annotation of pods scheduled to this node, e.g. set on the pod template
+        of a training job, while the pod's images are still being pulled.
+        """
+        token_path = "/var/run/secrets/kubernetes.io/serviceaccount/token"
+        ca_path = "/var/run/secrets/kubernetes.io/serviceaccount/ca.crt"
+        api = "https://{}:{}".format(
+            os.environ["KUBERNETES_SERVICE_HOST"], os.environ["KUBERNETES_SERVICE_PORT"]
+        )
+        context = ssl.create_default_context(cafile=ca_path)
+        query = urllib.parse.urlencode({"fieldSelector": f"spec.nodeName={node_name}"})
+        while True:
+            try:
+                with open(token_path) as f:
+                    token = f.read().strip()
+                request = urllib.request.Request(
+                    f"{api}/api/v1/pods?{query}",
+                    headers={"Authorization": f"Bearer {token}"},
+                )
+                with urllib.request.urlopen(request, context=context, timeout=30) as r:
+                    pods = json.load(r)["items"]
+                for pod in pods:
+                    annotations = pod["metadata"].get("annotations") or {}
+                    for uri in re.split(
+                        r"[\s,]+", annotations.get(PREFETCH_ANNOTATION, "")
+                    ):
+                        self.submit(uri)
+            except Exception as e:
+                print(f"Listing pods on {node_name} failed: {e}", file=sys.stderr)
+            time.sleep(interval)
+
+
+def main():
+    os.umask(0o022)
+    cache = DatasetCache(
+        cache_dir=os.environ.get("CACHE_DIR", "/cache"),
+        size_budget=parse_quantity(os.environ.get("CACHE_SIZE", "50Gi")),
+        upstream=Upstream(
+            os.environ["UPSTREAM_ENDPOINT"],
+            os.environ.get("AWS_ACCESS_KEY_ID"),
+            os.environ.get("AWS_SECRET_ACCESS_KEY"),
+            os.environ.get("AWS_REGION", "us-east-1"),
+        ),
+        revalidate_after=int(os.environ.get("REVALIDATE_AFTER", "300")),
+        buckets=[b for b in os.environ.get("CACHE_BUCKETS", "").split(",") if b],
+    )
+    prefetcher = Prefetcher(cache, int(os.environ.get("PREFETCH_WORKERS", "4")))
+    node_name = os.environ.get("NODE_NAME")
+    if node_name and os.environ.get("PREFETCH_WATCH_PODS", "true") == "true":
+        threading.Thread(
+            target=prefetcher.watch_pods,
+            args=(node_name, int(os.environ.get("PREFETCH_INTERVAL", "15"))),
+            daemon=True,
+        ).start()
+
+    CacheHandler.cache = cache
+    CacheHandler.prefetcher = prefetcher
+    server = ThreadingHTTPServer(
+        ("", int(os.environ.get("PORT", "9000"))), CacheHandler
+    )
+    print(
+        f"Serving dataset cache of {cache.size}/{cache.size_budget} bytes "
+        f"on port {server.server_port}"
+    )
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
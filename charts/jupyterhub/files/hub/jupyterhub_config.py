@@ -5,6 +5,7 @@ import glob
 import os
 import re
 import sys
+import time
 
 from jupyterhub.utils import url_path_join
 from kubernetes_asyncio import client
@@ -15,10 +16,23 @@ configuration_directory = os.path.dirname(os.path.realpath(__file__))
 sys.path.insert(0, configuration_directory)
 
 from z2jh import (
+    RAY_CLUSTER_LABEL,
+    compile_config_snippet,
     get_config,
+    get_db_activity_write_rate,
+    get_db_backend,
+    get_db_kwargs,
+    get_db_sustainable_write_rate,
     get_name,
     get_name_env,
+    get_profile,
+    get_ray_cluster_env,
+    get_ray_cluster_manifest,
+    get_ray_cluster_name,
+    get_ray_cluster_network_policies,
     get_secret_value,
+    prune_config_snippet_cache,
+    register_sqlite_pragmas,
     set_config_if_not_none,
 )
 
@@ -76,6 +90,49 @@ if db_password is not None:
     else:
         print(f"Warning: hub.db.password is ignored for hub.db.type={db_type}")
 
+# tune the hub db connection, either with PRAGMAs for SQLite or with connection
+# pool settings for pooled server databases
+db_backend = get_db_backend(db_type, c.JupyterHub.get("db_url"))
+db_performance = get_config("hub.db.performance") or {}
+if db_performance.get("enabled"):
+    if db_backend == "sqlite":
+        pragmas = register_sqlite_pragmas(db_performance.get("sqlite") or {})
+        print(f"Applying hub db PRAGMAs: {', '.join(pragmas)}")
+    else:
+        db_kwargs = get_db_kwargs(
+            db_backend, c.JupyterHub.get("db_url"), db_performance
+        )
+        c.JupyterHub.db_kwargs.update(db_kwargs)
+
+# warn at startup if the activity updates of the expected number of running
+# servers are more than the hub db backend can sustain, as the hub then
+# serializes on the db
+write_rate_check = db_performance.get("writeRateCheck") or {}
+expected_active_servers = write_rate_check.get("expectedActiveServers") or get_config(
+    "hub.activeServerLimit"
+)
+if write_rate_check.get("enabled", True) and expected_active_servers:
+    activity_interval = get_config("singleuser.extraEnv", {}).get(
+        "JUPYTERHUB_ACTIVITY_INTERVAL", 300
+    )
+    if isinstance(activity_interval, dict):
+        activity_interval = activity_interval.get("value", 300)
+    write_rate = get_db_activity_write_rate(
+        expected_active_servers,
+        c.JupyterHub.last_activity_interval,
+        int(activity_interval),
+    )
+    sustainable_write_rate = get_db_sustainable_write_rate(
+        db_type, db_backend, db_performance
+    )
+    if write_rate > sustainable_write_rate:
+        print(
+            f"Warning: {expected_active_servers} active servers make about "
+            f"{write_rate:.1f} activity writes/s, more than the "
+            f"~{sustainable_write_rate:.0f} writes/s hub.db.type={db_type} can "
+            "sustain. Consider tuning hub.db.performance or a postgres hub db."
+        )
+
 
 # c.JupyterHub configuration from Helm chart's configmap
 for trait, cfg_key in (
@@ -342,6 +399,141 @@ c.KubeSpawner.volume_mounts.extend(
     get_config("singleuser.storage.extraVolumeMounts", [])
 )
 
+# Opt in to the node-local dataset cache of charts/dataset-cache, reachable as
+# an S3 endpoint and, through its hostPath, as read-only files of the objects
+# cached on the node
+dataset_cache = get_config("singleuser.datasetCache", {})
+if dataset_cache.get("enabled"):
+    c.KubeSpawner.environment.update(
+        {"DATASET_CACHE_ENDPOINT": dataset_cache["endpoint"]}
+    )
+    if dataset_cache.get("hostPath"):
+        c.KubeSpawner.volumes.append(
+            {
+                "name": "dataset-cache",
+                "hostPath": {
+                    "path": dataset_cache["hostPath"],
+                    "type": "DirectoryOrCreate",
+                },
+            }
+        )
+        c.KubeSpawner.volume_mounts.append(
+            {
+                "name": "dataset-cache",
+                "mountPath": dataset_cache["mountPath"],
+                "subPath": "objects",
+                "readOnly": True,
+            }
+        )
+
+# Point the OpenTelemetry SDK of user servers, and of their RayClusters, at
+# the tracing collector of charts/kube-prometheus-stack
+tracing = get_config("singleuser.tracing", {})
+tracing_env = {}
+if tracing.get("enabled"):
+    tracing_env["OTEL_EXPORTER_OTLP_ENDPOINT"] = tracing["endpoint"]
+    c.KubeSpawner.environment.update(
+        {
+            **tracing_env,
+            "OTEL_SERVICE_NAME": tracing.get("serviceName") or "notebook",
+        }
+    )
+
+# Give each user server its own RayCluster, created before the server pod is
+# and sized by the picked profile's ray_cluster entry. Its idle workers scale
+# down to zero and it is deleted as the server stops, also when culled.
+ray_cluster = get_config("singleuser.rayCluster", {})
+if ray_cluster.get("enabled"):
+
+    def create_user_ray_cluster(spawner):
+        from kubespawner.clients import shared_client
+
+        name = get_ray_cluster_name(spawner.pod_name)
+        profile = get_profile(
+            get_config("singleuser.profileList"),
+            (spawner.user_options or {}).get("profile"),
+        )
+        manifest = get_ray_cluster_manifest(
+            name,
+            spawner.namespace,
+            ray_cluster,
+            profile,
+            labels={
+                **common_labels,
+                "component": "singleuser-ray-cluster",
+                "hub.jupyter.org/server-pod": spawner.pod_name,
+            },
+            env=(
+                {
+                    **tracing_env,
+                    "OTEL_RESOURCE_ATTRIBUTES": f"ray.cluster={name}",
+                }
+                if tracing_env
+                else None
+            ),
+        )
+        spawner.environment = {
+            **spawner.environment,
+            **get_ray_cluster_env(name, spawner.namespace),
+        }
+        # only this server may reach the cluster's head, see
+        # get_ray_cluster_network_policies
+        spawner.extra_labels = {**spawner.extra_labels, RAY_CLUSTER_LABEL: name}
+
+        async def apply():
+            api = shared_client("CustomObjectsApi")
+            try:
+                owner = await api.create_namespaced_custom_object(
+                    "ray.io", "v1", spawner.namespace, "rayclusters", manifest
+                )
+            except client.ApiException as e:
+                if e.status != 409:
+                    raise
+                # left behind by a hub that went away before the server stopped
+                owner = await api.patch_namespaced_custom_object(
+                    "ray.io",
+                    "v1",
+                    spawner.namespace,
+                    "rayclusters",
+                    name,
+                    {"spec": manifest["spec"]},
+                )
+            networking = shared_client("NetworkingV1Api")
+            for policy in get_ray_cluster_network_policies(
+                name, spawner.namespace, owner, common_labels
+            ):
+                try:
+                    await networking.create_namespaced_network_policy(
+                        spawner.namespace, policy
+                    )
+                except client.ApiException as e:
+                    if e.status != 409:
+                        raise
+                    await networking.patch_namespaced_network_policy(
+                        policy["metadata"]["name"], spawner.namespace, policy
+                    )
+            spawner.log.info(f"Created RayCluster {name} for {spawner.pod_name}")
+
+        return apply()
+
+    async def delete_user_ray_cluster(spawner):
+        from kubespawner.clients import shared_client
+
+        name = get_ray_cluster_name(spawner.pod_name)
+        api = shared_client("CustomObjectsApi")
+        try:
+            await api.delete_namespaced_custom_object(
+                "ray.io", "v1", spawner.namespace, "rayclusters", name
+            )
+        except client.ApiException as e:
+            if e.status != 404:
+                raise
+        else:
+            spawner.log.info(f"Deleted RayCluster {name} of {spawner.pod_name}")
+
+    c.KubeSpawner.pre_spawn_hook = create_user_ray_cluster
+    c.KubeSpawner.post_stop_hook = delete_user_ray_cluster
+
 c.JupyterHub.services = []
 c.JupyterHub.load_roles = []
 
@@ -489,18 +681,51 @@ for app, cfg in get_config("hub.config", {}).items():
         cfg.pop("keys", None)
     c[app].update(cfg)
 
+# compile config snippets once into a bytecode cache keyed by their content,
+# stored on the hub db's PVC unless hub.configCache.path says otherwise
+config_cache = get_config("hub.configCache") or {}
+config_cache_dir = None
+if config_cache.get("enabled"):
+    config_cache_dir = config_cache.get("path")
+    if not config_cache_dir and db_type == "sqlite-pvc":
+        config_cache_dir = "/srv/jupyterhub/config-cache"
+lazy_imports = config_cache.get("lazyImports") or []
+snippet_load_times = {}
+
 # load /usr/local/etc/jupyterhub/jupyterhub_config.d config files
 config_dir = "/usr/local/etc/jupyterhub/jupyterhub_config.d"
 if os.path.isdir(config_dir):
     for file_path in sorted(glob.glob(f"{config_dir}/*.py")):
         file_name = os.path.basename(file_path)
         print(f"Loading {config_dir} config: {file_name}")
+        start = time.perf_counter()
         with open(file_path) as f:
             file_content = f.read()
         # compiling makes debugging easier: https://stackoverflow.com/a/437857
-        exec(compile(source=file_content, filename=file_name, mode="exec"))
+        exec(
+            compile_config_snippet(
+                file_content, file_name, config_cache_dir, lazy_imports
+            )
+        )
+        snippet_load_times[file_name] = time.perf_counter() - start
 
 # execute hub.extraConfig entries
 for key, config_py in sorted(get_config("hub.extraConfig", {}).items()):
     print(f"Loading extra config: {key}")
-    exec(config_py)
+    start = time.perf_counter()
+    exec(
+        compile_config_snippet(
+            config_py, f"extraConfig.{key}", config_cache_dir, lazy_imports
+        )
+    )
+    snippet_load_times[f"extraConfig.{key}"] = time.perf_counter() - start
+
+prune_config_snippet_cache(config_cache_dir)
+slow_snippet_threshold = config_cache.get("slowSnippetThreshold")
+for name, load_time in sorted(
+    snippet_load_times.items(), key=lambda item: item[1], reverse=True
+):
+    if slow_snippet_threshold is not None and load_time >= slow_snippet_threshold:
+        print(f"Warning: config snippet {name} took {load_time:.3f}s to load")
+    else:
+        print(f"Config snippet {name} loaded in {load_time:.3f}s")
@@ -4,7 +4,12 @@ Utility methods for use in jupyterhub_config.py and dynamic subconfigs.
 Methods here can be imported by extraConfig in values.yaml
 """
 
+import ast
+import hashlib
+import importlib.util
+import marshal
 import os
+import sys
 from collections.abc import Mapping
 from functools import lru_cache
 
@@ -120,3 +125,498 @@ def set_config_if_not_none(cparent, name, key):
     data = get_config(key)
     if data is not None:
         setattr(cparent, name, data)
+
+
+# Rough sustained commit rates (writes per second) for each hub db backend,
+# used by get_db_sustainable_write_rate for the hub's write rate check unless
+# hub.db.performance.writeRateCheck.sustainableWriteRate is set. The sqlite
+# figures assume PVC backed block storage where every commit pays for an fsync,
+# while pooled server databases are assumed to scale with the connection pool.
+_DB_SUSTAINABLE_WRITE_RATES = {
+    "sqlite-memory": 2000,
+    "sqlite": 50,
+    "sqlite-wal": 400,
+    "server-per-connection": 100,
+}
+
+
+def get_db_backend(db_type, db_url=None):
+    """
+    Returns "sqlite", "postgres", "mysql" or "other" for a hub.db.type, using
+    the db_url to resolve the backend of hub.db.type=other
+    """
+    if db_type in ("sqlite-pvc", "sqlite-memory"):
+        return "sqlite"
+    if db_type in ("postgres", "mysql"):
+        return db_type
+    db_url = db_url or ""
+    for backend in ("sqlite", "postgres", "mysql"):
+        if db_url.startswith(backend):
+            return backend
+    return "other"
+
+
+def get_db_kwargs(backend, db_url, performance):
+    """
+    Translate hub.db.performance into the sqlalchemy.create_engine kwargs passed
+    through JupyterHub.db_kwargs for pooled server databases. SQLite is tuned
+    with PRAGMAs instead, see register_sqlite_pragmas.
+    """
+    if backend not in ("postgres", "mysql"):
+        return {}
+
+    db_kwargs = {}
+    pool = performance.get("pool") or {}
+    for kwarg, cfg_key in (
+        ("pool_size", "size"),
+        ("max_overflow", "maxOverflow"),
+        ("pool_timeout", "timeout"),
+        ("pool_recycle", "recycle"),
+        ("pool_pre_ping", "prePing"),
+    ):
+        if pool.get(cfg_key) is not None:
+            db_kwargs[kwarg] = pool[cfg_key]
+
+    connect_args = {}
+    statement_timeout = performance.get("statementTimeout")
+    if statement_timeout:
+        if backend == "postgres":
+            connect_args["options"] = f"-c statement_timeout={statement_timeout}"
+        else:
+            connect_args["init_command"] = (
+                f"SET SESSION max_execution_time={statement_timeout}"
+            )
+
+    prepared_statements = performance.get("preparedStatements")
+    if prepared_statements is not None:
+        if backend == "postgres" and "+psycopg:" in (db_url or ""):
+            # psycopg 3 prepares a query server side once it has been executed
+            # prepare_threshold times, None disables it (e.g. behind pgbouncer)
+            connect_args["prepare_threshold"] = 1 if prepared_statements else None
+        else:
+            print(
+                "Warning: hub.db.performance.preparedStatements is only "
+                "supported for postgres with the postgresql+psycopg driver"
+            )
+
+    connect_args.update(performance.get("connectArgs") or {})
+    if connect_args:
+        db_kwargs["connect_args"] = connect_args
+    return db_kwargs
+
+
+# PRAGMAs applied by _set_sqlite_pragmas, see register_sqlite_pragmas
+_sqlite_pragmas = []
+
+
+def _set_sqlite_pragmas(dbapi_con, con_record):
+    import sqlite3
+
+    if not isinstance(dbapi_con, sqlite3.Connection):
+        return
+    cursor = dbapi_con.cursor()
+    for pragma in _sqlite_pragmas:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def register_sqlite_pragmas(sqlite):
+    """
+    Register a listener applying hub.db.performance.sqlite as PRAGMAs to every
+    new SQLite connection made by the hub. The listener is registered once, so
+    calling this again replaces the PRAGMAs instead of adding another one.
+    """
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    pragmas = []
+    for pragma, cfg_key in (
+        ("journal_mode", "journalMode"),
+        ("synchronous", "synchronous"),
+        ("busy_timeout", "busyTimeout"),
+        ("cache_size", "cacheSize"),
+        ("mmap_size", "mmapSize"),
+    ):
+        if sqlite.get(cfg_key) is not None:
+            pragmas.append(f"PRAGMA {pragma}={sqlite[cfg_key]}")
+
+    _sqlite_pragmas[:] = pragmas
+    if not event.contains(Engine, "connect", _set_sqlite_pragmas):
+        event.listen(Engine, "connect", _set_sqlite_pragmas)
+    return pragmas
+
+
+def get_db_sustainable_write_rate(db_type, backend, performance):
+    """
+    Returns the estimated writes per second the configured hub db backend can
+    sustain, see _DB_SUSTAINABLE_WRITE_RATES.
+    """
+    check = performance.get("writeRateCheck") or {}
+    if check.get("sustainableWriteRate"):
+        return float(check["sustainableWriteRate"])
+    if db_type == "sqlite-memory":
+        return _DB_SUSTAINABLE_WRITE_RATES["sqlite-memory"]
+    if backend == "sqlite":
+        journal_mode = str((performance.get("sqlite") or {}).get("journalMode", ""))
+        if performance.get("enabled") and journal_mode.lower() == "wal":
+            return _DB_SUSTAINABLE_WRITE_RATES["sqlite-wal"]
+        return _DB_SUSTAINABLE_WRITE_RATES["sqlite"]
+    pool = {}
+    if performance.get("enabled"):
+        pool = performance.get("pool") or {}
+    connections = (pool.get("size") or 5) + (pool.get("maxOverflow") or 10)
+    return connections * _DB_SUSTAINABLE_WRITE_RATES["server-per-connection"]
+
+
+def get_db_activity_write_rate(
+    active_servers, last_activity_interval, activity_interval
+):
+    """
+    Returns the estimated activity-update writes per second the hub makes for a
+    number of running servers. Each server reports its activity every
+    activity_interval seconds (JUPYTERHUB_ACTIVITY_INTERVAL), and the hub also
+    records the proxy's view of each route every last_activity_interval seconds.
+    """
+    rate = 0.0
+    for interval in (last_activity_interval, activity_interval):
+        if interval:
+            rate += active_servers / interval
+    return rate
+
+
+# the subdirectory of hub.configCache.path the bytecode is cached in, so that
+# pruning it leaves whatever else is stored under that path alone
+CONFIG_SNIPPET_CACHE_SUBDIR = "config-snippets"
+# bytecode cache files used by this hub start, see prune_config_snippet_cache
+_used_config_snippet_cache = set()
+
+
+def lazy_import(name):
+    """
+    Returns a module that is only executed on first attribute access, so that
+    a module imported by a config snippet but only used later, e.g. from a
+    spawner hook, doesn't slow down the hub startup.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.loader is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    parent, _, child = name.rpartition(".")
+    if parent:
+        # like the import system, make a submodule an attribute of its package
+        setattr(sys.modules[parent], child, module)
+    return module
+
+
+class _LazyImportTransformer(ast.NodeTransformer):
+    """
+    Rewrites `import x` and `import x as y` statements of the given modules
+    into `x = lazy_import("x")` assignments. An import statement would execute
+    a lazily loaded module right away, so they can't be left as is.
+
+    `import x.y` binds the package x, so only the submodule x.y is deferred
+    and x itself is imported right away.
+    """
+
+    def __init__(self, lazy_imports):
+        self.lazy_imports = set(lazy_imports)
+
+    def visit_Import(self, node):
+        nodes = []
+        eager_names = []
+        for alias in node.names:
+            if alias.name not in self.lazy_imports:
+                eager_names.append(alias)
+                continue
+            call = ast.parse(
+                f"__import__('z2jh').lazy_import({alias.name!r})", mode="eval"
+            ).body
+            if alias.asname is None and "." in alias.name:
+                top_level = alias.name.partition(".")[0]
+                nodes.append(ast.copy_location(ast.Expr(call), node))
+                call = ast.parse(f"__import__({top_level!r})", mode="eval").body
+                target = ast.Name(id=top_level, ctx=ast.Store())
+            else:
+                target = ast.Name(id=alias.asname or alias.name, ctx=ast.Store())
+            nodes.append(ast.copy_location(ast.Assign([target], call), node))
+        if eager_names:
+            node.names = eager_names
+            nodes.insert(0, node)
+        return nodes
+
+
+def compile_config_snippet(source, filename, cache_dir=None, lazy_imports=()):
+    """
+    Compile a jupyterhub_config.d file or hub.extraConfig entry, reusing the
+    bytecode cached in the config-snippets subdirectory of cache_dir under a
+    hash of the snippet's content. Imports of modules in lazy_imports are deferred, see lazy_import.
+    """
+    lazy_imports = sorted(lazy_imports)
+    path = None
+    if cache_dir:
+        key = hashlib.sha256(
+            "\0".join([filename, *lazy_imports, source]).encode()
+            + importlib.util.MAGIC_NUMBER
+        ).hexdigest()
+        cache_dir = os.path.join(cache_dir, CONFIG_SNIPPET_CACHE_SUBDIR)
+        path = os.path.join(cache_dir, f"{key}.pyc")
+        _used_config_snippet_cache.add(path)
+        try:
+            with open(path, "rb") as f:
+                return marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+
+    tree = ast.parse(source, filename)
+    if lazy_imports:
+        tree = ast.fix_missing_locations(
+            _LazyImportTransformer(lazy_imports).visit(tree)
+        )
+    code = compile(tree, filename, "exec")
+
+    if path:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                marshal.dump(code, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: could not cache the bytecode of {filename}: {e}")
+    return code
+
+
+def prune_config_snippet_cache(cache_dir):
+    """
+    Remove cached bytecode of snippets that were changed or removed since they
+    were cached, i.e. that wasn't used by compile_config_snippet this hub start.
+    Only .pyc files in the config-snippets subdirectory of cache_dir are removed.
+    """
+    if not cache_dir:
+        return
+    cache_dir = os.path.join(cache_dir, CONFIG_SNIPPET_CACHE_SUBDIR)
+    if not os.path.isdir(cache_dir):
+        return
+    for file_name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, file_name)
+        if file_name.endswith(".pyc") and path not in _used_config_snippet_cache:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def get_profile(profile_list, slug=None):
+    """
+    Returns the singleuser.profileList entry a user picked by its slug, or the
+    default entry, the same way KubeSpawner resolves profiles.
+    """
+    if not profile_list or callable(profile_list):
+        return None
+    for profile in profile_list:
+        if slug and profile.get("slug") == slug:
+            return profile
+    for profile in profile_list:
+        if profile.get("default"):
+            return profile
+    return profile_list[0]
+
+
+def get_ray_cluster_name(pod_name):
+    """
+    Returns the name of the RayCluster of a user server, short enough for the
+    <name>-head-svc Service KubeRay creates to be a valid DNS label.
+    """
+    name = f"{pod_name}-ray"
+    if len(name) > 50:
+        digest = hashlib.sha256(name.encode()).hexdigest()[:8]
+        name = f"{name[:41]}-{digest}"
+    return name
+
+
+def get_ray_cluster_env(name, namespace):
+    """
+    Returns the environment variables that connect a user server to its
+    RayCluster, ray.init() and the ray job CLI pick them up as is.
+    """
+    head = f"{name}-head-svc.{namespace}.svc.cluster.local"
+    return {
+        "RAY_CLUSTER_NAME": name,
+        "RAY_ADDRESS": f"ray://{head}:10001",
+        "RAY_API_SERVER_ADDRESS": f"http://{head}:8265",
+        "RAY_DASHBOARD_URL": f"http://{head}:8265",
+    }
+
+
+def get_ray_cluster_manifest(
+    name, namespace, ray_cluster, profile=None, labels=None, env=None
+):
+    """
+    Returns the RayCluster of a user server for singleuser.rayCluster. The head
+    and worker sizes of the profile's ray_cluster entry override the defaults,
+    and idle workers are removed by the in-tree autoscaler down to
+    worker.minReplicas, zero by default. env is set on the head and workers.
+    """
+    sizes = {
+        "head": ray_cluster.get("head") or {},
+        "worker": ray_cluster.get("worker") or {},
+    }
+    sizes = _merge_dictionaries(sizes, (profile or {}).get("ray_cluster") or {})
+    image = ray_cluster["image"]["name"]
+    if ray_cluster["image"].get("tag"):
+        image = f"{image}:{ray_cluster['image']['tag']}"
+    labels = labels or {}
+    annotations = {
+        "prometheus.io/scrape": "true",
+        "prometheus.io/port": "8080",
+        "prometheus.io/path": "/metrics",
+    }
+
+    def pod_template(node_type, container_name, size):
+        resources = {
+            "cpu": str(size.get("cpu", 1)),
+            "memory": str(size.get("memory", "2Gi")),
+        }
+        return {
+            "metadata": {
+                "labels": {
+                    **labels,
+                    "ray.io/node-type": node_type,
+                    "app.kubernetes.io/name": "ray-cluster",
+                    "app.kubernetes.io/component": node_type,
+                },
+                "annotations": annotations,
+            },
+            "spec": {
+                "containers": [
+                    {
+                        "name": container_name,
+                        "image": image,
+                        "ports": [
+                            {"containerPort": 8080, "name": "metrics"},
+                        ],
+                        "resources": {"requests": resources, "limits": resources},
+                        "env": [
+                            {"name": key, "value": value}
+                            for key, value in (env or {}).items()
+                        ],
+                    }
+                ],
+            },
+        }
+
+    worker = sizes["worker"]
+    return {
+        "apiVersion": "ray.io/v1",
+        "kind": "RayCluster",
+        "metadata": {"name": name, "namespace": namespace, "labels": labels},
+        "spec": {
+            "rayVersion": str(ray_cluster["rayVersion"]),
+            "enableInTreeAutoscaling": True,
+            "autoscalerOptions": {
+                "upscalingMode": "Default",
+                "idleTimeoutSeconds": ray_cluster.get("idleTimeoutSeconds", 60),
+            },
+            "headGroupSpec": {
+                "rayStartParams": {
+                    "dashboard-host": "0.0.0.0",
+                    "metrics-export-port": "8080",
+                    # keep tasks on the workers so they can scale to zero
+                    "num-cpus": "0",
+                },
+                "template": pod_template("head", "ray-head", sizes["head"]),
+            },
+            "workerGroupSpecs": [
+                {
+                    "groupName": "workers",
+                    "replicas": worker.get("minReplicas", 0),
+                    "minReplicas": worker.get("minReplicas", 0),
+                    "maxReplicas": worker.get("maxReplicas", 1),
+                    "rayStartParams": {"metrics-export-port": "8080"},
+                    "template": pod_template("worker", "ray-worker", worker),
+                }
+            ],
+        },
+    }
+
+
+# ports of the head a user server connects to: Ray client and the dashboard
+_RAY_CLIENT_PORTS = [{"port": 10001}, {"port": 8265}]
+# label of a user server pod with the name of its RayCluster
+RAY_CLUSTER_LABEL = "hub.jupyter.org/ray-cluster"
+
+
+def get_ray_cluster_network_policies(name, namespace, owner=None, labels=None):
+    """
+    Returns the NetworkPolicies that let only the user server labelled with
+    RAY_CLUSTER_LABEL: name reach the head of its RayCluster. Ray client and
+    the dashboard have no auth of their own, so the head admits the cluster's
+    own pods, metrics scrapes and that server only. owner, the RayCluster
+    object, has them deleted with it.
+    """
+    server = {"component": "singleuser-server", RAY_CLUSTER_LABEL: name}
+    head = {"ray.io/cluster": name, "ray.io/node-type": "head"}
+
+    def metadata(suffix):
+        return {
+            "name": f"{name}-{suffix}",
+            "namespace": namespace,
+            "labels": labels or {},
+            "ownerReferences": (
+                [
+                    {
+                        "apiVersion": owner["apiVersion"],
+                        "kind": owner["kind"],
+                        "name": owner["metadata"]["name"],
+                        "uid": owner["metadata"]["uid"],
+                    }
+                ]
+                if owner
+                else []
+            ),
+        }
+
+    return [
+        {
+            "apiVersion": "networking.k8s.io/v1",
+            "kind": "NetworkPolicy",
+            "metadata": metadata("head"),
+            "spec": {
+                "podSelector": {"matchLabels": head},
+                "policyTypes": ["Ingress"],
+                "ingress": [
+                    {
+                        "from": [
+                            {"podSelector": {"matchLabels": {"ray.io/cluster": name}}}
+                        ]
+                    },
+                    {
+                        "from": [{"podSelector": {"matchLabels": server}}],
+                        "ports": _RAY_CLIENT_PORTS,
+                    },
+                    {"from": [{"namespaceSelector": {}}], "ports": [{"port": 8080}]},
+                ],
+            },
+        },
+        {
+            "apiVersion": "networking.k8s.io/v1",
+            "kind": "NetworkPolicy",
+            "metadata": metadata("server"),
+            "spec": {
+                "podSelector": {"matchLabels": server},
+                "policyTypes": ["Egress"],
+                "egress": [
+                    {
+                        "to": [{"podSelector": {"matchLabels": head}}],
+                        "ports": _RAY_CLIENT_PORTS,
+                    },
+                ],
+            },
+        },
+    ]
@@ -0,0 +1,392 @@
+"""
+Caching query frontend for the Prometheus HTTP API.
+
+Runs in front of the Thanos query layer, as the Prometheus of Grafana and the
+Ray dashboard. Range queries are aligned to their step and split into chunks
+of a fixed number of steps, aligned to the epoch so that the same chunks recur
+across refreshes and viewers. Chunks that ended before the last samples could
+still change are immutable and cached until evicted, the recent ones for a few
+seconds only. Identical requests in flight, e.g. from many viewers of the same
+dashboard, are coalesced into a single upstream query. Other API requests are
+coalesced and cached for those few seconds, everything else is passed through.
+
+Only the Python standard library is used so the frontend runs on a stock
+python image with this file mounted from a ConfigMap.
+"""
+
+import datetime
+import json
+import os
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_QUANTITY_SUFFIXES = {
+    "Ki": 2**10,
+    "Mi": 2**20,
+    "Gi": 2**30,
+    "k": 10**3,
+    "M": 10**6,
+    "G": 10**9,
+}
+_DURATION_UNITS = {
+    "ms": 1,
+    "s": 1000,
+    "m": 60 * 1000,
+    "h": 60 * 60 * 1000,
+    "d": 24 * 60 * 60 * 1000,
+    "w": 7 * 24 * 60 * 60 * 1000,
+    "y": 365 * 24 * 60 * 60 * 1000,
+}
+
+
+def parse_quantity(quantity):
+    """Parse a k8s resource quantity like 512Mi into bytes."""
+    quantity = str(quantity).strip()
+    for suffix, factor in _QUANTITY_SUFFIXES.items():
+        if quantity.endswith(suffix):
+            return int(float(quantity[: -len(suffix)]) * factor)
+    return int(float(quantity))
+
+
+def parse_time(value):
+    """Parse a Prometheus API timestamp, in seconds or RFC 3339, into ms."""
+    try:
+        return round(float(value) * 1000)
+    except ValueError:
+        timestamp = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+        return round(timestamp.timestamp() * 1000)
+
+
+def parse_duration(value):
+    """Parse a Prometheus API duration, in seconds or like 1m30s, into ms."""
+    try:
+        return round(float(value) * 1000)
+    except ValueError:
+        parts = re.findall(r"(\d+)(ms|[smhdwy])", value)
+        if not parts or "".join(n + u for n, u in parts) != value:
+            raise ValueError(f"Invalid duration {value}")
+        return sum(int(n) * _DURATION_UNITS[u] for n, u in parts)
+
+
+class UpstreamError(Exception):
+    """An upstream response that is passed on to the client as it is."""
+
+    def __init__(self, status, content_type, body):
+        super().__init__(status)
+        self.status = status
+        self.content_type = content_type
+        self.body = body
+
+
+class QueryFrontend:
+    """
+    Splitting, caching and coalescing of queries to a Prometheus API.
+
+    Cached results are kept in least to most recently used order, and evicted
+    when their size grows past the size budget. Results with warnings, such as
+    the partial responses of the Thanos query while a shard is down, are not
+    cached.
+    """
+
+    def __init__(
+        self,
+        upstream,
+        size_budget,
+        points_per_chunk=60,
+        max_delay=600,
+        fresh_ttl=10,
+        workers=8,
+        clock=time.time,
+    ):
+        self.upstream = upstream.rstrip("/")
+        self.size_budget = size_budget
+        self.points_per_chunk = points_per_chunk
+        # samples may still arrive this many seconds late, e.g. a scrape or
+        # rule evaluation in progress, so only older chunks are immutable
+        self.max_delay = max_delay
+        self.fresh_ttl = fresh_ttl
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(workers)
+        # key -> Future of the upstream response
+        self._in_flight = {}
+        # key -> (expires or None, size, value), least to most recently used
+        self._cache = OrderedDict()
+        self._size = 0
+        self.stats = {
+            "requests": 0,
+            "range_requests": 0,
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "evictions": 0,
+            "upstream_requests": 0,
+            "upstream_errors": 0,
+        }
+
+    def _fetch(self, method, path, params):
+        """Returns the status, content type and body of an upstream request."""
+        with self._lock:
+            self.stats["upstream_requests"] += 1
+        encoded = urllib.parse.urlencode(params)
+        url = f"{self.upstream}{path}"
+        data = None
+        if method == "POST":
+            data = encoded.encode()
+        elif encoded:
+            url = f"{url}?{encoded}"
+        request = urllib.request.Request(url, data=data, method=method)
+        if data is not None:
+            request.add_header("Content-Type", "application/x-www-form-urlencoded")
+        try:
+            with urllib.request.urlopen(request, timeout=120) as r:
+                return (
+                    r.status,
+                    r.headers.get("Content-Type", "application/json"),
+                    r.read(),
+                )
+        except urllib.error.HTTPError as e:
+            with self._lock:
+                self.stats["upstream_errors"] += 1
+            return e.code, e.headers.get("Content-Type", "application/json"), e.read()
+        except OSError as e:
+            # unreachable, e.g. restarting, or timed out, as the API would say
+            with self._lock:
+                self.stats["upstream_errors"] += 1
+            reason = getattr(e, "reason", e)
+            if isinstance(reason, TimeoutError):
+                status, error_type = 504, "timeout"
+            else:
+                status, error_type = 502, "unavailable"
+            body = {
+                "status": "error",
+                "errorType": error_type,
+                "error": f"upstream {self.upstream}: {reason}",
+            }
+            return status, "application/json", json.dumps(body).encode()
+
+    def _cached(self, key, fetch, ttl, cacheable):
+        """
+        Returns the cached value of a key, or fetches it, coalesced with any
+        fetch of the same key in flight, and caches it for ttl seconds, or
+        until evicted if ttl is None, when cacheable(value) is true.
+        """
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry and (entry[0] is None or entry[0] > self.clock()):
+                self._cache.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[2]
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+                self.stats["misses"] += 1
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            value = fetch()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._in_flight[key]
+            if cacheable(value):
+                self._store(key, value, None if ttl is None else self.clock() + ttl)
+        future.set_result(value)
+        return value
+
+    def _store(self, key, value, expires):
+        size = len(key) + len(value[2] if isinstance(value, tuple) else value)
+        if size > self.size_budget:
+            return
+        if key in self._cache:
+            self._size -= self._cache.pop(key)[1]
+        self._cache[key] = (expires, size, value)
+        self._size += size
+        while self._size > self.size_budget:
+            _, (_, evicted, _) = self._cache.popitem(last=False)
+            self._size -= evicted
+            self.stats["evictions"] += 1
+
+    def request(self, method, path, params):
+        """Returns the status, content type and body of an API request."""
+        with self._lock:
+            self.stats["requests"] += 1
+        if path == "/api/v1/query_range":
+            try:
+                return self.range_query(params)
+            except UpstreamError as e:
+                return e.status, e.content_type, e.body
+            except (KeyError, ValueError):
+                # invalid parameters, left to upstream to explain
+                pass
+        if not path.startswith("/api/v1/"):
+            return self._fetch(method, path, params)
+        key = json.dumps([path, sorted(params)])
+        return self._cached(
+            key,
+            lambda: self._fetch(method, path, params),
+            self.fresh_ttl,
+            lambda response: response[0] == 200 and b'"warnings"' not in response[2],
+        )
+
+    def range_query(self, params):
+        """Returns the status, content type and body of a split range query."""
+        params = dict(params)
+        step = parse_duration(params.pop("step"))
+        if step <= 0:
+            raise ValueError("step must be positive")
+        start = parse_time(params.pop("start")) // step * step
+        end = parse_time(params.pop("end")) // step * step
+        if end < start:
+            raise ValueError("end is before start")
+        with self._lock:
+            self.stats["range_requests"] += 1
+
+        chunk = step * self.points_per_chunk
+        chunks = []
+        chunk_start = start // chunk * chunk
+        while chunk_start <= end:
+            chunks.append(
+                (max(start, chunk_start), min(end, chunk_start + chunk - step))
+            )
+            chunk_start += chunk
+        results = list(
+            self._pool.map(
+                lambda bounds: self._range_chunk(params, step, *bounds), chunks
+            )
+        )
+
+        series = OrderedDict()
+        warnings = []
+        for result in results:
+            for s in result["data"]["result"]:
+                key = json.dumps(s["metric"], sort_keys=True)
+                if key in series:
+                    series[key]["values"].extend(s["values"])
+                else:
+                    series[key] = {"metric": s["metric"], "values": list(s["values"])}
+            warnings.extend(w for w in result.get("warnings", []) if w not in warnings)
+        body = {
+            "status": "success",
+            "data": {"resultType": "matrix", "result": list(series.values())},
+        }
+        if warnings:
+            body["warnings"] = warnings
+        return 200, "application/json", json.dumps(body).encode()
+
+    def _range_chunk(self, params, step, start, end):
+        """Returns the parsed response of the range query of one chunk."""
+        key = json.dumps(["query_range", sorted(params.items()), step, start, end])
+        chunk_params = dict(
+            params, start=f"{start / 1000:.3f}", end=f"{end / 1000:.3f}"
+        )
+        chunk_params["step"] = f"{step / 1000:.3f}"
+
+        def fetch():
+            status, content_type, body = self._fetch(
+                "POST", "/api/v1/query_range", chunk_params
+            )
+            if status != 200:
+                raise UpstreamError(status, content_type, body)
+            return body
+
+        immutable = end <= (self.clock() - self.max_delay) * 1000
+        body = self._cached(
+            key,
+            fetch,
+            None if immutable else self.fresh_ttl,
+            lambda body: b'"warnings"' not in body,
+        )
+        return json.loads(body)
+
+    def metrics(self):
+        lines = []
+        with self._lock:
+            stats = dict(self.stats)
+            gauges = {
+                "cache_size_bytes": self._size,
+                "cache_budget_bytes": self.size_budget,
+                "cache_entries": len(self._cache),
+                "in_flight": len(self._in_flight),
+            }
+        for name, value in stats.items():
+            lines.append(f"# TYPE query_frontend_{name}_total counter")
+            lines.append(f"query_frontend_{name}_total {value}")
+        for name, value in gauges.items():
+            lines.append(f"# TYPE query_frontend_{name} gauge")
+            lines.append(f"query_frontend_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class FrontendHandler(BaseHTTPRequestHandler):
+    """Serves the Prometheus HTTP API from the query frontend."""
+
+    protocol_version = "HTTP/1.1"
+    frontend = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == "/metrics":
+            body = self.frontend.metrics().encode()
+            return self._send(200, "text/plain; version=0.0.4", body)
+        if url.path in ("/-/healthy", "/-/ready"):
+            return self._send(200, "text/plain", b"ok")
+        params = urllib.parse.parse_qsl(url.query, keep_blank_values=True)
+        self._send(*self.frontend.request("GET", url.path, params))
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        length = int(self.headers.get("Content-Length", 0))
+        form = self.rfile.read(length).decode()
+        params = urllib.parse.parse_qsl(url.query, keep_blank_values=True)
+        params += urllib.parse.parse_qsl(form, keep_blank_values=True)
+        self._send(*self.frontend.request("POST", url.path, params))
+
+
+def main():
+    frontend = QueryFrontend(
+        upstream=os.environ["UPSTREAM_URL"],
+        size_budget=parse_quantity(os.environ.get("CACHE_SIZE", "512Mi")),
+        points_per_chunk=int(os.environ.get("POINTS_PER_CHUNK", "60")),
+        max_delay=int(os.environ.get("MAX_DELAY", "600")),
+        fresh_ttl=int(os.environ.get("FRESH_TTL", "10")),
+        workers=int(os.environ.get("UPSTREAM_WORKERS", "8")),
+    )
+    FrontendHandler.frontend = frontend
+    server = ThreadingHTTPServer(
+        ("", int(os.environ.get("PORT", "9090"))), FrontendHandler
+    )
+    print(
+        f"Serving the query frontend of {frontend.upstream} on port "
+        f"{server.server_port}, caching up to {frontend.size_budget} bytes"
+    )
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
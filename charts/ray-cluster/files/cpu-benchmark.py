@@ -0,0 +1,121 @@
+"""
+Compare CFS throttling and task throughput between Ray worker groups.
+
+Each run of BENCHMARK_RUNS submits BENCHMARK_TASKS matrix multiplication tasks
+with its Ray resources, e.g. dedicated_cpu to only run on the pinned cores of
+a dedicated group. Every task reports the group it ran on and the CFS
+throttling, core migrations and cores of its worker while it ran, which are
+summarized per run and group.
+"""
+
+import json
+import os
+import statistics
+import time
+
+import ray
+
+
+def read_cpu_stat():
+    """Returns the CFS period and throttling counters of this container."""
+    for path, throttled_key, scale in (
+        ("/sys/fs/cgroup/cpu.stat", "throttled_usec", 1e-6),
+        ("/sys/fs/cgroup/cpu,cpuacct/cpu.stat", "throttled_time", 1e-9),
+        ("/sys/fs/cgroup/cpu/cpu.stat", "throttled_time", 1e-9),
+    ):
+        try:
+            with open(path) as f:
+                stat = dict(line.split() for line in f)
+        except OSError:
+            continue
+        return {
+            "periods": int(stat.get("nr_periods", 0)),
+            "throttled": int(stat.get("nr_throttled", 0)),
+            "throttled_seconds": int(stat.get(throttled_key, 0)) * scale,
+        }
+    return {"periods": 0, "throttled": 0, "throttled_seconds": 0.0}
+
+
+def read_migrations():
+    """Returns how often this process moved between cores, if the kernel says."""
+    try:
+        with open("/proc/self/sched") as f:
+            for line in f:
+                if line.startswith("se.nr_migrations"):
+                    return int(line.split(":")[1])
+    except OSError:
+        pass
+    return None
+
+
+@ray.remote
+def matmul(seconds, size):
+    import numpy as np
+
+    a = np.random.rand(size, size)
+    b = np.random.rand(size, size)
+    before, migrations_before = read_cpu_stat(), read_migrations()
+    start = time.perf_counter()
+    iterations = 0
+    while time.perf_counter() - start < seconds:
+        a @ b
+        iterations += 1
+    elapsed = time.perf_counter() - start
+    after, migrations_after = read_cpu_stat(), read_migrations()
+    migrations = None
+    if migrations_before is not None and migrations_after is not None:
+        migrations = migrations_after - migrations_before
+    return {
+        "group": os.environ.get("RAY_WORKER_GROUP", "head"),
+        "profile": os.environ.get("RAY_WORKER_PROFILE", "-"),
+        "gflops": 2 * size**3 * iterations / elapsed / 1e9,
+        "periods": after["periods"] - before["periods"],
+        "throttled": after["throttled"] - before["throttled"],
+        "throttled_seconds": after["throttled_seconds"] - before["throttled_seconds"],
+        "migrations": migrations,
+        "cores": len(os.sched_getaffinity(0)),
+    }
+
+
+def summarize(run, results):
+    groups = {}
+    for result in results:
+        groups.setdefault((result["group"], result["profile"]), []).append(result)
+    for (group, profile), group_results in sorted(groups.items()):
+        gflops = sorted(r["gflops"] for r in group_results)
+        periods = sum(r["periods"] for r in group_results)
+        throttled = sum(r["throttled"] for r in group_results)
+        migrations = [r["migrations"] for r in group_results]
+        print(
+            f"{run:<12} {group:<18} {profile:<10} {len(group_results):>5} "
+            f"{statistics.median(gflops):>9.1f} {gflops[len(gflops) // 10]:>9.1f} "
+            f"{100 * throttled / periods if periods else 0.0:>10.1f} "
+            f"{sum(r['throttled_seconds'] for r in group_results):>11.2f} "
+            f"{sum(migrations) if None not in migrations else '-':>10} "
+            f"{statistics.median(r['cores'] for r in group_results):>6}"
+        )
+
+
+def main():
+    runs = json.loads(os.environ["BENCHMARK_RUNS"])
+    tasks = int(os.environ.get("BENCHMARK_TASKS", 16))
+    seconds = float(os.environ.get("BENCHMARK_TASK_SECONDS", 10))
+    size = int(os.environ.get("BENCHMARK_MATRIX_SIZE", 2048))
+    timeout = float(os.environ.get("BENCHMARK_TIMEOUT", 900))
+
+    ray.init()
+    print(
+        f"{'run':<12} {'group':<18} {'profile':<10} {'tasks':>5} "
+        f"{'GFLOP/s':>9} {'p10':>9} {'throttled%':>10} {'throttled s':>11} "
+        f"{'migrations':>10} {'cores':>6}"
+    )
+    for run in runs:
+        task = matmul.options(
+            num_cpus=run.get("numCpus", 1), resources=run.get("resources") or {}
+        )
+        refs = [task.remote(seconds, size) for _ in range(tasks)]
+        summarize(run["name"], ray.get(refs, timeout=timeout))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+{{/*
+Renders a head or worker group pod template from the values, adding what the
+chart's optional features need to its metadata, containers and pod spec.
+
+When rayStartParams is given, the object store is sized from the ray
+container's memory limit, see objectStore in values.yaml, and its
+object-store-memory is set in rayStartParams. objectStore overrides the chart
+wide objectStore values for this group.
+
+Usage: include "ray-cluster.podTemplate" (dict "root" $ "template" $template "rayStartParams" $params "objectStore" $objectStore)
+*/}}
+{{- define "ray-cluster.podTemplate" -}}
+{{- $root := .root }}
+{{- $template := deepCopy .template }}
+{{- if hasKey . "rayStartParams" }}
+{{- $objectStore := mergeOverwrite (deepCopy ($root.Values.objectStore | default dict)) (deepCopy (.objectStore | default dict)) }}
+{{- include "ray-cluster.objectStore" (dict "template" $template "rayStartParams" .rayStartParams "objectStore" $objectStore) }}
+{{- end }}
+{{- with $root.Values.datasetCache }}
+{{- if .enabled }}
+{{- range $container := $template.spec.containers }}
+{{- $env := dict "name" "DATASET_CACHE_ENDPOINT" "value" $.root.Values.datasetCache.endpoint }}
+{{- $_ := set $container "env" (append ($container.env | default list) $env) }}
+{{- if $.root.Values.datasetCache.hostPath }}
+{{- $mount := dict "name" "dataset-cache" "mountPath" $.root.Values.datasetCache.mountPath "subPath" "objects" "readOnly" true }}
+{{- $_ := set $container "volumeMounts" (append ($container.volumeMounts | default list) $mount) }}
+{{- end }}
+{{- end }}
+{{- if .hostPath }}
+{{- $volume := dict "name" "dataset-cache" "hostPath" (dict "path" .hostPath "type" "DirectoryOrCreate") }}
+{{- $_ := set $template.spec "volumes" (append ($template.spec.volumes | default list) $volume) }}
+{{- end }}
+{{- end }}
+{{- end }}
+{{- range $container := $template.spec.containers }}
+{{- if and $root.Values.image.pullPolicy (not $container.imagePullPolicy) }}
+{{- $_ := set $container "imagePullPolicy" $root.Values.image.pullPolicy }}
+{{- end }}
+{{- end }}
+{{- if $root.Values.profiling.enabled }}
+{{- $metadata := $template.metadata | default dict }}
+{{- $annotations := $metadata.annotations | default dict }}
+{{- $_ := set $annotations "profiling.microplat.io/enabled" "true" }}
+{{- $_ := set $metadata "annotations" $annotations }}
+{{- $_ := set $template "metadata" $metadata }}
+{{- end }}
+{{- with $root.Values.tracing }}
+{{- if .enabled }}
+{{- $env := list (dict "name" "OTEL_EXPORTER_OTLP_ENDPOINT" "value" .endpoint) (dict "name" "OTEL_RESOURCE_ATTRIBUTES" "value" (printf "ray.cluster=%s" $root.Release.Name)) }}
+{{- range $container := $template.spec.containers }}
+{{- $_ := set $container "env" (concat ($container.env | default list) $env) }}
+{{- end }}
+{{- end }}
+{{- end }}
+{{- with $root.Values.prestart }}
+{{- if .enabled }}
+{{- $container := first $template.spec.containers }}
+{{- $env := list (dict "name" "RAY_prestart_worker_first_driver" "value" "true") (dict "name" "RAY_enable_worker_prestart" "value" "true") }}
+{{- with .preloadModules }}
+{{- $env = append $env (dict "name" "RAY_preload_python_modules" "value" (join "," .)) }}
+{{- end }}
+{{- $_ := set $container "env" (concat ($container.env | default list) $env) }}
+{{- end }}
+{{- end }}
+{{- toYaml $template }}
+{{- end }}
+
+{{/*
+Returns the images of the head and worker containers and
+imageWarmer.extraImages as a YAML list, without duplicates.
+*/}}
+{{- define "ray-cluster.images" -}}
+{{- $templates := list .Values.spec.headGroupSpec.template .Values.spec.workerTemplate }}
+{{- range .Values.spec.workerGroupSpecs }}
+{{- if and (or (not (hasKey . "enabled")) .enabled) .template }}
+{{- $templates = append $templates .template }}
+{{- end }}
+{{- end }}
+{{- $images := list }}
+{{- range $templates }}
+{{- range (dig "spec" "containers" list (. | default dict)) }}
+{{- with .image }}
+{{- $images = append $images . }}
+{{- end }}
+{{- end }}
+{{- end }}
+{{- toYaml (concat $images (.Values.imageWarmer.extraImages | default list) | uniq) }}
+{{- end }}
+
+{{/*
+Renders a worker group of spec.workerGroupSpecs as a list item, with its pod
+template merged over spec.workerTemplate and its resources, rayResources,
+profile and autoscaling settings applied. RAY_WORKER_GROUP and
+RAY_WORKER_PROFILE tell its workers which group and profile they belong to.
+Disabled groups render nothing.
+
+Usage: include "ray-cluster.workerGroup" (dict "root" $ "group" $group)
+*/}}
+{{- define "ray-cluster.workerGroup" -}}
+{{- $root := .root }}
+{{- $autoscaling := $root.Values.autoscaling }}
+{{- if or (not (hasKey .group "enabled")) .group.enabled }}
+{{- $group := omit (deepCopy .group) "enabled" "resources" "rayResources" "objectStore" "profile" "template" }}
+{{- $minReplicas := int ($group.minReplicas | default 0) }}
+{{- $_ := set $group "minReplicas" $minReplicas }}
+{{- if and (hasKey $group "maxReplicas") (gt $minReplicas (int $group.maxReplicas)) }}
+{{- fail (printf "spec.workerGroupSpecs %s: minReplicas %d is above maxReplicas %d" $group.groupName $minReplicas (int $group.maxReplicas)) }}
+{{- end }}
+{{- if not (hasKey $group "replicas") }}
+{{- $_ := set $group "replicas" $minReplicas }}
+{{- end }}
+{{- if not (and $autoscaling.enabled (eq (toString $autoscaling.version) "v2")) }}
+{{- $group = omit $group "idleTimeoutSeconds" }}
+{{- end }}
+{{- $rayStartParams := $group.rayStartParams | default dict }}
+{{- $rayResources := deepCopy (.group.rayResources | default dict) }}
+{{- $template := mergeOverwrite (deepCopy ($root.Values.spec.workerTemplate | default dict)) (deepCopy (.group.template | default dict)) }}
+{{- with .group.resources }}
+{{- $_ := set (first $template.spec.containers) "resources" . }}
+{{- end }}
+{{- $container := first $template.spec.containers }}
+{{- $env := list (dict "name" "RAY_WORKER_GROUP" "value" $group.groupName) }}
+{{- with .group.profile }}
+{{- $env = append $env (dict "name" "RAY_WORKER_PROFILE" "value" .) }}
+{{- end }}
+{{- $_ := set $container "env" (concat ($container.env | default list) $env) }}
+{{- with .group.profile }}
+{{- $profile := get ($root.Values.profiles | default dict) . }}
+{{- if not $profile }}
+{{- fail (printf "spec.workerGroupSpecs %s: unknown profile %s" $group.groupName .) }}
+{{- end }}
+{{- include "ray-cluster.profile" (dict "root" $root "group" $group "template" $template "rayStartParams" $rayStartParams "rayResources" $rayResources "profile" $profile) }}
+{{- end }}
+{{- with $rayResources }}
+{{- $_ := set $rayStartParams "resources" (printf "%q" (toJson .)) }}
+{{- end }}
+{{- $_ := set $group "template" (include "ray-cluster.podTemplate" (dict "root" $root "template" $template "rayStartParams" $rayStartParams "objectStore" .group.objectStore) | fromYaml) }}
+{{- $_ := set $group "rayStartParams" $rayStartParams }}
+{{- toYaml (list $group) }}
+{{- end }}
+{{- end }}
+
+{{/*
+Applies a placement profile of profiles to a worker group's pod template,
+rayStartParams and Ray resources, see profiles in values.yaml.
+
+Usage: include "ray-cluster.profile" (dict "root" $ "group" $group "template" $template "rayStartParams" $params "rayResources" $rayResources "profile" $profile)
+*/}}
+{{- define "ray-cluster.profile" -}}
+{{- $profile := .profile }}
+{{- $groupName := .group.groupName }}
+{{- $spec := .template.spec }}
+{{- $container := first $spec.containers }}
+{{- if $profile.guaranteed }}
+{{- $limits := dig "resources" "limits" dict $container }}
+{{- $requests := dig "resources" "requests" $limits $container }}
+{{- $cpu := toString ($limits.cpu | default "") }}
+{{- if not (regexMatch "^[1-9][0-9]*$" $cpu) }}
+{{- fail (printf "spec.workerGroupSpecs %s: the profile needs an integer CPU limit for exclusive cores, not %q" $groupName $cpu) }}
+{{- end }}
+{{- if or (not $limits.memory) (ne (toString $requests.cpu) $cpu) (ne (toString $requests.memory) (toString $limits.memory)) }}
+{{- fail (printf "spec.workerGroupSpecs %s: the profile needs a memory limit and requests equal to limits for the Guaranteed QoS class" $groupName) }}
+{{- end }}
+{{- $_ := set .rayStartParams "num-cpus" $cpu }}
+{{- with $profile.rayResource }}
+{{- $_ := set $.rayResources . (int $cpu) }}
+{{- end }}
+{{- end }}
+{{- with $profile.nodeSelector }}
+{{- $_ := set $spec "nodeSelector" (mergeOverwrite ($spec.nodeSelector | default dict) (deepCopy .)) }}
+{{- end }}
+{{- with $profile.tolerations }}
+{{- $_ := set $spec "tolerations" (concat ($spec.tolerations | default list) .) }}
+{{- end }}
+{{- if and $profile.podAntiAffinity (ne $profile.podAntiAffinity "none") }}
+{{- $term := dict "topologyKey" ($profile.topologyKey | default "kubernetes.io/hostname") "labelSelector" (dict "matchLabels" (dict "ray.io/cluster" .root.Release.Name "ray.io/group" $groupName)) }}
+{{- $affinity := $spec.affinity | default dict }}
+{{- $podAntiAffinity := $affinity.podAntiAffinity | default dict }}
+{{- if eq $profile.podAntiAffinity "required" }}
+{{- $_ := set $podAntiAffinity "requiredDuringSchedulingIgnoredDuringExecution" (append ($podAntiAffinity.requiredDuringSchedulingIgnoredDuringExecution | default list) $term) }}
+{{- else if eq $profile.podAntiAffinity "preferred" }}
+{{- $_ := set $podAntiAffinity "preferredDuringSchedulingIgnoredDuringExecution" (append ($podAntiAffinity.preferredDuringSchedulingIgnoredDuringExecution | default list) (dict "weight" 100 "podAffinityTerm" $term)) }}
+{{- else }}
+{{- fail (printf "podAntiAffinity must be preferred, required or none, not %s" $profile.podAntiAffinity) }}
+{{- end }}
+{{- $_ := set $affinity "podAntiAffinity" $podAntiAffinity }}
+{{- $_ := set $spec "affinity" $affinity }}
+{{- end }}
+{{- with $profile.hugepages }}
+{{- if .enabled }}
+{{- $resource := printf "hugepages-%s" .pageSize }}
+{{- $resources := $container.resources | default dict }}
+{{- if not $resources.requests }}
+{{- $_ := set $resources "requests" (deepCopy ($resources.limits | default dict)) }}
+{{- end }}
+{{- range $kind := list "limits" "requests" }}
+{{- $_ := set $resources $kind (merge (dict $resource $.profile.hugepages.size) (get $resources $kind | default dict)) }}
+{{- end }}
+{{- $_ := set $container "resources" $resources }}
+{{- $_ := set $container "volumeMounts" (append ($container.volumeMounts | default list) (dict "name" "hugepages" "mountPath" "/dev/hugepages")) }}
+{{- $_ := set $spec "volumes" (append ($spec.volumes | default list) (dict "name" "hugepages" "emptyDir" (dict "medium" (printf "HugePages-%s" .pageSize)))) }}
+{{- end }}
+{{- end }}
+{{- end }}
+
+{{/*
+Returns the number of bytes of a Kubernetes quantity, e.g. 8Gi or 1.5G.
+*/}}
+{{- define "ray-cluster.bytes" -}}
+{{- $quantity := toString . }}
+{{- $bytes := $quantity }}
+{{- $units := dict "Ki" 1024 "Mi" 1048576 "Gi" 1073741824 "Ti" 1099511627776 "k" 1000 "M" 1000000 "G" 1000000000 "T" 1000000000000 }}
+{{- range $unit, $factor := $units }}
+{{- if hasSuffix $unit $quantity }}
+{{- $bytes = mulf (float64 (trimSuffix $unit $quantity)) $factor }}
+{{- end }}
+{{- end }}
+{{- printf "%d" (int64 (float64 $bytes)) }}
+{{- end }}
+
+{{/*
+Sizes the object store of a head or worker group pod template. The ray
+container's memory limit is split into the object store (memoryFraction) and
+a memory backed /dev/shm (shmFraction) holding it, and objects are spilled to
+the configured target instead of the container filesystem.
+
+Usage: include "ray-cluster.objectStore" (dict "template" $template "rayStartParams" $params "objectStore" $objectStore)
+*/}}
+{{- define "ray-cluster.objectStore" -}}
+{{- $objectStore := .objectStore }}
+{{- if $objectStore.enabled }}
+{{- $container := first .template.spec.containers }}
+{{- $shm := dict "medium" "Memory" }}
+{{- $memoryLimit := dig "resources" "limits" "memory" "" $container }}
+{{- if $memoryLimit }}
+{{- if lt (float64 $objectStore.shmFraction) (float64 $objectStore.memoryFraction) }}
+{{- fail (printf "objectStore.shmFraction %v is below objectStore.memoryFraction %v, the object store would not fit in /dev/shm" $objectStore.shmFraction $objectStore.memoryFraction) }}
+{{- end }}
+{{- $limit := float64 (include "ray-cluster.bytes" $memoryLimit) }}
+{{- $_ := set .rayStartParams "object-store-memory" (printf "%d" (int64 (mulf $limit $objectStore.memoryFraction))) }}
+{{- $_ := set $shm "sizeLimit" (printf "%d" (int64 (mulf $limit $objectStore.shmFraction))) }}
+{{- end }}
+{{- $volumes := list (dict "name" "dshm" "emptyDir" $shm) }}
+{{- $mounts := list (dict "name" "dshm" "mountPath" "/dev/shm") }}
+{{- $env := list }}
+{{- with $objectStore.spilling }}
+{{- if eq .type "local" }}
+{{- $spillConfig := dict "type" "filesystem" "params" (dict "directory_path" .local.path "buffer_size" (int64 .local.bufferSize)) }}
+{{- $env = append $env (dict "name" "RAY_object_spilling_config" "value" (toJson $spillConfig)) }}
+{{- $mounts = append $mounts (dict "name" "ray-spill" "mountPath" .local.path) }}
+{{- if .local.storageClassName }}
+{{- $claim := dict "accessModes" (list "ReadWriteOnce") "storageClassName" .local.storageClassName "resources" (dict "requests" (dict "storage" .local.size)) }}
+{{- $volumes = append $volumes (dict "name" "ray-spill" "ephemeral" (dict "volumeClaimTemplate" (dict "spec" $claim))) }}
+{{- else }}
+{{- $volumes = append $volumes (dict "name" "ray-spill" "emptyDir" (dict "sizeLimit" .local.size)) }}
+{{- end }}
+{{- else if eq .type "s3" }}
+{{- $uri := printf "s3://%s" (trimSuffix "/" (printf "%s/%s" .s3.bucket (.s3.prefix | default ""))) }}
+{{- $spillConfig := dict "type" "smart_open" "params" (dict "uri" $uri "buffer_size" (int64 .s3.bufferSize)) }}
+{{- $env = append $env (dict "name" "RAY_object_spilling_config" "value" (toJson $spillConfig)) }}
+{{- with .s3.endpoint }}
+{{- $env = append $env (dict "name" "AWS_ENDPOINT_URL" "value" .) }}
+{{- end }}
+{{- with .s3.existingSecret }}
+{{- range $key := list "AWS_ACCESS_KEY_ID" "AWS_SECRET_ACCESS_KEY" }}
+{{- $env = append $env (dict "name" $key "valueFrom" (dict "secretKeyRef" (dict "name" $.objectStore.spilling.s3.existingSecret "key" $key))) }}
+{{- end }}
+{{- end }}
+{{- else if ne .type "none" }}
+{{- fail (printf "objectStore.spilling.type must be none, local or s3, not %s" .type) }}
+{{- end }}
+{{- if and (ne .type "none") .threshold }}
+{{- $env = append $env (dict "name" "RAY_object_spilling_threshold" "value" (toString .threshold)) }}
+{{- end }}
+{{- if and (ne .type "none") .minSpillingSize }}
+{{- $env = append $env (dict "name" "RAY_min_spilling_size" "value" (include "ray-cluster.bytes" .minSpillingSize)) }}
+{{- end }}
+{{- end }}
+{{- $_ := set $container "env" (concat ($container.env | default list) $env) }}
+{{- $_ := set $container "volumeMounts" (concat ($container.volumeMounts | default list) $mounts) }}
+{{- $_ := set .template.spec "volumes" (concat (.template.spec.volumes | default list) $volumes) }}
+{{- end }}
+{{- end }}
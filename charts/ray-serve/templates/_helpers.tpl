@@ -0,0 +1,116 @@
+{{/*
+Returns the Serve config of the RayService, serveConfig with every deployment
+merged over deploymentDefaults. Fails for autoscaling settings the replicas
+could never scale with, and for admission settings they could not apply.
+*/}}
+{{- define "ray-serve.serveConfig" -}}
+{{- $applications := list }}
+{{- range $application := .Values.serveConfig.applications }}
+{{- $deployments := list }}
+{{- range $application.deployments }}
+{{- $deployment := mergeOverwrite (deepCopy ($.Values.deploymentDefaults | default dict)) (deepCopy .) }}
+{{- $name := printf "%s/%s" $application.name $deployment.name }}
+{{- with $deployment.autoscaling_config }}
+{{- if gt (int .min_replicas) (int .max_replicas) }}
+{{- fail (printf "deployment %s: min_replicas %d is above max_replicas %d" $name (int .min_replicas) (int .max_replicas)) }}
+{{- end }}
+{{- if and $deployment.max_ongoing_requests (lt (float64 $deployment.max_ongoing_requests) (float64 .target_ongoing_requests)) }}
+{{- fail (printf "deployment %s: max_ongoing_requests %v is below target_ongoing_requests %v, its replicas would never reach the target and scale up" $name $deployment.max_ongoing_requests .target_ongoing_requests) }}
+{{- end }}
+{{- end }}
+{{- with ($application.args | default dict).admission }}
+{{- $admitted := add (int .max_in_flight) (int .max_queued) }}
+{{- if and $deployment.max_ongoing_requests (lt (int $deployment.max_ongoing_requests) $admitted) }}
+{{- fail (printf "deployment %s: max_ongoing_requests %v is below the %d requests its admission runs and queues, Serve would queue the others where they cannot be shed" $name $deployment.max_ongoing_requests $admitted) }}
+{{- end }}
+{{- end }}
+{{- $deployments = append $deployments $deployment }}
+{{- end }}
+{{- $applications = append $applications (set (deepCopy $application) "deployments" $deployments) }}
+{{- end }}
+{{- toYaml (dict "http_options" .Values.serveConfig.http_options "applications" $applications) }}
+{{- end }}
+
+{{/*
+Returns the pod template of the head or worker containers, named name, with
+the resources given and what the chart's values add to it.
+
+Usage: include "ray-serve.podTemplate" (dict "root" $ "name" "ray-head" "resources" $resources "shmSize" $size)
+*/}}
+{{- define "ray-serve.podTemplate" -}}
+{{- $root := .root -}}
+metadata:
+  labels:
+    app.kubernetes.io/instance: {{ $root.Release.Name }}
+    app.kubernetes.io/name: ray-serve
+spec:
+  containers:
+    - name: {{ .name }}
+      image: "{{ $root.Values.image.repository }}:{{ $root.Values.image.tag }}"
+      imagePullPolicy: {{ $root.Values.image.pullPolicy }}
+      env:
+        # the import_path of the applications is relative to the image's
+        # working directory
+        - name: PYTHONPATH
+          value: /app
+        - name: RAY_metric_cardinality_level
+          value: recommended
+        {{- with $root.Values.tracing }}
+        {{- if .enabled }}
+        - name: OTEL_EXPORTER_OTLP_ENDPOINT
+          value: {{ .endpoint }}
+        - name: OTEL_RESOURCE_ATTRIBUTES
+          value: ray.cluster={{ $root.Release.Name }}
+        {{- end }}
+        {{- end }}
+      ports:
+        - containerPort: 8000
+          name: serve
+          protocol: TCP
+        - containerPort: 8080
+          name: metrics
+          protocol: TCP
+        {{- if eq .name "ray-head" }}
+        - containerPort: 8265
+          name: dashboard
+          protocol: TCP
+        {{- end }}
+      resources:
+        {{- toYaml .resources | nindent 8 }}
+      volumeMounts:
+        - name: dshm
+          mountPath: /dev/shm
+        {{- with $root.Values.models.existingClaim }}
+        - name: models
+          mountPath: {{ $root.Values.models.mountPath }}
+          readOnly: true
+        {{- end }}
+  volumes:
+    - name: dshm
+      emptyDir:
+        medium: Memory
+        {{- with .shmSize }}
+        sizeLimit: {{ . }}
+        {{- end }}
+    {{- with $root.Values.models.existingClaim }}
+    - name: models
+      persistentVolumeClaim:
+        claimName: {{ . }}
+        readOnly: true
+    {{- end }}
+{{- end }}
+
+{{/*
+Returns the number of bytes of a Kubernetes quantity, e.g. 8Gi or 1.5G.
+*/}}
+{{- define "ray-serve.bytes" -}}
+{{- $quantity := toString . }}
+{{- $bytes := $quantity }}
+{{- $units := dict "Ki" 1024 "Mi" 1048576 "Gi" 1073741824 "Ti" 1099511627776 "k" 1000 "M" 1000000 "G" 1000000000 "T" 1000000000000 }}
+{{- range $unit, $factor := $units }}
+{{- if hasSuffix $unit $quantity }}
+{{- $bytes = mulf (float64 (trimSuffix $unit $quantity)) $factor }}
+{{- end }}
+{{- end }}
+{{- printf "%d" (int64 (float64 $bytes)) }}
+{{- end }}
@@ -0,0 +1,214 @@
+"""
+Admission control of the requests of a Serve replica, shedding those it
+cannot serve in time rather than letting its queue grow until all time out.
+
+    admission = AdmissionController(max_in_flight=512, max_queued=512)
+    ticket = await admission.acquire(priority_class, budget_ms)  # or Rejected
+    try:
+        ...
+    finally:
+        admission.release(ticket)
+
+At most max_in_flight requests run at once, enough for the micro-batches to
+fill up, and up to max_queued more wait their turn, by priority class, then
+in order of arrival. Each priority class has a priority, lower first, and a
+deadline, the milliseconds its requests are of any use to their callers,
+which a caller may shorten with a budget of its own. Requests are rejected
+with a status and the seconds to retry after, estimated from the time the
+queue takes to drain:
+
+    deadline   503  the request could not be served before its deadline,
+                    judging by the latency of the requests before it, when it
+                    arrived or when its turn came, or it waited past it
+    queue_full 503  the queue is full of requests of its class or above
+    displaced  429  a request of a higher class took its place in the queue
+
+so that under overload most requests are served in time, interactive ones
+first, rather than all of them late. This module has no dependencies.
+"""
+
+import asyncio
+import collections
+import heapq
+import itertools
+import math
+import time
+
+# priority, lower first, and deadline of the requests of each class
+DEFAULT_CLASSES = {
+    "interactive": {"priority": 0, "deadline_ms": 1000},
+    "batch": {"priority": 1, "deadline_ms": 30000},
+}
+DEFAULT_CLASS = "interactive"
+
+# weight of the latest request's latency in their moving average
+_LATENCY_SMOOTHING = 0.05
+
+
+class Rejected(Exception):
+    """A request shed, with the status and Retry-After to answer it with."""
+
+    def __init__(self, reason, status, retry_after):
+        super().__init__(f"request shed: {reason}")
+        self.reason = reason
+        self.status = status
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "deadline", "priority_class", "future")
+
+    def __init__(self, priority, seq, deadline, priority_class, future):
+        self.priority = priority
+        self.seq = seq
+        self.deadline = deadline
+        self.priority_class = priority_class
+        self.future = future
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class AdmissionController:
+    """
+    Admits up to max_in_flight requests at once, queueing up to max_queued
+    more, by the priority and deadline of their class in classes.
+
+    shed and queued, if given, are a counter with Ray's inc(), of the
+    requests rejected by reason and priority_class tags, and a gauge with
+    set(), of the requests queued.
+    """
+
+    def __init__(
+        self,
+        max_in_flight=512,
+        max_queued=512,
+        classes=None,
+        default_class=DEFAULT_CLASS,
+        shed=None,
+        queued=None,
+    ):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.classes = classes or DEFAULT_CLASSES
+        if default_class not in self.classes:
+            raise ValueError(f"no priority class {default_class}")
+        self.default_class = default_class
+        self.in_flight = 0
+        self.latency = None
+        # waiters by priority, and those still waiting of each priority
+        self._queue = []
+        self._waiting = collections.Counter()
+        self._seq = itertools.count()
+        self._shed = shed
+        self._queued = queued
+
+    def __len__(self):
+        """Returns the requests queued."""
+        return sum(self._waiting.values())
+
+    async def acquire(self, priority_class=None, budget_ms=None):
+        """
+        Waits for the turn of a request of priority_class, with budget_ms
+        to be served in at most, and returns its ticket for release(). Raises
+        Rejected if it is shed, and ValueError for unknown classes.
+        """
+        name = priority_class or self.default_class
+        if name not in self.classes:
+            raise ValueError(
+                f"priority class must be one of {', '.join(self.classes)}, not {name}"
+            )
+        config = self.classes[name]
+        now = time.monotonic()
+        deadline_ms = config["deadline_ms"]
+        if budget_ms is not None:
+            deadline_ms = min(deadline_ms, float(budget_ms))
+        deadline = now + deadline_ms / 1000
+
+        if self.in_flight < self.max_in_flight and not len(self):
+            self.in_flight += 1
+            return now
+        priority = config["priority"]
+        ahead = sum(n for p, n in self._waiting.items() if p <= priority)
+        if now + self._expected_wait(ahead) > deadline:
+            self._reject("deadline", name, 503)
+        if len(self) >= self.max_queued:
+            # none to displace with max_queued 0, or when those counted have
+            # left but their callbacks have yet to run
+            lowest = max((w for w in self._queue if not w.future.done()), default=None)
+            if lowest is None or lowest.priority <= priority:
+                self._reject("queue_full", name, 503)
+            lowest.future.set_exception(self._rejected("displaced", 429))
+            self._count("displaced", lowest.priority_class)
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(priority, next(self._seq), deadline, name, future)
+        heapq.heappush(self._queue, waiter)
+        self._waiting[priority] += 1
+        future.add_done_callback(lambda _: self._left(priority))
+        self._set_queued()
+        try:
+            await asyncio.wait_for(future, deadline - now)
+        except asyncio.TimeoutError:
+            self._reject("deadline", name, 503)
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and not future.exception():
+                # admitted as its caller went away, the next takes its place
+                self._admit_next(time.monotonic())
+            raise
+        return time.monotonic()
+
+    def release(self, ticket):
+        """Ends a request admitted at ticket, admitting the next in its place."""
+        now = time.monotonic()
+        if self.latency is None:
+            self.latency = now - ticket
+        else:
+            self.latency += _LATENCY_SMOOTHING * (now - ticket - self.latency)
+        self._admit_next(now)
+
+    def _admit_next(self, now):
+        while self._queue:
+            waiter = heapq.heappop(self._queue)
+            if waiter.future.done():
+                # timed out, displaced or cancelled meanwhile
+                continue
+            if self.latency is not None and now + self.latency > waiter.deadline:
+                waiter.future.set_exception(self._rejected("deadline", 503))
+                self._count("deadline", waiter.priority_class)
+                continue
+            # its place in flight passes on to the waiter
+            waiter.future.set_result(None)
+            return
+        self.in_flight -= 1
+
+    def _left(self, priority):
+        self._waiting[priority] -= 1
+        self._set_queued()
+
+    def _expected_wait(self, ahead):
+        """
+        Returns the seconds until a request with ahead requests queued before
+        it is served, as requests are served max_in_flight at a time.
+        """
+        if self.latency is None:
+            return 0.0
+        return self.latency * (1 + ahead / self.max_in_flight)
+
+    def _rejected(self, reason, status):
+        drain = self._expected_wait(len(self))
+        return Rejected(reason, status, max(1, math.ceil(drain)))
+
+    def _reject(self, reason, priority_class, status):
+        self._count(reason, priority_class)
+        raise self._rejected(reason, status)
+
+    def _count(self, reason, priority_class):
+        if self._shed is not None:
+            self._shed.inc(tags={"reason": reason, "priority_class": priority_class})
+
+    def _set_queued(self):
+        if self._queued is not None:
+            self._queued.set(len(self))
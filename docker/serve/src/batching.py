@@ -0,0 +1,186 @@
+"""
+Adaptive micro-batching of the rows of concurrent requests.
+
+A model's predict costs about the same Python overhead for one row as for a
+few hundred, so MicroBatcher coalesces the rows of the requests a replica is
+handling concurrently into one numpy batch and calls predict once for it:
+
+    batcher = MicroBatcher(model.predict, max_batch_size=256, max_wait_ms=5)
+    predictions = await batcher.submit(rows)  # the predictions of rows only
+
+One batch is predicted at a time, in a thread so that the event loop keeps
+accepting requests meanwhile. The requests arriving during a batch make up
+the next one, so batches grow with the load on their own. A batch is started
+once it has max_batch_size rows, or max_wait_ms after its oldest request
+arrived. The wait adapts to the traffic: when requests arrive further apart
+than max_wait_ms, the batch could not grow by waiting and starts right away.
+
+This module only needs numpy, so that it can be tested without Ray.
+"""
+
+import asyncio
+import collections
+import time
+
+import numpy as np
+
+# weight of the latest interval between two requests in their moving average
+_ARRIVAL_SMOOTHING = 0.1
+
+
+class _Request:
+    __slots__ = ("rows", "future", "arrived")
+
+    def __init__(self, rows, future, arrived):
+        self.rows = rows
+        self.future = future
+        self.arrived = arrived
+
+
+class MicroBatcher:
+    """
+    Batches the rows of concurrent submit() calls into single calls of
+    predict, a function of a 2-d array returning one prediction per row.
+
+    batch_size and wait_ms, if given, are histograms with an observe()
+    method, of the rows per batch and of the milliseconds each request waited
+    for its batch to start.
+    """
+
+    def __init__(
+        self,
+        predict,
+        max_batch_size=256,
+        max_wait_ms=5.0,
+        batch_size=None,
+        wait_ms=None,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._batch_size = batch_size
+        self._wait_ms = wait_ms
+        self._queue = collections.deque()
+        self._queued_rows = 0
+        self._arrival_interval = None
+        self._last_arrival = None
+        self._wakeup = None
+        self._worker = None
+        self._closing = False
+
+    async def submit(self, rows):
+        """Returns the predictions of rows, a row or a 2-d array of them."""
+        rows = np.asarray(rows)
+        if rows.ndim == 1:
+            rows = rows.reshape(1, -1)
+        if len(rows) == 0:
+            raise ValueError("no rows to predict")
+
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = loop.create_task(self._run())
+        now = time.monotonic()
+        self._track_arrival(now)
+        request = _Request(rows, loop.create_future(), now)
+        self._queue.append(request)
+        self._queued_rows += len(rows)
+        self._wakeup.set()
+        return await request.future
+
+    def close(self):
+        """
+        Stops the batcher's worker, which holds on to predict, once the batch
+        it is predicting and the rows queued are. Safe to call from any
+        thread.
+        """
+        worker = self._worker
+        if worker is not None and not worker.done():
+            worker.get_loop().call_soon_threadsafe(self._close)
+
+    def _close(self):
+        self._closing = True
+        self._wakeup.set()
+
+    def _track_arrival(self, now):
+        if self._last_arrival is not None:
+            interval = now - self._last_arrival
+            if self._arrival_interval is None:
+                self._arrival_interval = interval
+            else:
+                self._arrival_interval += _ARRIVAL_SMOOTHING * (
+                    interval - self._arrival_interval
+                )
+        self._last_arrival = now
+
+    def _wait_for(self):
+        """Returns how long the oldest request may still wait for its batch."""
+        if self._queued_rows >= self.max_batch_size:
+            return 0
+        if (
+            self._arrival_interval is not None
+            and self._arrival_interval >= self.max_wait
+        ):
+            # too little traffic for a batch to fill up while waiting
+            return 0
+        return self._queue[0].arrived + self.max_wait - time.monotonic()
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._queue:
+                # once closing, the rows queued are predicted without waiting
+                timeout = 0 if self._closing else self._wait_for()
+                if timeout > 0:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._wakeup.clear()
+                    continue
+                await self._predict(self._next_batch())
+            if self._closing:
+                return
+
+    def _next_batch(self):
+        """Takes whole requests of up to max_batch_size rows off the queue."""
+        batch, rows = [], 0
+        while self._queue:
+            request = self._queue[0]
+            if batch and rows + len(request.rows) > self.max_batch_size:
+                break
+            self._queue.popleft()
+            self._queued_rows -= len(request.rows)
+            # requests given up on, e.g. by a disconnected client
+            if request.future.done():
+                continue
+            batch.append(request)
+            rows += len(request.rows)
+        return batch
+
+    async def _predict(self, batch):
+        if not batch:
+            return
+        started = time.monotonic()
+        if self._wait_ms is not None:
+            for request in batch:
+                self._wait_ms.observe((started - request.arrived) * 1000)
+        loop = asyncio.get_running_loop()
+        try:
+            rows = np.concatenate([request.rows for request in batch])
+            if self._batch_size is not None:
+                self._batch_size.observe(len(rows))
+            predictions = await loop.run_in_executor(None, self.predict, rows)
+        except Exception as error:
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(error)
+            return
+
+        offsets = np.cumsum([len(request.rows) for request in batch])[:-1]
+        for request, result in zip(batch, np.split(np.asarray(predictions), offsets)):
+            if not request.future.done():
+                request.future.set_result(result)
@@ -0,0 +1,316 @@
+"""
+Tree ensembles compiled into native shared libraries, for inference without
+their Python predict paths.
+
+A model is saved with export_model(), which dumps it with joblib and, for
+the XGBoost, LightGBM and scikit-learn tree ensembles treelite imports,
+compiles it with tl2cgen next to the dump:
+
+    export_model(model, "/models/model.joblib", sample_rows=X_valid)
+
+    /models/model.joblib
+    /models/model.compiled/predictor.so
+    /models/model.compiled/model.joblib  the preprocessing, classes and source
+
+The scalers and imputers of a scikit-learn Pipeline before the ensemble are
+fused into one vectorized numpy pass, y = where(isnan(x), fill, x * scale +
+offset); pipelines with other steps are not compiled. Every compile is
+checked against the model's own predictions of sample_rows, and is not kept
+if more than max_mismatch of them differ.
+
+The serve image loads the compiled model of a dump with load_compiled(),
+which returns None, for the dump to be loaded instead, where there is none,
+where it was compiled from another dump, or where it cannot be loaded here.
+Compiled models predict as their model's predict(), labels for classifiers.
+
+Compiling needs treelite, tl2cgen and a C compiler, loading only tl2cgen, and
+both import them lazily. The serve image has all three, and compiles
+existing dumps with:
+
+    python -m src.compiled /models/model.joblib sample_rows.npy
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+COMPILED_SUFFIX = ".compiled"
+LIBRARY = "predictor.so"
+METADATA = "model.joblib"
+
+logger = logging.getLogger(__name__)
+
+
+class UnsupportedModel(ValueError):
+    """A model that cannot be compiled."""
+
+
+def compiled_path(path):
+    """Returns the directory of the compiled model of the dump at path."""
+    return os.path.splitext(path)[0] + COMPILED_SUFFIX
+
+
+def _digest(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(2**20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fuse_preprocessing(model):
+    """
+    Returns the fill, scale and offset of the fused preprocessing steps of a
+    Pipeline, or None without any, and its final estimator.
+    """
+    steps = getattr(model, "steps", None)
+    if steps is None:
+        return None, model
+
+    from sklearn.impute import SimpleImputer
+    from sklearn.preprocessing import MaxAbsScaler, MinMaxScaler, StandardScaler
+
+    n_features = model.n_features_in_
+    fill = np.full(n_features, np.nan)
+    scale = np.ones(n_features)
+    offset = np.zeros(n_features)
+    for name, step in steps[:-1]:
+        if step is None or step == "passthrough":
+            continue
+        if isinstance(step, StandardScaler):
+            a = 1 / step.scale_ if step.with_std else np.ones(n_features)
+            b = -step.mean_ * a if step.with_mean else np.zeros(n_features)
+        elif isinstance(step, MinMaxScaler) and not step.clip:
+            a, b = step.scale_, step.min_
+        elif isinstance(step, MaxAbsScaler):
+            a, b = 1 / step.scale_, np.zeros(n_features)
+        elif (
+            isinstance(step, SimpleImputer)
+            and isinstance(step.missing_values, float)
+            and np.isnan(step.missing_values)
+            and not step.add_indicator
+            and not np.isnan(step.statistics_).any()
+        ):
+            # only fills what no imputer before it has
+            fill = np.where(np.isnan(fill), step.statistics_.astype(float), fill)
+            continue
+        else:
+            raise UnsupportedModel(f"step {name} cannot be fused")
+        scale, offset, fill = scale * a, offset * a + b, fill * a + b
+    if np.isnan(fill).all() and (scale == 1).all() and (offset == 0).all():
+        return None, steps[-1][1]
+    return (fill, scale, offset), steps[-1][1]
+
+
+class CompiledModel:
+    """
+    A compiled model, with the predict() of the model it was compiled from.
+
+    predict_raw returns the raw outputs of the compiled ensemble for rows:
+    the values of regressors, and the probabilities of each class, or of the
+    positive one, of classifiers.
+    """
+
+    def __init__(self, predict_raw, preprocessing, classes, n_features):
+        self.predict_raw = predict_raw
+        self.preprocessing = preprocessing
+        self.classes_ = classes
+        self.n_features_in_ = n_features
+
+    def predict(self, rows):
+        rows = np.asarray(rows, dtype=np.float64)
+        if self.preprocessing is not None:
+            fill, scale, offset = self.preprocessing
+            rows = np.where(np.isnan(rows), fill, rows * scale + offset)
+        raw = np.asarray(self.predict_raw(rows)).reshape(len(rows), -1)
+        if self.classes_ is None:
+            return raw[:, 0] if raw.shape[1] == 1 else raw
+        if raw.shape[1] == 1:
+            return self.classes_[(raw[:, 0] > 0.5).astype(int)]
+        return self.classes_[raw.argmax(axis=1)]
+
+
+def _treelite_model(estimator):
+    import treelite
+
+    module = type(estimator).__module__.split(".")[0]
+    if module == "xgboost":
+        return treelite.frontend.from_xgboost(estimator.get_booster())
+    if module == "lightgbm":
+        return treelite.frontend.from_lightgbm(estimator.booster_)
+    if module == "sklearn":
+        try:
+            return treelite.sklearn.import_model(estimator)
+        except Exception as error:
+            raise UnsupportedModel(str(error)) from None
+    raise UnsupportedModel(f"{type(estimator).__name__} is not a tree ensemble")
+
+
+def _compiled_model(directory, threads=1):
+    import joblib
+    import tl2cgen
+
+    metadata = joblib.load(os.path.join(directory, METADATA))
+    predictor = tl2cgen.Predictor(os.path.join(directory, LIBRARY), nthread=threads)
+    # float32 or float64, as the ensemble's thresholds
+    dtype = predictor.threshold_type
+
+    def predict_raw(rows):
+        return predictor.predict(tl2cgen.DMatrix(rows, dtype=dtype))
+
+    return CompiledModel(
+        predict_raw,
+        metadata["preprocessing"],
+        metadata["classes"],
+        predictor.num_feature,
+    )
+
+
+def compile_model(model, path, sample_rows, max_mismatch=1e-4):
+    """
+    Compiles the model dumped at path next to it, returning the directory
+    of the compiled model, or None where it is not kept: when the model is
+    not a tree ensemble, or its predictions of sample_rows differ.
+    """
+    import joblib
+    import tl2cgen
+
+    try:
+        preprocessing, estimator = fuse_preprocessing(model)
+        if isinstance(getattr(estimator, "classes_", None), list):
+            raise UnsupportedModel("multi-output classifiers are not supported")
+        treelite_model = _treelite_model(estimator)
+    except UnsupportedModel as error:
+        logger.info("Not compiling %s: %s", path, error)
+        return None
+
+    target = compiled_path(path)
+    directory = tempfile.mkdtemp(
+        prefix=os.path.basename(target), dir=os.path.dirname(os.path.abspath(target))
+    )
+    try:
+        tl2cgen.export_lib(
+            treelite_model,
+            toolchain="gcc",
+            libpath=os.path.join(directory, LIBRARY),
+            # quantized thresholds compare as integers, compiled in parallel
+            params={"quantize": 1, "parallel_comp": os.cpu_count() or 1},
+        )
+        classes = getattr(estimator, "classes_", None)
+        joblib.dump(
+            {
+                "preprocessing": preprocessing,
+                "classes": None if classes is None else np.asarray(classes),
+                "source": _digest(path),
+            },
+            os.path.join(directory, METADATA),
+        )
+        compiled = _compiled_model(directory)
+        mismatch = parity(model, compiled, sample_rows)
+        if mismatch > max_mismatch:
+            logger.warning(
+                "Not keeping the compiled %s: %.4f%% of its predictions differ",
+                path,
+                100 * mismatch,
+            )
+            return None
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(directory, target)
+        directory = None
+        return target
+    finally:
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def parity(model, compiled, rows, rtol=1e-5, atol=1e-6):
+    """
+    Returns the fraction of rows whose predictions of a model and its
+    compiled model differ, exactly for labels, beyond rtol and atol for
+    values.
+    """
+    expected = np.asarray(model.predict(rows))
+    actual = np.asarray(compiled.predict(rows)).reshape(expected.shape)
+    if expected.dtype.kind in "fc":
+        differ = ~np.isclose(actual, expected, rtol=rtol, atol=atol)
+    else:
+        differ = actual != expected
+    differ = differ.reshape(len(rows), -1).any(axis=1)
+    return float(differ.mean()) if len(rows) else 0.0
+
+
+def export_model(model, path, sample_rows=None, compile=True, max_mismatch=1e-4):
+    """
+    Dumps a model with joblib to path, uncompressed for its arrays to be
+    memory-mapped, and compiles it there unless compile is false or there
+    are no sample_rows to check it with. Returns the directory of the
+    compiled model, or None.
+    """
+    import joblib
+
+    # a compiled model of a previous dump would no longer be loaded anyway
+    shutil.rmtree(compiled_path(path), ignore_errors=True)
+    joblib.dump(model, path)
+    if not compile or sample_rows is None:
+        return None
+    try:
+        return compile_model(model, path, sample_rows, max_mismatch=max_mismatch)
+    except Exception as error:
+        # the dump is served instead, the step is optional
+        logger.warning("Not compiling %s: %s", path, error)
+        return None
+
+
+def load_compiled(path, threads=1):
+    """
+    Returns the compiled model of the dump at path, or None where there is
+    none or it cannot be used.
+    """
+    directory = compiled_path(path)
+    if not os.path.isdir(directory):
+        return None
+    try:
+        import joblib
+
+        source = joblib.load(os.path.join(directory, METADATA))["source"]
+        if source != _digest(path):
+            logger.warning("Not loading %s, compiled from another dump", directory)
+            return None
+        # one thread, as replicas are scaled out rather than threaded
+        model = _compiled_model(directory, threads=threads)
+    except Exception as error:
+        # e.g. without tl2cgen, or compiled for another platform
+        logger.warning("Not loading %s: %s", directory, error)
+        return None
+    return model
+
+
+def main():
+    import argparse
+
+    import joblib
+
+    parser = argparse.ArgumentParser(description="Compile a dumped tree ensemble")
+    parser.add_argument("path", help="the model dumped with joblib")
+    parser.add_argument("sample_rows", help=".npy of rows to check parity on")
+    parser.add_argument("--max-mismatch", type=float, default=1e-4)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    compiled = compile_model(
+        joblib.load(args.path),
+        args.path,
+        np.load(args.sample_rows),
+        max_mismatch=args.max_mismatch,
+    )
+    if compiled is None:
+        raise SystemExit(f"{args.path} was not compiled")
+    print(compiled)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+LRU cache of the models a multiplexed Serve replica holds, within a memory
+budget.
+
+    cache = ModelCache(load, max_bytes=4 * 2**30)
+    model = await cache.get("customer-42")
+
+load(model_id) is called in a thread on a miss and returns the model and the
+bytes it takes. Concurrent gets of a model being loaded wait for that load
+rather than starting their own. Once the models held take more than
+max_bytes, the least recently used ones are evicted, though never the model
+just loaded, so that a model larger than the budget can still be served on
+its own. A load that fails is not cached, the next get tries again.
+on_evict(model) is called with each model evicted or replaced, e.g. to stop
+what it runs in the background.
+
+This module has no dependencies, so that it can be tested without Ray.
+"""
+
+import asyncio
+import collections
+import time
+
+
+class ModelCache:
+    """
+    Holds the models loaded by load, evicting the least recently used beyond
+    max_bytes.
+
+    The metrics, if given, are a counter of gets with a result tag of hit or
+    miss, a counter of evictions, a histogram of load seconds and a gauge of
+    the bytes held, with the inc(), observe() and set() methods of Ray's.
+    """
+
+    def __init__(
+        self,
+        load,
+        max_bytes,
+        requests=None,
+        evictions=None,
+        load_seconds=None,
+        held_bytes=None,
+        on_evict=None,
+    ):
+        self.load = load
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.bytes = 0
+        self._models = collections.OrderedDict()
+        self._loading = {}
+        self._requests = requests
+        self._evictions = evictions
+        self._load_seconds = load_seconds
+        self._held_bytes = held_bytes
+
+    def __contains__(self, model_id):
+        return model_id in self._models
+
+    def __len__(self):
+        return len(self._models)
+
+    async def get(self, model_id):
+        """Returns the model of model_id, loading it if it is not held."""
+        if model_id in self._models:
+            self._models.move_to_end(model_id)
+            self._count("hit")
+            return self._models[model_id][0]
+        self._count("miss")
+
+        loading = self._loading.get(model_id)
+        if loading is None:
+            loading = asyncio.ensure_future(self._load(model_id))
+            self._loading[model_id] = loading
+            loading.add_done_callback(lambda _: self._loading.pop(model_id, None))
+        # shielded, so that a caller giving up does not cancel the others' load
+        return await asyncio.shield(loading)
+
+    async def _load(self, model_id):
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        model, size = await loop.run_in_executor(None, self.load, model_id)
+        if self._load_seconds is not None:
+            self._load_seconds.observe(time.perf_counter() - started)
+        self.add(model_id, model, size)
+        return model
+
+    def add(self, model_id, model, size):
+        """Holds a model loaded beforehand, e.g. to warm up a replica with."""
+        if model_id in self._models:
+            replaced, replaced_size = self._models[model_id]
+            self.bytes -= replaced_size
+            if replaced is not model and self.on_evict is not None:
+                self.on_evict(replaced)
+        self._models[model_id] = (model, size)
+        self._models.move_to_end(model_id)
+        self.bytes += size
+        while self.bytes > self.max_bytes and len(self._models) > 1:
+            _, (evicted, evicted_size) = self._models.popitem(last=False)
+            self.bytes -= evicted_size
+            if self.on_evict is not None:
+                self.on_evict(evicted)
+            if self._evictions is not None:
+                self._evictions.inc()
+        if self._held_bytes is not None:
+            self._held_bytes.set(self.bytes)
+
+    def _count(self, result):
+        if self._requests is not None:
+            self._requests.inc(tags={"result": result})
@@ -0,0 +1,280 @@
+"""
+In-place swaps of a Serve replica's model for its new versions, without
+restarting the replica or dropping any of its requests.
+
+    swapper = HotSwapper(source.latest, load, prepare, current=load(version))
+    swapper.start()
+    with swapper.use() as generation:
+        predictions = await generation.batcher.submit(rows)
+
+The replica's model is double-buffered. A thread polls source.latest() every
+interval_s for the version the model should be at. When it changes, the
+thread loads that version into a second Generation with load(version) and
+warms it up with prepare(generation), while the requests are still served
+by the current one. Once both passed, new requests are switched over to the
+new generation at once. The previous one is closed, freeing its model, once
+the requests that got it have drained, or after drain_timeout_s, its batcher
+still answering the rows it was given before it stops. A version
+whose load or warm-up fails is logged and counted, the current generation
+keeps serving, and it is tried again at the next poll.
+
+Sources of versions:
+
+    FileSource     the artifact at a path, versioned by its mtime, for models
+                   written to a volume in place
+    MlflowSource   the latest version of a registered model in a stage of the
+                   MLflow model registry, e.g. Production, whose artifacts are
+                   the directory export_model() writes, see src/compiled.py
+
+The latencies the replica observe()s while a swap is under way, from the
+start of the load until the previous generation is drained, are exported as
+their p99 once it is over.
+
+This module needs numpy, and MLflow for MlflowSource.
+"""
+
+import contextlib
+import functools
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+# latencies kept for the p99 of a swap, at most
+MAX_SWAP_LATENCIES = 100_000
+
+logger = logging.getLogger(__name__)
+
+
+class Generation:
+    """A version of the model and its batcher, with the requests using it."""
+
+    def __init__(self, model, version, batcher=None, on_close=None):
+        self.model = model
+        self.version = version
+        self.n_features = getattr(model, "n_features_in_", None)
+        self.batcher = batcher
+        self.in_flight = 0
+        self._on_close = on_close
+
+    def close(self):
+        """Lets go of the model, once no request is using it."""
+        if self.batcher is not None:
+            self.batcher.close()
+        if self._on_close is not None:
+            self._on_close()
+        self.model = self.batcher = None
+
+
+class FileSource:
+    """The versions of the model artifact at path, by its mtime."""
+
+    def __init__(self, path):
+        self.file = path
+
+    def latest(self):
+        return str(os.stat(self.file).st_mtime_ns)
+
+    def path(self, version):
+        return self.file
+
+    def store(self, version):
+        # on the volume of every node
+        return {}
+
+    def remove(self, version):
+        # written over in place, by the next version
+        pass
+
+
+def _download(name, version, tracking_uri, directory):
+    """Returns the model.joblib of a registered model's version."""
+    import mlflow
+
+    if tracking_uri:
+        mlflow.set_tracking_uri(tracking_uri)
+    local = mlflow.artifacts.download_artifacts(
+        artifact_uri=f"models:/{name}/{version}", dst_path=directory
+    )
+    return os.path.join(local, "model.joblib")
+
+
+class MlflowSource:
+    """
+    The versions of the registered model name in stage, downloaded into
+    directory. Its tracking server is tracking_uri, or MLFLOW_TRACKING_URI's.
+    """
+
+    def __init__(self, name, stage="Production", tracking_uri=None, directory=None):
+        self.name = name
+        self.stage = stage
+        self.tracking_uri = tracking_uri
+        self.directory = directory or tempfile.mkdtemp(prefix="models-")
+        self._downloads = {}
+
+    def latest(self):
+        from mlflow import MlflowClient
+
+        client = MlflowClient(tracking_uri=self.tracking_uri)
+        versions = client.get_latest_versions(self.name, stages=[self.stage])
+        return versions[0].version if versions else None
+
+    def path(self, version):
+        """Returns the model.joblib of version, downloaded."""
+        directory = tempfile.mkdtemp(
+            prefix=f"{self.name}-{version}-", dir=self.directory
+        )
+        self._downloads[str(version)] = directory
+        try:
+            return _download(self.name, version, self.tracking_uri, directory)
+        except Exception:
+            self.remove(version)
+            raise
+
+    def store(self, version):
+        """
+        The key and fetch of version for load_model(), as its downloads are
+        only on the nodes of the replicas that made them.
+        """
+        return {
+            "key": (f"mlflow:{self.name}", str(version)),
+            "fetch": functools.partial(
+                _download, self.name, version, self.tracking_uri
+            ),
+        }
+
+    def remove(self, version):
+        """Removes the download of version, once it is no longer served."""
+        directory = self._downloads.pop(str(version), None)
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+class HotSwapper:
+    """
+    Serves the Generation current until latest() returns another version,
+    then swaps it for the one load() returns once prepare() passes.
+
+    The metrics, if given, are a counter of swaps with a result tag of
+    swapped or failed, and gauges of the seconds the last swap took and of
+    the p99 of the latencies observed during it, with Ray's inc() and set().
+    """
+
+    def __init__(
+        self,
+        latest,
+        load,
+        prepare,
+        current,
+        interval_s=30.0,
+        drain_timeout_s=60.0,
+        swaps=None,
+        swap_seconds=None,
+        swap_p99_ms=None,
+    ):
+        self.latest = latest
+        self.load = load
+        self.prepare = prepare
+        self.current = current
+        self.interval = interval_s
+        self.drain_timeout = drain_timeout_s
+        self._swaps = swaps
+        self._swap_seconds = swap_seconds
+        self._swap_p99_ms = swap_p99_ms
+        self._latencies = None
+        # so that no request takes the previous generation once it drains
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Polls for new versions in a thread, unless interval_s is 0."""
+        if self.interval and self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="model-swap", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    @contextlib.contextmanager
+    def use(self):
+        """The generation to serve a request with, until it has been served."""
+        with self._lock:
+            generation = self.current
+            generation.in_flight += 1
+        try:
+            yield generation
+        finally:
+            with self._lock:
+                generation.in_flight -= 1
+
+    def observe(self, latency_ms):
+        """Records the latency of a request, if a swap is under way."""
+        latencies = self._latencies
+        if latencies is not None and len(latencies) < MAX_SWAP_LATENCIES:
+            latencies.append(latency_ms)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Checking for a new model version failed")
+
+    def check(self):
+        """Swaps the current generation for the latest version, if another."""
+        version = self.latest()
+        if version is None or version == self.current.version:
+            return False
+        return self.swap(version)
+
+    def swap(self, version):
+        """
+        Loads and prepares version, then swaps the current generation for it
+        and closes the previous one once drained. Returns whether it did.
+        """
+        started = time.perf_counter()
+        self._latencies = []
+        try:
+            generation = None
+            try:
+                generation = self.load(version)
+                self.prepare(generation)
+            except Exception:
+                logger.exception("Not swapping in model version %s", version)
+                if generation is not None:
+                    generation.close()
+                self._count("failed")
+                return False
+
+            with self._lock:
+                previous, self.current = self.current, generation
+            logger.info("Swapped model version %s for %s", previous.version, version)
+            deadline = time.monotonic() + self.drain_timeout
+            while previous.in_flight and time.monotonic() < deadline:
+                time.sleep(0.05)
+            if previous.in_flight:
+                logger.warning(
+                    "Closing model version %s with %d requests still using it",
+                    previous.version,
+                    previous.in_flight,
+                )
+            previous.close()
+            self._count("swapped")
+            return True
+        finally:
+            latencies, self._latencies = self._latencies, None
+            if self._swap_seconds is not None:
+                self._swap_seconds.set(time.perf_counter() - started)
+            if latencies and self._swap_p99_ms is not None:
+                self._swap_p99_ms.set(float(np.percentile(latencies, 99)))
+
+    def _count(self, result):
+        if self._swaps is not None:
+            self._swaps.inc(tags={"result": result})
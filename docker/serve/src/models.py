@@ -0,0 +1,136 @@
+"""
+Loading of models shared by the Serve replicas of a node.
+
+Each replica loading its own copy of a model multiplies its memory by the
+replicas per node, and has every scale-up read the artifact again. With
+load_model() the replicas of a node share one read-only copy of the model's
+numpy arrays instead, by one of:
+
+    object-store  the model is loaded once per Ray cluster, by the ModelStore
+                  actor, and put into the object store. Replicas get it from
+                  their node's shared memory object store, their numpy arrays
+                  mapping its copy rather than copies of their own.
+    mmap          the arrays of a model saved uncompressed with joblib.dump
+                  are memory-mapped from the file, and so shared through the
+                  node's page cache.
+    none          every replica loads a copy of its own.
+
+Only the numpy arrays of a model are shared, e.g. the coefficients of linear
+models or the samples of nearest neighbours. Models that copy their arrays
+into structures of their own when unpickled, like scikit-learn's and
+XGBoost's trees, take the memory of a copy per replica either way, but are
+still read from the artifact only once per cluster with object-store.
+
+Models downloaded by the replicas, e.g. from the MLflow model registry, are
+only on the replicas' nodes. The ModelStore holds them by a key of their own,
+the model and its version, and fetch()es them itself.
+
+memory_usage() reports the memory of the replica, of which pss is its fair
+share of the pages it shares with other processes.
+"""
+
+import os
+import tempfile
+import time
+
+SHARING = ("object-store", "mmap", "none")
+
+# namespace and name of the ModelStore actor
+STORE_NAMESPACE = "serve"
+STORE_NAME = "model-store"
+
+# fields of /proc/<pid>/smaps_rollup, in kB, summed into memory_usage()
+_SMAPS_FIELDS = {
+    "Rss": "rss",
+    "Pss": "pss",
+    "Shared_Clean": "shared",
+    "Shared_Dirty": "shared",
+}
+
+
+def _load(path, mmap=False):
+    import joblib
+
+    return joblib.load(path, mmap_mode="r" if mmap else None)
+
+
+def _model_store():
+    import ray
+
+    @ray.remote(num_cpus=0)
+    class ModelStore:
+        """Holds the object store copy of every model loaded."""
+
+        def __init__(self):
+            self.models = {}
+
+        def get(self, path, key=None, fetch=None):
+            key = key or (path, artifact_version(path))
+            if key not in self.models:
+                # only the latest version of a model, the replicas still using
+                # an older one hold references of their own
+                for old in [k for k in self.models if k[0] == key[0]]:
+                    del self.models[old]
+                if fetch is None:
+                    model = _load(path)
+                else:
+                    with tempfile.TemporaryDirectory() as directory:
+                        model = _load(fetch(directory))
+                self.models[key] = ray.put(model)
+            # in a list, so that the reference rather than the model is returned
+            return [self.models[key]]
+
+    return ModelStore.options(
+        name=STORE_NAME,
+        namespace=STORE_NAMESPACE,
+        lifetime="detached",
+        get_if_exists=True,
+    ).remote()
+
+
+def artifact_version(path):
+    """
+    Returns the version of the model artifact at path, which changes when a
+    new one is written to the same path.
+    """
+    return str(os.stat(path).st_mtime_ns)
+
+
+def load_model(path, sharing="object-store", key=None, fetch=None):
+    """
+    Returns the model saved with joblib at path, shared with the other
+    replicas of the node as sharing says, and the seconds it took to load.
+
+    Where path is only on the replica's node, key is the (model, version) the
+    ModelStore holds it by, and fetch(directory) returns the path of a copy
+    of it downloaded into directory.
+    """
+    if sharing not in SHARING:
+        raise ValueError(f"sharing must be one of {', '.join(SHARING)}, not {sharing}")
+    started = time.perf_counter()
+    if sharing == "object-store":
+        import ray
+
+        [ref] = ray.get(_model_store().get.remote(path, key, fetch))
+        model = ray.get(ref)
+    else:
+        model = _load(path, mmap=sharing == "mmap")
+    return model, time.perf_counter() - started
+
+
+def memory_usage(pid="self"):
+    """
+    Returns the rss, pss and shared bytes of a process, None where the kernel
+    does not report them.
+    """
+    usage = {"rss": None, "pss": None, "shared": None}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as rollup:
+            for line in rollup:
+                name, _, value = line.partition(":")
+                key = _SMAPS_FIELDS.get(name)
+                if key is not None:
+                    usage[key] = (usage[key] or 0) + int(value.split()[0]) * 1024
+    except OSError:
+        pass
+    return usage
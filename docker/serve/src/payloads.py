@@ -0,0 +1,207 @@
+"""
+Encodings of the rows of prediction requests and of their predictions.
+
+/predict of src/serve.py answers in the encoding of the request, by its
+Content-Type:
+
+    application/json                     {"rows": [[...], ...]} and
+                                         {"predictions": [...]}, for small calls
+    application/x-numpy                  the raw buffer of a C-ordered array,
+                                         with its shape ("10000,12") and numpy
+                                         dtype ("<f4") in the X-Shape and
+                                         X-Dtype headers. Rows are numeric,
+                                         predictions may also be booleans or
+                                         fixed-width strings ("<U8")
+    application/vnd.apache.arrow.stream  an Arrow IPC stream of record batches
+                                         with a numeric column per feature, and
+                                         a prediction column
+
+The binary encodings are decoded into arrays without a Python object per row
+or value: numpy buffers are used in place, and Arrow columns are copied once
+into a 2-d array. Clients encode their rows with encode_rows() and decode the
+predictions with decode_predictions():
+
+    body, headers = encode_rows(NUMPY, rows)
+    response = requests.post(url, data=body, headers=headers)
+    predictions = decode_predictions(
+        response.headers["content-type"], response.headers, response.content
+    )
+
+pyarrow is only needed for Arrow.
+"""
+
+import json
+
+import numpy as np
+
+JSON = "application/json"
+NUMPY = "application/x-numpy"
+ARROW = "application/vnd.apache.arrow.stream"
+MEDIA_TYPES = (JSON, NUMPY, ARROW)
+
+SHAPE_HEADER = "x-shape"
+DTYPE_HEADER = "x-dtype"
+
+# integers, unsigned integers and floats
+_NUMERIC_KINDS = "iuf"
+# and booleans and strings, e.g. the labels of a classifier
+_PREDICTION_KINDS = "iufbU"
+
+
+class PayloadError(ValueError):
+    """A request body that is not rows in the encoding it claims."""
+
+
+class UnsupportedMediaType(PayloadError):
+    """A request body in none of MEDIA_TYPES."""
+
+
+def media_type(content_type):
+    """Returns the media type of a Content-Type header, JSON if there is none."""
+    media = (content_type or "").split(";")[0].strip().lower()
+    if not media:
+        return JSON
+    if media not in MEDIA_TYPES:
+        raise UnsupportedMediaType(
+            f"Content-Type must be one of {', '.join(MEDIA_TYPES)}, not {media}"
+        )
+    return media
+
+
+def _header(headers, name):
+    # HTTP headers are case insensitive, plain dicts are not
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _numpy_array(headers, body, kinds=_NUMERIC_KINDS):
+    try:
+        dtype = np.dtype(_header(headers, DTYPE_HEADER) or "<f8")
+        shape = tuple(int(n) for n in _header(headers, SHAPE_HEADER).split(","))
+    except (AttributeError, TypeError, ValueError):
+        raise PayloadError(
+            f"{NUMPY} needs the array's shape, e.g. 10000,12, in {SHAPE_HEADER} "
+            f"and its dtype, e.g. <f8, in {DTYPE_HEADER}"
+        ) from None
+    if dtype.kind not in kinds:
+        raise PayloadError(f"dtype must be {_kinds(kinds)}, not {dtype.str}")
+    if any(n < 0 for n in shape) or len(body) != dtype.itemsize * int(np.prod(shape)):
+        raise PayloadError(
+            f"{len(body)} bytes are not an array of shape {shape} and dtype {dtype.str}"
+        )
+    return np.frombuffer(body, dtype=dtype).reshape(shape)
+
+
+def _kinds(kinds):
+    return "numeric" if kinds == _NUMERIC_KINDS else "numeric, boolean or strings"
+
+
+def _arrow_table(body):
+    import pyarrow as pa
+
+    try:
+        return pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+    except pa.ArrowInvalid as error:
+        raise PayloadError(f"not an Arrow IPC stream: {error}") from None
+
+
+def _arrow_bytes(table):
+    import pyarrow as pa
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def decode_rows(content_type, headers, body):
+    """Returns the rows of a request body as a 2-d array."""
+    media = media_type(content_type)
+    if media == JSON:
+        try:
+            rows = np.asarray(json.loads(body)["rows"], dtype=np.float64)
+        except (KeyError, TypeError, ValueError):
+            raise PayloadError('JSON bodies must be {"rows": [[...], ...]}') from None
+    elif media == NUMPY:
+        rows = _numpy_array(headers, body)
+    else:
+        table = _arrow_table(body)
+        columns = []
+        for field, column in zip(table.schema, table.columns):
+            if column.null_count:
+                raise PayloadError(f"column {field.name} has nulls")
+            values = column.to_numpy()
+            if values.dtype.kind not in _NUMERIC_KINDS:
+                raise PayloadError(f"column {field.name} is not numeric")
+            columns.append(values)
+        rows = np.column_stack(columns) if columns else np.empty((0, 0))
+    if rows.ndim == 1:
+        rows = rows.reshape(1, -1)
+    if rows.ndim != 2 or len(rows) == 0:
+        raise PayloadError("rows must be a non-empty 2-d array of rows")
+    return rows
+
+
+def encode_predictions(media, predictions):
+    """Returns the body and headers of predictions in a media type."""
+    predictions = np.asarray(predictions)
+    if media == JSON:
+        body = json.dumps({"predictions": predictions.tolist()}).encode()
+        return body, {"content-type": JSON}
+    if media == NUMPY:
+        return _numpy_bytes(predictions, _PREDICTION_KINDS)
+    import pyarrow as pa
+
+    if predictions.ndim == 1:
+        columns = {"prediction": predictions}
+    else:
+        # e.g. the probabilities of each class
+        columns = {
+            f"prediction_{i}": predictions[:, i] for i in range(predictions.shape[1])
+        }
+    return _arrow_bytes(pa.table(columns)), {"content-type": ARROW}
+
+
+def _numpy_bytes(array, kinds=_NUMERIC_KINDS):
+    if array.dtype.kind == "O" and all(isinstance(v, str) for v in array.flat):
+        # string labels, e.g. of classifiers fitted on pandas columns, as
+        # fixed-width strings rather than pointers to Python objects
+        array = array.astype(str)
+    if array.dtype.kind not in kinds:
+        raise PayloadError(
+            f"{NUMPY} arrays must be {_kinds(kinds)}, not {array.dtype.str}"
+        )
+    array = np.ascontiguousarray(array)
+    headers = {
+        "content-type": NUMPY,
+        SHAPE_HEADER: ",".join(str(n) for n in array.shape),
+        DTYPE_HEADER: array.dtype.str,
+    }
+    return array.tobytes(), headers
+
+
+def encode_rows(media, rows):
+    """Returns the body and headers of a request for rows in a media type."""
+    rows = np.asarray(rows)
+    if media == JSON:
+        return json.dumps({"rows": rows.tolist()}).encode(), {"content-type": JSON}
+    if media == NUMPY:
+        return _numpy_bytes(rows)
+    import pyarrow as pa
+
+    columns = {f"f{i}": rows[:, i] for i in range(rows.shape[1])}
+    return _arrow_bytes(pa.table(columns)), {"content-type": ARROW}
+
+
+def decode_predictions(content_type, headers, body):
+    """Returns the predictions of a response body as an array."""
+    media = media_type(content_type)
+    if media == JSON:
+        return np.asarray(json.loads(body)["predictions"])
+    if media == NUMPY:
+        return _numpy_array(headers, body, _PREDICTION_KINDS)
+    table = _arrow_table(body)
+    columns = [column.to_numpy() for column in table.columns]
+    return columns[0] if len(columns) == 1 else np.column_stack(columns)
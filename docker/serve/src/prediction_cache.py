@@ -0,0 +1,227 @@
+"""
+Cache of the predictions of the rows of requests, so that retries, polling
+dashboards and batch jobs re-scoring the same rows are not predicted again.
+
+    cache = PredictionCache(max_bytes=256 * 2**20, ttl_s=300)
+    predictions = await cache.get_or_compute(
+        model, version, input_key(rows), lambda: batcher.submit(rows)
+    )
+
+Predictions are cached by the model, its version and input_key(), a hash of
+the rows' values and shape. They expire ttl_s after being predicted, and the
+least recently used are evicted beyond max_bytes of predictions. A model
+swapped for a new version is never answered for from the old one's, while
+replicas still serving the old one, e.g. sharing a cluster-wide cache, keep
+theirs. The predictions of versions no longer served are then the least
+recently used, evicted first, and dropped where found expired.
+
+Concurrent gets of the same rows are coalesced: the first predicts them, the
+others wait for its predictions. A failed prediction is not cached, and
+its waiters predict the rows themselves.
+
+The cache is per replica, or cluster-wide with SharedPredictionCache, whose
+PredictionCacheActor holds the predictions of all replicas and coalesces
+their gets too. It costs a call to the actor per request, which pays off for
+models slower to predict than that.
+
+The predictions returned are those cached, callers must not modify them. This
+module only needs numpy, and Ray for SharedPredictionCache.
+"""
+
+import asyncio
+import collections
+import hashlib
+import time
+
+import numpy as np
+
+# namespace and name of the PredictionCacheActor
+ACTOR_NAMESPACE = "serve"
+ACTOR_NAME = "prediction-cache"
+
+HIT = "hit"
+MISS = "miss"
+COALESCED = "coalesced"
+
+# passed to the waiters of predictions given up on
+_RELEASED = object()
+
+
+def input_key(rows):
+    """
+    Returns the hash of the values and shape of rows, the same for equal
+    rows of any numeric dtype or memory layout.
+    """
+    # float64 in C order, and + 0.0 turns -0.0 into 0.0
+    rows = np.ascontiguousarray(rows, dtype=np.float64) + 0.0
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr(rows.shape).encode())
+    digest.update(rows.data)
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    """
+    Predictions by model, version and input key, for ttl_s and up to
+    max_bytes, the nbytes of their arrays.
+
+    requests and evictions, if given, are counters with Ray's inc(), of gets
+    with a result tag of hit, miss or coalesced, and of evicted predictions.
+    """
+
+    def __init__(
+        self, max_bytes=256 * 2**20, ttl_s=300.0, requests=None, evictions=None
+    ):
+        self.max_bytes = max_bytes
+        self.ttl = ttl_s
+        self.bytes = 0
+        self._entries = collections.OrderedDict()
+        self._computing = {}
+        self._requests = requests
+        self._evictions = evictions
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get_or_compute(self, model, version, key, compute):
+        """
+        Returns the cached predictions of key, or those of the coroutine
+        function compute, which it caches.
+        """
+        result, value = await self.claim(model, version, key)
+        self._count(result)
+        if result != MISS:
+            return value
+        try:
+            value = await compute()
+        except BaseException:
+            self.release(model, version, key)
+            raise
+        self.put(model, version, key, value)
+        return value
+
+    async def claim(self, model, version, key, timeout=None):
+        """
+        Returns hit or coalesced and the predictions of key, or miss and None
+        when the caller is to predict them and put() or release() them. Gets
+        waiting longer than timeout for another caller's predictions predict
+        them themselves.
+        """
+        entry = self._entries.get((model, version, key))
+        if entry is not None:
+            expires, value, _ = entry
+            if expires > time.monotonic():
+                self._entries.move_to_end((model, version, key))
+                return HIT, value
+            self._remove((model, version, key))
+
+        computing = self._computing.get((model, version, key))
+        if computing is None:
+            self._computing[(model, version, key)] = (
+                asyncio.get_running_loop().create_future()
+            )
+            return MISS, None
+        try:
+            value = await asyncio.wait_for(asyncio.shield(computing), timeout)
+        except asyncio.TimeoutError:
+            return MISS, None
+        if value is _RELEASED:
+            return MISS, None
+        return COALESCED, value
+
+    def put(self, model, version, key, value):
+        """Caches the predictions of key and passes them to its waiters."""
+        computing = self._computing.pop((model, version, key), None)
+        if computing is not None and not computing.done():
+            computing.set_result(value)
+        # a copy, as the predictions of a request are a view of those of its
+        # whole batch, which would otherwise be kept alive
+        value = np.array(value)
+        size = value.nbytes
+        if size > self.max_bytes:
+            return
+        if (model, version, key) in self._entries:
+            self._remove((model, version, key))
+        now = time.monotonic()
+        self._entries[(model, version, key)] = (now + self.ttl, value, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            expires = self._entries[oldest][0]
+            self._remove(oldest)
+            # expired predictions are dropped rather than evicted
+            if expires > now and self._evictions is not None:
+                self._evictions.inc()
+
+    def release(self, model, version, key):
+        """Gives up predicting key, leaving it to its waiters."""
+        computing = self._computing.pop((model, version, key), None)
+        if computing is not None and not computing.done():
+            computing.set_result(_RELEASED)
+
+    def _remove(self, entry):
+        _, _, size = self._entries.pop(entry)
+        self.bytes -= size
+
+    def _count(self, result):
+        if self._requests is not None:
+            self._requests.inc(tags={"result": result})
+
+
+def _actor(max_bytes, ttl_s):
+    import ray
+
+    @ray.remote(num_cpus=0)
+    class PredictionCacheActor:
+        """The cluster-wide predictions of SharedPredictionCache."""
+
+        def __init__(self):
+            self.cache = PredictionCache(max_bytes=max_bytes, ttl_s=ttl_s)
+
+        async def claim(self, model, version, key, timeout):
+            return await self.cache.claim(model, version, key, timeout)
+
+        def put(self, model, version, key, value):
+            self.cache.put(model, version, key, value)
+
+        def release(self, model, version, key):
+            self.cache.release(model, version, key)
+
+    return PredictionCacheActor.options(
+        name=ACTOR_NAME,
+        namespace=ACTOR_NAMESPACE,
+        lifetime="detached",
+        get_if_exists=True,
+        # coalesced gets wait in the actor, while others are answered
+        max_concurrency=1000,
+    ).remote()
+
+
+class SharedPredictionCache:
+    """
+    The predictions of all replicas, held by the PredictionCacheActor, with
+    the get_or_compute() of PredictionCache. The actor's size and TTL are
+    those of the replica creating it.
+
+    Gets wait at most wait_s for the predictions of another replica, which
+    may have gone away while predicting them.
+    """
+
+    def __init__(self, max_bytes=256 * 2**20, ttl_s=300.0, wait_s=10.0, requests=None):
+        self.actor = _actor(max_bytes, ttl_s)
+        self.wait = wait_s
+        self._requests = requests
+
+    async def get_or_compute(self, model, version, key, compute):
+        result, value = await self.actor.claim.remote(model, version, key, self.wait)
+        if self._requests is not None:
+            self._requests.inc(tags={"result": result})
+        if result != MISS:
+            return value
+        try:
+            value = await compute()
+        except BaseException:
+            self.actor.release.remote(model, version, key)
+            raise
+        self.actor.put.remote(model, version, key, value)
+        return value
@@ -0,0 +1,751 @@
+"""
+Ray Serve application of the serve image.
+
+    python -m src.serve  # serves the model of MODEL_PATH on port 8000
+
+or, with the application builder, from a RayService or `serve run`:
+
+    import_path: src.serve:build_app
+    args: {model_path: /models/model.joblib, max_batch_size: 256}
+
+POST /predict takes {"rows": [[...], ...]} and returns {"predictions": [...]},
+one per row. Bulk clients send the rows as a raw numpy buffer or Arrow record
+batches instead, and get the predictions back in the same encoding, see
+src/payloads.py. Other Content-Types are refused with a 415, rows that are
+not what they claim with a 422, and predictions without an encoding in that
+of their request with a 406.
+
+The rows of concurrent requests are predicted together in batches, see
+src/batching.py, whose sizes and waits are exported as the
+ray_predictor_batch_size and ray_predictor_batch_wait_ms histograms.
+
+The replicas of a node share one copy of the model's arrays, as model_sharing
+says, see src/models.py. Each exports the seconds its model took to load as
+ray_predictor_model_load_seconds and its memory, refreshed with every health
+check, as ray_predictor_replica_memory_bytes by kind: rss, pss, its share of
+the pages it shares, and shared.
+
+build_multi_model_app serves the models of MODEL_ROOT, <model_id>.joblib, by
+multiplexing them onto the same replicas: POST /predict with the
+serve_multiplexed_model_id header set to a model ID. Serve routes a request
+to a replica that recently served its model where there is one, and each
+replica holds the models it loaded in an LRU cache within
+max_model_cache_bytes, see src/model_cache.py, each taking what the
+replica's memory grew by when it was loaded, at least its artifact's size.
+The cache exports ray_predictor_model_cache_requests_total by result, hit or
+miss, once per request, ray_predictor_model_cache_evictions_total, the
+ray_predictor_model_cache_load_seconds histogram and the bytes it holds as
+ray_predictor_model_cache_bytes.
+
+Where a tree ensemble was compiled next to its dump, see src/compiled.py,
+replicas load the compiled model instead, and the dump where it cannot be
+loaded. Their native libraries are shared by the replicas of a
+node through the page cache, whatever model_sharing says.
+
+Replicas warm up before Serve routes them requests, see src/warmup.py:
+synthetic batches, of 1 row doubling up to max_batch_size, warmup_rounds
+times, through the model, or each of the warmup_models of the multiplexed
+deployment, and through every encoding of /predict. Each exports the seconds
+that took as ray_predictor_warmup_seconds and the latency of the first
+request it answered after as ray_predictor_first_request_seconds.
+
+Replicas admit at most max_in_flight requests at once and queue up to
+max_queued more, as admission says, see src/admission.py: by priority class,
+of the X-Priority-Class header, interactive by default or batch, and shedding
+those that could not be answered within their class's deadline, or the
+X-Request-Budget-Ms header's, with a 503 and Retry-After. Batch requests
+queued give way to interactive ones with a 429. The requests shed are
+counted by reason and priority_class as
+ray_predictor_shed_requests_total, and those queued exported as
+ray_predictor_admission_queued_requests.
+
+Predictor swaps its model for new versions without a restart, see
+src/model_swap.py: every swap_interval_s, 0 for never, each replica checks
+model_source for the version to serve, {"registry": "file"} the mtime of
+model_path's artifact, or {"registry": "mlflow", "name": ..., "stage":
+"Production"} the latest version of a registered model in that stage of the
+MLflow model registry. It loads and warms up a new one next to the one it
+serves, switches requests over to it once warm, and frees the previous one
+once its requests drained, or after drain_timeout_s. Swaps are counted by
+result, swapped or failed, as ray_predictor_model_swaps_total, and the
+seconds the last one took and the p99 latency of the requests during it
+exported as ray_predictor_model_swap_seconds and
+ray_predictor_model_swap_p99_latency_ms.
+
+Both cache predictions, by model version and a hash of the rows, as
+prediction_cache says, see src/prediction_cache.py: {"scope": "replica"} per
+replica, "cluster" for all replicas, or "none", and its max_bytes and ttl_s.
+Its gets are counted by result, hit, miss or coalesced with a concurrent get
+of the same rows, as ray_predictor_prediction_cache_requests_total.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+
+from fastapi import FastAPI, HTTPException, Request, Response
+from ray import serve
+from ray.serve import metrics
+
+from .admission import AdmissionController, Rejected
+from .batching import MicroBatcher
+from .compiled import load_compiled
+from .model_cache import ModelCache
+from .model_swap import FileSource, Generation, HotSwapper, MlflowSource
+from .models import artifact_version, load_model, memory_usage
+from .payloads import (
+    MEDIA_TYPES,
+    PayloadError,
+    UnsupportedMediaType,
+    decode_rows,
+    encode_predictions,
+    encode_rows,
+    media_type,
+)
+from .prediction_cache import PredictionCache, SharedPredictionCache, input_key
+from .tracing import extract, setup_tracing, span
+from .warmup import FirstRequest, warm_up
+
+MODEL_PATH = os.environ.get("MODEL_PATH", "/app/models/model.joblib")
+MODEL_SHARING = os.environ.get("MODEL_SHARING", "object-store")
+MODEL_ROOT = os.environ.get("MODEL_ROOT", "/app/models")
+# models, the most recently used, whose requests Serve's router routes to a
+# replica, fixed when the deployment is defined. The models themselves are
+# held as long as they fit into max_model_cache_bytes.
+MAX_MODELS_PER_REPLICA = int(os.environ.get("MAX_MODELS_PER_REPLICA", 32))
+MODEL_ID = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]*")
+PRIORITY_CLASS_HEADER = "x-priority-class"
+BUDGET_HEADER = "x-request-budget-ms"
+
+BATCH_SIZE_BOUNDARIES = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024]
+BATCH_WAIT_MS_BOUNDARIES = [0.1, 0.5, 1, 2, 5, 10, 20, 50, 100]
+MODEL_LOAD_SECONDS_BOUNDARIES = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+logger = logging.getLogger("ray.serve")
+
+app = FastAPI(title="ML Platform Serve")
+multi_model_app = FastAPI(title="ML Platform Serve, multiplexed")
+
+
+_batch_sizes = None
+_batch_waits = None
+
+
+def _batcher(model, max_batch_size, max_wait_ms):
+    """Returns a MicroBatcher of the predictions of model."""
+    global _batch_sizes, _batch_waits
+    if _batch_sizes is None:
+        _batch_sizes = metrics.Histogram(
+            "predictor_batch_size",
+            description="Rows per batch predicted by the model.",
+            boundaries=BATCH_SIZE_BOUNDARIES,
+        )
+        _batch_waits = metrics.Histogram(
+            "predictor_batch_wait_ms",
+            description="Time requests waited for their batch to start.",
+            boundaries=BATCH_WAIT_MS_BOUNDARIES,
+        )
+
+    def predict(rows):
+        # a span of its own rather than in the trace of one of the requests,
+        # as a batch serves several
+        with span("predict.batch", attributes={"batch.rows": len(rows)}):
+            return model.predict(rows)
+
+    return MicroBatcher(
+        predict,
+        max_batch_size=max_batch_size,
+        max_wait_ms=max_wait_ms,
+        batch_size=_batch_sizes,
+        wait_ms=_batch_waits,
+    )
+
+
+_prediction_cache_requests = None
+
+
+def _prediction_cache(config):
+    """Returns the prediction cache of a prediction_cache config, or None."""
+    global _prediction_cache_requests
+    config = dict(config or {})
+    scope = config.pop("scope", "replica")
+    if scope == "none":
+        return None
+    if _prediction_cache_requests is None:
+        _prediction_cache_requests = metrics.Counter(
+            "predictor_prediction_cache_requests",
+            description="Predictions looked up in the prediction cache, by result.",
+            tag_keys=("result",),
+        )
+    if scope == "replica":
+        return PredictionCache(requests=_prediction_cache_requests, **config)
+    if scope == "cluster":
+        return SharedPredictionCache(requests=_prediction_cache_requests, **config)
+    raise ValueError(
+        f"prediction_cache scope must be replica, cluster or none, not {scope}"
+    )
+
+
+def _load_model(path, sharing, **store):
+    """
+    Returns the compiled model of path where there is one to load, else the
+    model, and the seconds it took to load. store are the key and fetch of
+    load_model().
+    """
+    started = time.perf_counter()
+    model = load_compiled(path)
+    if model is not None:
+        return model, time.perf_counter() - started
+    return load_model(path, sharing=sharing, **store)
+
+
+def _round_trip(rows, predictions):
+    # what /predict does besides predicting, in every encoding
+    input_key(rows)
+    for media in MEDIA_TYPES:
+        body, headers = encode_rows(media, rows)
+        decode_rows(media, headers, body)
+        encode_predictions(media, predictions)
+
+
+def _warm_up(models, max_batch_size, rounds):
+    """
+    Warms the replica up with synthetic batches through models, exporting
+    the seconds it took. Returns them and the recorder of the latency of the
+    first request.
+    """
+    started = time.perf_counter()
+    for model in models:
+        warm_up(
+            model.predict,
+            getattr(model, "n_features_in_", None),
+            max_batch_size,
+            rounds=rounds,
+            steps=[_round_trip],
+        )
+    seconds = time.perf_counter() - started
+    metrics.Gauge(
+        "predictor_warmup_seconds",
+        description="Seconds the replica took to warm up before taking requests.",
+    ).set(seconds)
+    logger.info("Warmed up %d models in %.2fs", len(models), seconds)
+    first_request = FirstRequest(
+        metrics.Gauge(
+            "predictor_first_request_seconds",
+            description="Seconds the replica took to answer its first request.",
+        )
+    )
+    return seconds, first_request
+
+
+def _model_source(config, model_path):
+    """
+    Returns the source of the model's versions of a model_source config,
+    the artifact at model_path by default.
+    """
+    config = dict(config or {})
+    registry = config.pop("registry", "file")
+    if registry == "file":
+        return FileSource(config.get("path", model_path))
+    if registry == "mlflow":
+        return MlflowSource(**config)
+    raise ValueError(f"model_source registry must be file or mlflow, not {registry}")
+
+
+_model_swaps = None
+_swap_seconds = None
+_swap_p99_ms = None
+
+
+def _swapper(latest, load, prepare, current, interval_s, drain_timeout_s):
+    """Returns the HotSwapper of the replica's model, with its metrics."""
+    global _model_swaps, _swap_seconds, _swap_p99_ms
+    if _model_swaps is None:
+        _model_swaps = metrics.Counter(
+            "predictor_model_swaps",
+            description="Swaps of the replica's model for a new version, by result.",
+            tag_keys=("result",),
+        )
+        _swap_seconds = metrics.Gauge(
+            "predictor_model_swap_seconds",
+            description="Seconds the last swap took, from load to drained.",
+        )
+        _swap_p99_ms = metrics.Gauge(
+            "predictor_model_swap_p99_latency_ms",
+            description="p99 latency of the requests served during the last swap.",
+        )
+    return HotSwapper(
+        latest,
+        load,
+        prepare,
+        current,
+        interval_s=interval_s,
+        drain_timeout_s=drain_timeout_s,
+        swaps=_model_swaps,
+        swap_seconds=_swap_seconds,
+        swap_p99_ms=_swap_p99_ms,
+    )
+
+
+_shed_requests = None
+_queued_requests = None
+
+
+def _admission(config, max_batch_size):
+    """Returns the admission controller of an admission config."""
+    global _shed_requests, _queued_requests
+    if _shed_requests is None:
+        _shed_requests = metrics.Counter(
+            "predictor_shed_requests",
+            description="Requests shed by admission control, by reason.",
+            tag_keys=("reason", "priority_class"),
+        )
+        _queued_requests = metrics.Gauge(
+            "predictor_admission_queued_requests",
+            description="Requests queued for admission to the replica.",
+        )
+    config = {
+        "max_in_flight": 2 * max_batch_size,
+        "max_queued": 2 * max_batch_size,
+        **(config or {}),
+    }
+    return AdmissionController(shed=_shed_requests, queued=_queued_requests, **config)
+
+
+async def _admit(admission, request):
+    """
+    Returns the ticket of a request admitted, or fails it with a 503 or 429
+    when shed, and a 400 for unknown priority classes.
+    """
+    try:
+        budget_ms = request.headers.get(BUDGET_HEADER)
+        return await admission.acquire(
+            request.headers.get(PRIORITY_CLASS_HEADER),
+            None if budget_ms is None else float(budget_ms),
+        )
+    except Rejected as rejected:
+        raise HTTPException(
+            rejected.status,
+            str(rejected),
+            headers={"Retry-After": str(rejected.retry_after)},
+        ) from None
+    except ValueError as error:
+        raise HTTPException(400, str(error)) from None
+
+
+async def _predict(cache, model, version, batcher, rows):
+    """Returns the predictions of rows, from the cache if it has them."""
+    if cache is None:
+        return await batcher.submit(rows)
+    return await cache.get_or_compute(
+        model, version, input_key(rows), lambda: batcher.submit(rows)
+    )
+
+
+async def _rows(request):
+    """
+    Returns the media type and rows of a request, or fails it with a 415 or
+    a 422.
+    """
+    content_type = request.headers.get("content-type")
+    try:
+        media = media_type(content_type)
+        rows = decode_rows(media, request.headers, await request.body())
+    except UnsupportedMediaType as error:
+        raise HTTPException(415, str(error)) from None
+    except PayloadError as error:
+        raise HTTPException(422, str(error)) from None
+    return media, rows
+
+
+def _check_features(rows, n_features):
+    if n_features is not None and rows.shape[1] != n_features:
+        raise HTTPException(
+            422, f"rows must have {n_features} features, not {rows.shape[1]}"
+        )
+
+
+def _response(media, predictions):
+    """
+    Returns the predictions in the media type of their request, or fails it
+    with a 406 where they have no encoding in it.
+    """
+    try:
+        body, headers = encode_predictions(media, predictions)
+    except PayloadError as error:
+        raise HTTPException(406, str(error)) from None
+    return Response(body, media_type=headers.pop("content-type"), headers=headers)
+
+
+@serve.deployment
+@serve.ingress(app)
+class Predictor:
+    """Predicts the rows of requests with the model of model_path."""
+
+    def __init__(
+        self,
+        model_path=MODEL_PATH,
+        model_sharing=MODEL_SHARING,
+        max_batch_size=256,
+        max_wait_ms=5.0,
+        prediction_cache=None,
+        warmup_rounds=3,
+        admission=None,
+        model_source=None,
+        swap_interval_s=30.0,
+        drain_timeout_s=60.0,
+    ):
+        setup_tracing("serve")
+        context = serve.get_replica_context()
+        self.span_attributes = {
+            "serve.application": context.app_name,
+            "serve.deployment": context.deployment,
+        }
+        self.admission = _admission(admission, max_batch_size)
+        self.model_sharing = model_sharing
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.warmup_rounds = warmup_rounds
+        self.source = _model_source(model_source, model_path)
+        self.model_load_seconds = metrics.Gauge(
+            "predictor_model_load_seconds",
+            description="Seconds the replica took to load its model.",
+        )
+        self.memory = metrics.Gauge(
+            "predictor_replica_memory_bytes",
+            description="Memory of the replica, by rss, pss and shared.",
+            tag_keys=("kind",),
+        )
+        version = self.source.latest()
+        if version is None:
+            raise ValueError(f"no version of the model to serve in {model_source}")
+        generation = self._load_generation(version)
+        self.cache = _prediction_cache(prediction_cache)
+        self.swapper = _swapper(
+            self.source.latest,
+            self._load_generation,
+            self._prepare,
+            generation,
+            swap_interval_s,
+            drain_timeout_s,
+        )
+        self.check_health()
+        # last, as Serve routes requests to the replica once it returns
+        self.warmup_seconds, self.first_request = _warm_up(
+            [generation.model], max_batch_size, warmup_rounds
+        )
+        self.swapper.start()
+
+    def __del__(self):
+        self.swapper.stop()
+
+    def _load_generation(self, version):
+        """Returns the Generation of the model at version, loaded."""
+        path = self.source.path(version)
+        try:
+            model, load_seconds = _load_model(
+                path, self.model_sharing, **self.source.store(version)
+            )
+        except Exception:
+            self.source.remove(version)
+            raise
+        self.model_load_seconds.set(load_seconds)
+        logger.info(
+            "Loaded %s version %s, %s, in %.2fs with %s sharing",
+            path,
+            version,
+            type(model).__name__,
+            load_seconds,
+            self.model_sharing,
+        )
+        return Generation(
+            model,
+            version,
+            _batcher(model, self.max_batch_size, self.max_wait_ms),
+            on_close=lambda: self.source.remove(version),
+        )
+
+    def _prepare(self, generation):
+        # a version failing its warm-up is not swapped in
+        warm_up(
+            generation.model.predict,
+            generation.n_features,
+            self.max_batch_size,
+            rounds=self.warmup_rounds,
+            steps=[_round_trip],
+            strict=True,
+        )
+
+    def check_health(self):
+        # called by Serve every health check period, 10s by default
+        for kind, value in memory_usage().items():
+            if value is not None:
+                self.memory.set(value, tags={"kind": kind})
+
+    @app.get("/health")
+    def health(self):
+        return {
+            "status": "ok",
+            "model_version": self.swapper.current.version,
+            "warmup_seconds": self.warmup_seconds,
+        }
+
+    @app.post("/predict")
+    async def predict(self, request: Request):
+        started = time.perf_counter()
+        ticket = await _admit(self.admission, request)
+        try:
+            media, rows = await _rows(request)
+            with self.swapper.use() as generation:
+                _check_features(rows, generation.n_features)
+                with span(
+                    "predict",
+                    context=extract(request.headers),
+                    kind="server",
+                    attributes={
+                        **self.span_attributes,
+                        "rows": len(rows),
+                        "model.version": generation.version,
+                    },
+                ):
+                    predictions = await _predict(
+                        self.cache, "", generation.version, generation.batcher, rows
+                    )
+            response = _response(media, predictions)
+        finally:
+            self.admission.release(ticket)
+        seconds = time.perf_counter() - started
+        self.first_request.observe(seconds)
+        self.swapper.observe(1000 * seconds)
+        return response
+
+
+class _Served:
+    """A model of the multiplexed deployment, with its own batches."""
+
+    def __init__(self, model, version, batcher):
+        self.model = model
+        self.version = version
+        self.n_features = getattr(model, "n_features_in_", None)
+        self.batcher = batcher
+
+
+@serve.deployment
+@serve.ingress(multi_model_app)
+class MultiModelPredictor:
+    """Predicts the rows of requests with the model of their model ID."""
+
+    def __init__(
+        self,
+        model_root=MODEL_ROOT,
+        model_sharing="none",
+        max_model_cache_bytes=4 * 2**30,
+        max_batch_size=256,
+        max_wait_ms=5.0,
+        prediction_cache=None,
+        warmup_models=(),
+        warmup_rounds=3,
+        admission=None,
+    ):
+        setup_tracing("serve")
+        context = serve.get_replica_context()
+        self.span_attributes = {
+            "serve.application": context.app_name,
+            "serve.deployment": context.deployment,
+        }
+        self.admission = _admission(admission, max_batch_size)
+        self.model_root = model_root
+        self.model_sharing = model_sharing
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._load_lock = threading.Lock()
+        self.cache = ModelCache(
+            self._load,
+            max_bytes=max_model_cache_bytes,
+            requests=metrics.Counter(
+                "predictor_model_cache_requests",
+                description="Models looked up in the replica's cache, by result.",
+                tag_keys=("result",),
+            ),
+            evictions=metrics.Counter(
+                "predictor_model_cache_evictions",
+                description="Models evicted from the replica's cache.",
+            ),
+            load_seconds=metrics.Histogram(
+                "predictor_model_cache_load_seconds",
+                description="Seconds taken to load a model on a cache miss.",
+                boundaries=MODEL_LOAD_SECONDS_BOUNDARIES,
+            ),
+            held_bytes=metrics.Gauge(
+                "predictor_model_cache_bytes",
+                description="Bytes of the models held in the replica's cache.",
+            ),
+            # its batcher's worker holds on to the model until stopped
+            on_evict=lambda served: served.batcher.close(),
+        )
+        self.predictions = _prediction_cache(prediction_cache)
+        warm = []
+        for model_id in warmup_models:
+            try:
+                served, size = self._load(model_id)
+            except FileNotFoundError:
+                logger.warning("Not warming up model %s, it does not exist", model_id)
+                continue
+            self.cache.add(model_id, served, size)
+            warm.append(served.model)
+        self.warmup_seconds, self.first_request = _warm_up(
+            warm, max_batch_size, warmup_rounds
+        )
+
+    def _path(self, model_id):
+        return os.path.join(self.model_root, f"{model_id}.joblib")
+
+    def _load(self, model_id):
+        path = self._path(model_id)
+        version = artifact_version(path)
+        # one at a time, so that what the replica's memory grew by is the
+        # model's, as its own size is not known to Python
+        with self._load_lock:
+            before = memory_usage()["rss"]
+            model, seconds = _load_model(path, self.model_sharing)
+            after = memory_usage()["rss"]
+        size = os.path.getsize(path)
+        if before is not None and after is not None:
+            size = max(after - before, size)
+        logger.info(
+            "Loaded model %s, %s, of %d bytes in %.2fs",
+            model_id,
+            type(model).__name__,
+            size,
+            seconds,
+        )
+        batcher = _batcher(model, self.max_batch_size, self.max_wait_ms)
+        return _Served(model, version, batcher), size
+
+    @serve.multiplexed(max_num_models_per_replica=MAX_MODELS_PER_REPLICA)
+    async def get_model(self, model_id):
+        # Serve's router routes the requests for the models this returned
+        # last to this replica. It only returns the model ID, once it knows
+        # the model exists: the models are held by self.cache, within its
+        # memory budget, and looked up by predict() once per request.
+        artifact_version(self._path(model_id))
+        return model_id
+
+    @multi_model_app.get("/health")
+    def health(self):
+        return {
+            "status": "ok",
+            "models": len(self.cache),
+            "warmup_seconds": self.warmup_seconds,
+        }
+
+    @multi_model_app.post("/predict")
+    async def predict(self, request: Request):
+        started = time.perf_counter()
+        model_id = serve.get_multiplexed_model_id()
+        if not MODEL_ID.fullmatch(model_id or ""):
+            raise HTTPException(
+                400, "the serve_multiplexed_model_id header must be a model ID"
+            )
+        ticket = await _admit(self.admission, request)
+        try:
+            media, rows = await _rows(request)
+            with span(
+                "predict",
+                context=extract(request.headers),
+                kind="server",
+                attributes={**self.span_attributes, "model.id": model_id},
+            ):
+                try:
+                    await self.get_model(model_id)
+                    served = await self.cache.get(model_id)
+                except FileNotFoundError:
+                    raise HTTPException(404, f"no model {model_id}") from None
+                _check_features(rows, served.n_features)
+                predictions = await _predict(
+                    self.predictions, model_id, served.version, served.batcher, rows
+                )
+            response = _response(media, predictions)
+        finally:
+            self.admission.release(ticket)
+        self.first_request.observe(time.perf_counter() - started)
+        return response
+
+
+def _max_ongoing_requests(args, max_batch_size):
+    """
+    Returns the requests Serve is to send a replica at once: those its
+    admission runs, by default enough for a batch of single rows to fill up
+    while the one before is predicted, and those it queues.
+    """
+    if "max_ongoing_requests" in args:
+        return int(args["max_ongoing_requests"])
+    admission = args.get("admission") or {}
+    return int(admission.get("max_in_flight", 2 * max_batch_size)) + int(
+        admission.get("max_queued", 2 * max_batch_size)
+    )
+
+
+def build_app(args):
+    """
+    Returns the application for args, the model_path, model_sharing,
+    max_batch_size, max_wait_ms, prediction_cache, warmup_rounds, admission,
+    model_source, swap_interval_s and drain_timeout_s to serve with.
+    """
+    max_batch_size = int(args.get("max_batch_size", 256))
+    max_ongoing_requests = _max_ongoing_requests(args, max_batch_size)
+    return Predictor.options(max_ongoing_requests=max_ongoing_requests).bind(
+        model_path=args.get("model_path", MODEL_PATH),
+        model_sharing=args.get("model_sharing", MODEL_SHARING),
+        max_batch_size=max_batch_size,
+        max_wait_ms=float(args.get("max_wait_ms", 5.0)),
+        prediction_cache=args.get("prediction_cache"),
+        warmup_rounds=int(args.get("warmup_rounds", 3)),
+        admission=args.get("admission"),
+        model_source=args.get("model_source"),
+        swap_interval_s=float(args.get("swap_interval_s", 30.0)),
+        drain_timeout_s=float(args.get("drain_timeout_s", 60.0)),
+    )
+
+
+def build_multi_model_app(args):
+    """
+    Returns the multiplexed application for args, the model_root,
+    model_sharing, max_model_cache_bytes, max_batch_size, max_wait_ms,
+    prediction_cache, warmup_models, warmup_rounds and admission to serve
+    with.
+    """
+    max_batch_size = int(args.get("max_batch_size", 256))
+    max_ongoing_requests = _max_ongoing_requests(args, max_batch_size)
+    return MultiModelPredictor.options(max_ongoing_requests=max_ongoing_requests).bind(
+        model_root=args.get("model_root", MODEL_ROOT),
+        # each model version is held in the object store for as long as the
+        # cluster runs, too much for hundreds of them
+        model_sharing=args.get("model_sharing", "none"),
+        max_model_cache_bytes=int(args.get("max_model_cache_bytes", 4 * 2**30)),
+        max_batch_size=max_batch_size,
+        max_wait_ms=float(args.get("max_wait_ms", 5.0)),
+        prediction_cache=args.get("prediction_cache"),
+        warmup_models=args.get("warmup_models", []),
+        warmup_rounds=int(args.get("warmup_rounds", 3)),
+        admission=args.get("admission"),
+    )
+
+
+def main():
+    serve.start(http_options={"host": "0.0.0.0", "port": 8000})
+    serve.run(
+        build_app(
+            {
+                "max_batch_size": os.environ.get("MAX_BATCH_SIZE", 256),
+                "max_wait_ms": os.environ.get("MAX_WAIT_MS", 5.0),
+            }
+        ),
+        blocking=True,
+    )
+
+
+if __name__ == "__main__":
+    main()
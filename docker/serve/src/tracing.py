@@ -0,0 +1,85 @@
+"""
+OpenTelemetry tracing of the platform's Python services.
+
+setup_tracing() exports the spans of a process over OTLP to the collector of
+charts/kube-prometheus-stack, at OTEL_EXPORTER_OTLP_ENDPOINT. Every span is
+exported: the collector derives the span metrics, whose exemplars link the
+Serve latency panels to traces, from all of them and keeps whole traces by
+tail sampling. Without the endpoint or the opentelemetry packages installed,
+spans are not recorded and the helpers below do nothing.
+
+Traces start at the Serve ingress. A request carrying a W3C traceparent
+header, from a client instrumented on its own, continues the client's trace:
+
+    context = extract(request.headers)
+    with span("predict", context=context, kind="server"):
+        ...
+"""
+
+import contextlib
+import os
+
+try:
+    from opentelemetry import propagate, trace
+    from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import (
+        OTLPSpanExporter,
+    )
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+except ImportError:
+    trace = None
+
+_provider = None
+
+
+def setup_tracing(service_name, attributes=None):
+    """
+    Exports the spans of this process as service_name, unless
+    OTEL_SERVICE_NAME overrides it, with the resource attributes given and
+    those of OTEL_RESOURCE_ATTRIBUTES. Returns whether spans are exported.
+    """
+    global _provider
+    if _provider is not None:
+        return True
+    if trace is None or not os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        return False
+    resource = Resource.create(
+        {
+            "service.name": os.environ.get("OTEL_SERVICE_NAME", service_name),
+            **(attributes or {}),
+        }
+    )
+    # the sampler is left to OTEL_TRACES_SAMPLER, parentbased_always_on by
+    # default, since the collector samples whole traces
+    _provider = TracerProvider(resource=resource)
+    _provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(_provider)
+    return True
+
+
+@contextlib.contextmanager
+def span(name, context=None, kind="internal", attributes=None):
+    """
+    Runs the block in a span of the current trace, or of the trace of the
+    context given, which is recorded as failed when the block raises. Yields
+    the span, or None without the opentelemetry packages.
+    """
+    if trace is None:
+        yield None
+        return
+    tracer = trace.get_tracer(__name__)
+    with tracer.start_as_current_span(
+        name,
+        context=context,
+        kind=trace.SpanKind[kind.upper()],
+        attributes=attributes,
+    ) as current:
+        yield current
+
+
+def extract(headers):
+    """Returns the trace context of the traceparent of headers, or None."""
+    if trace is None or not headers:
+        return None
+    return propagate.extract(dict(headers))
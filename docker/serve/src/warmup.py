@@ -0,0 +1,81 @@
+"""
+Warm-up of a Serve replica before it is routed requests.
+
+The first predictions of a freshly loaded model pay for what it sets up
+lazily: imports, thread pools, JIT-compiled code, memory pools and cold CPU
+caches. Serve routes requests to a replica as soon as its constructor
+returns, so replicas warm up at the end of their constructor, running
+synthetic batches through everything a request goes through:
+
+    seconds = warm_up(model.predict, n_features, max_batch_size, steps=[...])
+
+Batches of 1 row up to max_batch_size rows, doubling, are predicted rounds
+times. steps are other functions of the rows of a batch and its predictions
+to run with each, e.g. the encodings of the requests and responses. A model
+that fails on synthetic rows is logged rather than failing the replica,
+which then just starts cold.
+
+FirstRequest records the latency of the first request a replica answers,
+for comparison with that of the warm ones. This module only needs numpy.
+"""
+
+import logging
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def batch_sizes(max_batch_size):
+    """Returns the sizes of the synthetic batches, 1 doubling up to max."""
+    sizes = [1]
+    while sizes[-1] < max_batch_size:
+        sizes.append(min(2 * sizes[-1], max_batch_size))
+    return sizes
+
+
+def warm_up(
+    predict, n_features, max_batch_size, rounds=3, steps=(), seed=0, strict=False
+):
+    """
+    Runs synthetic batches through predict and steps, returning the seconds
+    it took, None when it could not. With strict, the errors of predict and
+    steps are raised rather than logged.
+    """
+    if not rounds:
+        return None
+    if n_features is None:
+        logger.warning("Not warming up a model of an unknown number of features")
+        return None
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    try:
+        for _ in range(rounds):
+            for size in batch_sizes(max_batch_size):
+                rows = rng.standard_normal((size, n_features))
+                predictions = predict(rows)
+                for step in steps:
+                    step(rows, predictions)
+    except Exception:
+        if strict:
+            raise
+        logger.exception("Warm-up failed, starting cold")
+        return None
+    return time.perf_counter() - started
+
+
+class FirstRequest:
+    """
+    Sets gauge, with Ray's set(), to the seconds of the first request
+    observed, and ignores the others.
+    """
+
+    def __init__(self, gauge):
+        self.gauge = gauge
+        self.seconds = None
+
+    def observe(self, seconds):
+        if self.seconds is None:
+            self.seconds = seconds
+            self.gauge.set(seconds)
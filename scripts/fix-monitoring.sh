@@ -120,13 +120,23 @@ check_health_endpoints() {
 upgrade_monitoring() {
     echo "⬆️ Upgrading monitoring stack with fixed configuration..."
     
+    # The hub's metrics are read with the token of its prometheus service
+    local hub_token
+    hub_token=$(kubectl get secret hub -n ml-dev -o jsonpath='{.data.hub\.services\.prometheus\.apiToken}' 2>/dev/null | base64 -d || true)
+    local hub_metrics_args=(--set hubMetrics.enabled=false)
+    if [ -n "$hub_token" ]; then
+        hub_metrics_args=(--set "hubMetrics.apiToken=$hub_token")
+    else
+        echo "JupyterHub's hub Secret not found in ml-dev, not scraping the hub's metrics"
+    fi
+
     # Check if helm release exists
     if helm list -n $NAMESPACE | grep -q $RELEASE_NAME; then
         echo "Upgrading existing release..."
-        helm upgrade $RELEASE_NAME ./charts/kube-prometheus-stack -n $NAMESPACE --wait --timeout=10m
+        helm upgrade $RELEASE_NAME ./charts/kube-prometheus-stack -n $NAMESPACE "${hub_metrics_args[@]}" --wait --timeout=10m
     else
         echo "Installing new release..."
-        helm install $RELEASE_NAME ./charts/kube-prometheus-stack -n $NAMESPACE --create-namespace --wait --timeout=10m
+        helm install $RELEASE_NAME ./charts/kube-prometheus-stack -n $NAMESPACE --create-namespace "${hub_metrics_args[@]}" --wait --timeout=10m
     fi
 }
 
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Replay recorded JupyterHub traffic against hub db backends.
+
+The traffic is read from a hub log (the request log lines of the hub pod, e.g.
+`kubectl logs deploy/hub > hub.log`) or synthesized, and replayed as the
+database writes the hub makes for it through jupyterhub.orm. Each backend is
+tuned with the same hub.db.performance values jupyterhub_config.py applies, so
+tuned and untuned backends can be compared before switching the hub over.
+
+    python scripts/hub-db-benchmark.py --log hub.log \\
+        --backend sqlite-pvc=sqlite:////tmp/bench.sqlite \\
+        --backend postgres=postgresql://hub@localhost/hub \\
+        --values charts/jupyterhub/values.yaml --performance
+"""
+
+import argparse
+import math
+import os
+import random
+import re
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import yaml
+
+sys.path.insert(
+    0, str(Path(__file__).parent.parent / "charts" / "jupyterhub" / "files" / "hub")
+)
+
+from z2jh import get_db_backend, get_db_kwargs, register_sqlite_pragmas
+
+# e.g. [I 2025-07-01 12:00:00.123 JupyterHub log:192] 200 POST /hub/api/users/alice/activity (alice@10.0.0.1) 12.34ms
+HUB_REQUEST_LOG = re.compile(
+    r"^\[\w (?P<ts>\S+ \S+) JupyterHub \S+\] \d+ (?P<method>[A-Z]+) "
+    r"(?:\S*?)/hub/api/users/(?P<user>[^/\s]+)/(?P<path>activity|server)\b"
+)
+OPS = {
+    ("POST", "activity"): "activity",
+    ("POST", "server"): "spawn",
+    ("DELETE", "server"): "stop",
+}
+
+
+def read_hub_log(path):
+    """Returns the (op, user) events recorded in a hub log."""
+    events = []
+    with open(path) as f:
+        for line in f:
+            match = HUB_REQUEST_LOG.match(line)
+            if not match:
+                continue
+            op = OPS.get((match["method"], match["path"]))
+            if op:
+                events.append((op, match["user"]))
+    return events
+
+
+def synthesize_traffic(users, activity_updates):
+    """Returns spawn, activity and stop events for a number of users."""
+    events = [("spawn", f"user-{i}") for i in range(users)]
+    for _ in range(activity_updates):
+        events.append(("activity", f"user-{random.randrange(users)}"))
+    events.extend(("stop", f"user-{i}") for i in range(users))
+    return events
+
+
+def replay(session, events):
+    """Replay events as hub db writes, returning per event latencies."""
+    from jupyterhub import orm
+
+    users = {}
+    latencies = []
+    for op, name in events:
+        start = time.perf_counter()
+        user = users.get(name)
+        if user is None:
+            user = session.query(orm.User).filter_by(name=name).first()
+            if user is None:
+                user = orm.User(name=name)
+                session.add(user)
+            users[name] = user
+        spawner = user.orm_spawners.get("")
+        if spawner is None:
+            spawner = orm.Spawner(name="", user=user)
+            session.add(spawner)
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        if op == "spawn":
+            spawner.server = orm.Server()
+            spawner.started = now
+        elif op == "stop":
+            spawner.server = None
+            spawner.started = None
+        user.last_activity = spawner.last_activity = now
+        session.commit()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def run_backend(name, url, events, performance):
+    from jupyterhub import orm
+
+    db_type = name
+    if db_type not in ("sqlite-pvc", "sqlite-memory", "mysql", "postgres"):
+        db_type = "other"
+    backend = get_db_backend(db_type, url)
+    db_kwargs = {}
+    if performance.get("enabled"):
+        if backend == "sqlite":
+            register_sqlite_pragmas(performance.get("sqlite") or {})
+        else:
+            db_kwargs = get_db_kwargs(backend, url, performance)
+
+    session = orm.new_session_factory(url, reset=True, **db_kwargs)()
+    start = time.perf_counter()
+    latencies = replay(session, events)
+    elapsed = time.perf_counter() - start
+    session.close()
+
+    latencies.sort()
+    return {
+        "backend": name,
+        "events": len(latencies),
+        "writes/s": len(latencies) / elapsed if elapsed else 0.0,
+        "p50 ms": statistics.median(latencies) * 1000,
+        "p99 ms": latencies[math.ceil(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hub db backends")
+    parser.add_argument("--log", help="hub log to replay the recorded traffic of")
+    parser.add_argument(
+        "--users", type=int, default=100, help="users to synthesize traffic for"
+    )
+    parser.add_argument(
+        "--activity-updates",
+        type=int,
+        default=5000,
+        help="activity updates to synthesize",
+    )
+    parser.add_argument(
+        "--backend",
+        action="append",
+        metavar="NAME=URL",
+        help="hub db backend to benchmark, can be repeated",
+    )
+    parser.add_argument("--values", help="values.yaml to read hub.db.performance from")
+    parser.add_argument(
+        "--performance",
+        action="store_true",
+        help="apply hub.db.performance even if not enabled in --values",
+    )
+    args = parser.parse_args()
+
+    if args.log:
+        events = read_hub_log(args.log)
+        print(f"Replaying {len(events)} events recorded in {args.log}")
+    else:
+        events = synthesize_traffic(args.users, args.activity_updates)
+        print(f"Replaying {len(events)} synthesized events for {args.users} users")
+    if not events:
+        sys.exit("No hub traffic to replay")
+
+    performance = {}
+    if args.values:
+        with open(args.values) as f:
+            values = yaml.safe_load(f)
+        performance = values.get("hub", {}).get("db", {}).get("performance") or {}
+    if args.performance:
+        performance["enabled"] = True
+
+    backends = args.backend or [
+        "sqlite-pvc=sqlite:///hub-db-benchmark.sqlite",
+        "sqlite-memory=sqlite://",
+    ]
+    results = []
+    for backend in backends:
+        name, _, url = backend.partition("=")
+        results.append(run_backend(name, url, events, performance))
+        db_file = url[len("sqlite:///") :] if url.startswith("sqlite:///") else None
+        for suffix in ("", "-wal", "-shm") if db_file else ():
+            if os.path.exists(db_file + suffix):
+                os.remove(db_file + suffix)
+
+    columns = ["backend", "events", "writes/s", "p50 ms", "p99 ms"]
+    print("".join(f"{column:>16}" for column in columns))
+    for result in results:
+        row = []
+        for column in columns:
+            value = result[column]
+            row.append(
+                f"{value:>16.2f}" if isinstance(value, float) else f"{value:>16}"
+            )
+        print("".join(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Generate a Prometheus sizing guide from the series counts measured in a cluster.
+
+Measures, through the Thanos query layer:
+
+    - the head series and memory working set of every Prometheus shard, giving
+      the memory each stored series costs
+    - the series each scrape job adds, and the series of each Ray worker
+
+and prints a markdown guide with the shards the platform and the Ray worker
+Prometheus need for a number of Ray workers. Run it while a representative Ray
+job is running, with the query layer forwarded:
+
+    kubectl port-forward -n monitoring svc/kube-prometheus-stack-thanos-query 9090
+    python scripts/prometheus-sizing.py --workers 50 200 500 > sizing.md
+"""
+
+import argparse
+import json
+import math
+import re
+import sys
+import urllib.parse
+import urllib.request
+
+UNITS = {"Ki": 2**10, "Mi": 2**20, "Gi": 2**30, "Ti": 2**40}
+
+
+def parse_bytes(quantity):
+    """Returns the bytes of a Kubernetes memory quantity such as 8Gi."""
+    for suffix, factor in UNITS.items():
+        if quantity.endswith(suffix):
+            return float(quantity[: -len(suffix)]) * factor
+    return float(quantity)
+
+
+def query(prometheus, promql):
+    """Returns the label sets and values of an instant query."""
+    url = f"{prometheus}/api/v1/query?" + urllib.parse.urlencode({"query": promql})
+    with urllib.request.urlopen(url, timeout=60) as response:
+        result = json.load(response)
+    if result["status"] != "success":
+        sys.exit(f"{promql} failed: {result.get('error')}")
+    return [(r["metric"], float(r["value"][1])) for r in result["data"]["result"]]
+
+
+def measure(prometheus, ray_job):
+    shard_series = {
+        labels["pod"]: value
+        for labels, value in query(
+            prometheus, "sum by (pod) (prometheus_tsdb_head_series)"
+        )
+    }
+    shard_memory = {
+        labels["pod"]: value
+        for labels, value in query(
+            prometheus,
+            'sum by (pod) (container_memory_working_set_bytes{container="prometheus"})',
+        )
+    }
+    job_series = {
+        labels.get("job", ""): value
+        for labels, value in query(
+            prometheus, "sum by (job) (scrape_samples_post_metric_relabeling)"
+        )
+    }
+    workers = sum(
+        value for _, value in query(prometheus, f'count(up{{job=~"{ray_job}"}})')
+    )
+    if not shard_series or not workers:
+        sys.exit(
+            "No Prometheus head series or Ray workers found, "
+            "run this while a Ray job is running"
+        )
+    return shard_series, shard_memory, job_series, workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a Prometheus sizing guide")
+    parser.add_argument("--prometheus", default="http://localhost:9090")
+    parser.add_argument(
+        "--ray-job",
+        default=".*/.*ray-workers",
+        help="regex of the scrape job of the Ray workers",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[50, 100, 250, 500, 1000],
+        help="Ray worker counts to size for",
+    )
+    parser.add_argument(
+        "--shard-memory",
+        default="8Gi",
+        help="memory limit of one shard",
+    )
+    parser.add_argument(
+        "--headroom",
+        type=float,
+        default=1.5,
+        help="memory headroom for compaction, queries and churn",
+    )
+    args = parser.parse_args()
+
+    shard_series, shard_memory, job_series, workers = measure(
+        args.prometheus, args.ray_job
+    )
+    measured_pods = [pod for pod in shard_series if pod in shard_memory]
+    bytes_per_series = sum(shard_memory[p] for p in measured_pods) / sum(
+        shard_series[p] for p in measured_pods
+    )
+    ray_series = sum(
+        value for job, value in job_series.items() if re.fullmatch(args.ray_job, job)
+    )
+    platform_series = sum(job_series.values()) - ray_series
+    series_per_worker = ray_series / workers
+    shard_memory_limit = parse_bytes(args.shard_memory)
+
+    def shards(series):
+        needed = series * bytes_per_series * args.headroom / shard_memory_limit
+        return max(1, math.ceil(needed))
+
+    print("# Prometheus sizing guide\n")
+    print("## Measured\n")
+    print("| Prometheus pod | Head series | Working set | Bytes per series |")
+    print("|---|---:|---:|---:|")
+    for pod in sorted(shard_series):
+        memory = shard_memory.get(pod)
+        print(
+            f"| {pod} | {shard_series[pod]:,.0f} | "
+            + (
+                f"{memory / 2**30:.2f}Gi | {memory / shard_series[pod]:,.0f} |"
+                if memory
+                else "- | - |"
+            )
+        )
+    print()
+    print("| Scrape job | Series |")
+    print("|---|---:|")
+    for job, value in sorted(job_series.items(), key=lambda item: -item[1]):
+        print(f"| {job or '-'} | {value:,.0f} |")
+    print()
+    print(f"- {workers:.0f} Ray workers with {series_per_worker:,.0f} series each")
+    print(f"- {platform_series:,.0f} series of the rest of the platform")
+    print(f"- {bytes_per_series:,.0f} bytes of memory per series")
+    print()
+    print("## Shards\n")
+    print(
+        f"With {args.shard_memory} per shard and {args.headroom}x headroom, "
+        "for `rayPrometheus.shards` and "
+        "`kube-prometheus-stack.prometheus.prometheusSpec.shards`:\n"
+    )
+    print("| Ray workers | Ray series | rayPrometheus shards | Platform shards |")
+    print("|---:|---:|---:|---:|")
+    for count in args.workers:
+        series = series_per_worker * count
+        print(
+            f"| {count} | {series:,.0f} | {shards(series)} | "
+            f"{shards(platform_series)} |"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Measure how long a Ray worker takes from a cold start to running its first task.
+
+A task is submitted that only a new worker can run, by requesting a custom
+resource of one worker group (or more CPUs than idle nodes have), which has the
+autoscaler scale that group up. The worker pod that ran it is then
+looked up, and its startup is broken down into the phases it went through:
+
+    submitted -> pod created -> pod scheduled -> image pulled ->
+    container started -> Ray node registered -> first task started
+
+Run it against a cluster whose group has no idle worker, e.g. after the group
+scaled to zero, with the Ray client and dashboard ports forwarded:
+
+    python scripts/ray-startup-timing.py --resource memory_optimized=1 --runs 3 \\
+        --address ray://localhost:10001 --dashboard http://localhost:8265
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+PHASES = [
+    ("pod created", "created"),
+    ("pod scheduled", "scheduled"),
+    ("image pulled", "pulled"),
+    ("container started", "started"),
+    ("Ray node registered", "registered"),
+    ("first task started", "task_started"),
+]
+
+
+def parse_time(timestamp):
+    """Returns the epoch seconds of a Kubernetes timestamp."""
+    return datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp()
+
+
+def kubectl_json(*args):
+    result = subprocess.run(
+        ["kubectl", *args, "-o", "json"], capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout)
+
+
+def pod_timeline(namespace, pod_name):
+    """Returns when a pod was created, scheduled, had its image and started."""
+    pod = kubectl_json("get", "pod", "-n", namespace, pod_name)
+    timeline = {"created": parse_time(pod["metadata"]["creationTimestamp"])}
+    for condition in pod["status"].get("conditions", []):
+        if condition["type"] == "PodScheduled" and condition["status"] == "True":
+            timeline["scheduled"] = parse_time(condition["lastTransitionTime"])
+    for status in pod["status"].get("containerStatuses", []):
+        running = status.get("state", {}).get("running")
+        if status["name"].startswith("ray") and running:
+            timeline["started"] = parse_time(running["startedAt"])
+
+    events = kubectl_json(
+        "get",
+        "events",
+        "-n",
+        namespace,
+        "--field-selector",
+        f"involvedObject.name={pod_name}",
+    )
+    for event in events["items"]:
+        when = event.get("lastTimestamp") or event.get("eventTime")
+        # also reported for images already present on the node
+        if event["reason"] == "Pulled" and when:
+            timeline["pulled"] = max(timeline.get("pulled", 0), parse_time(when))
+    return timeline, pod["status"].get("podIP")
+
+
+def node_registered(dashboard, node_ip):
+    """Returns when the Ray node of a pod IP registered with the cluster."""
+    from ray.util.state import list_nodes
+
+    for node in list_nodes(address=dashboard, detail=True):
+        if node.node_ip == node_ip and node.start_time_ms:
+            return node.start_time_ms / 1000
+    return None
+
+
+def run_once(args, group_resources):
+    import ray
+
+    @ray.remote(num_cpus=args.num_cpus, resources=group_resources)
+    def first_task():
+        import socket
+
+        return time.time(), socket.gethostname()
+
+    submitted = time.time()
+    task_started, pod_name = ray.get(first_task.remote(), timeout=args.timeout)
+    timeline, pod_ip = pod_timeline(args.namespace, pod_name)
+    timeline["submitted"] = submitted
+    timeline["task_started"] = task_started
+    timeline["registered"] = node_registered(args.dashboard, pod_ip)
+    return pod_name, timeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time Ray worker cold starts")
+    parser.add_argument("--address", default="ray://localhost:10001")
+    parser.add_argument("--dashboard", default="http://localhost:8265")
+    parser.add_argument("--namespace", default="ml-dev")
+    parser.add_argument(
+        "--resource",
+        action="append",
+        metavar="NAME=AMOUNT",
+        help="custom Ray resource only the group's workers have, can be repeated",
+    )
+    parser.add_argument(
+        "--num-cpus",
+        type=float,
+        default=None,
+        help="CPUs to request, e.g. more than the head has to force a worker",
+    )
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument(
+        "--idle-wait",
+        type=int,
+        default=0,
+        help="seconds to wait between runs for the worker to be scaled down",
+    )
+    parser.add_argument("--timeout", type=int, default=600)
+    args = parser.parse_args()
+
+    import ray
+
+    group_resources = {}
+    for resource in args.resource or []:
+        name, _, amount = resource.partition("=")
+        group_resources[name] = float(amount or 1)
+    if not group_resources and args.num_cpus is None:
+        sys.exit("Pass --resource or --num-cpus so that only a new worker fits")
+
+    ray.init(address=args.address)
+    results = []
+    for run in range(args.runs):
+        if run and args.idle_wait:
+            print(f"Waiting {args.idle_wait}s for the worker to scale down")
+            time.sleep(args.idle_wait)
+        pod_name, timeline = run_once(args, group_resources)
+        results.append(timeline)
+        print(f"\nRun {run + 1}: first task ran on {pod_name}")
+        previous = timeline["submitted"]
+        for label, key in PHASES:
+            when = timeline.get(key)
+            if when is None:
+                print(f"  {label:<22} unknown")
+                continue
+            print(
+                f"  {label:<22} +{when - timeline['submitted']:8.2f}s "
+                f"({when - previous:+.2f}s)"
+            )
+            previous = when
+
+    if len(results) > 1:
+        print("\nMedian seconds since submission")
+        for label, key in PHASES:
+            values = [r[key] - r["submitted"] for r in results if r.get(key)]
+            if values:
+                print(f"  {label:<22} {statistics.median(values):8.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Compare the throughput of the JSON, numpy and Arrow encodings of /predict of
+the serve image, see docker/serve/src/payloads.py, for 1-row and 10k-row
+requests.
+
+By default it times the encoding work of a request round trip in-process: the
+client encoding the rows, the server decoding them and encoding the
+predictions, and the client decoding those. With --url it posts the requests
+to a running application instead, timing them end to end:
+
+    python scripts/serve-ingress-benchmark.py
+    python scripts/serve-ingress-benchmark.py --url http://localhost:8000/predict \\
+        --features 12 --rows 1 --rows 10000 --seconds 10
+
+Arrow is left out when pyarrow is not installed.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "docker" / "serve" / "src"))
+
+from payloads import (
+    ARROW,
+    JSON,
+    NUMPY,
+    decode_predictions,
+    decode_rows,
+    encode_predictions,
+    encode_rows,
+)
+
+ENCODINGS = {"json": JSON, "numpy": NUMPY, "arrow": ARROW}
+
+
+def available_encodings():
+    """Returns the names of the encodings that can be benchmarked here."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return ["json", "numpy"]
+    return list(ENCODINGS)
+
+
+def round_trip(media, rows):
+    """Encodes and decodes rows and their predictions as /predict would."""
+    body, headers = encode_rows(media, rows)
+    decoded = decode_rows(headers["content-type"], headers, body)
+    # the predictions of a model, one per row
+    body, headers = encode_predictions(media, decoded[:, 0])
+    decode_predictions(headers["content-type"], headers, body)
+
+
+def post(session, url, media, rows):
+    body, headers = encode_rows(media, rows)
+    response = session.post(url, data=body, headers=headers)
+    response.raise_for_status()
+    decode_predictions(
+        response.headers["content-type"], response.headers, response.content
+    )
+
+
+def measure(call, seconds):
+    """Returns the calls per second of call, made for at least seconds."""
+    call()  # warm up
+    calls, start = 0, time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        call()
+        calls += 1
+    return calls / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /predict encodings")
+    parser.add_argument("--url", help="/predict of a running application to post to")
+    parser.add_argument(
+        "--features", type=int, default=12, help="features per row (default: 12)"
+    )
+    parser.add_argument(
+        "--rows",
+        type=int,
+        action="append",
+        help="rows per request, repeatable (default: 1 and 10000)",
+    )
+    parser.add_argument(
+        "--encoding",
+        action="append",
+        choices=list(ENCODINGS),
+        help="encodings to compare, repeatable (default: all available)",
+    )
+    parser.add_argument(
+        "--seconds", type=float, default=3.0, help="per measurement (default: 3)"
+    )
+    args = parser.parse_args()
+
+    session = None
+    if args.url:
+        import requests
+
+        session = requests.Session()
+
+    rng = np.random.default_rng(0)
+    columns = ["encoding", "rows", "requests/s", "rows/s", "request bytes"]
+    print("".join(f"{column:>16}" for column in columns))
+    for n_rows in args.rows or [1, 10_000]:
+        rows = rng.random((n_rows, args.features))
+        for name in args.encoding or available_encodings():
+            media = ENCODINGS[name]
+            if session is None:
+                rate = measure(lambda: round_trip(media, rows), args.seconds)
+            else:
+                rate = measure(
+                    lambda: post(session, args.url, media, rows), args.seconds
+                )
+            size = len(encode_rows(media, rows)[0])
+            row = [name, n_rows, f"{rate:,.0f}", f"{rate * n_rows:,.0f}", f"{size:,}"]
+            print("".join(f"{str(value):>16}" for value in row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Render the performance objectives of charts/kube-prometheus-stack/rules/slos.yaml
+into multi-window burn-rate recording and alerting rules.
+
+For every objective, the error ratio, the share of bad events, is recorded as
+slo:sli_error:ratio_rate<window> with an slo label, over the windows the
+alerts compare. The error budget is the share of bad events the objective
+allows, and a burn rate of 1 spends it exactly over the 30 day period. As in
+the Site Reliability Workbook, <alert>ErrorBudgetBurn fires when both a long
+and a short window burn faster than:
+
+    - 14.4x over 1h and 5m, 2% of the budget in an hour, paging
+    - 6x over 6h and 30m, 5% of the budget in 6 hours, paging
+    - 3x over 1d and 2h, 10% of the budget in a day, as a ticket
+    - 1x over 3d and 6h, 10% of the budget in 3 days, as a ticket
+
+The long window makes sure enough of the budget is spent to act on, the short
+one that it is still being spent. The windows of 2h and longer are recorded
+every 5m only, as their ratios change slowly and their queries read hours to
+days of samples.
+
+    python scripts/slo-rules.py          # write slo.rules.yaml
+    python scripts/slo-rules.py --check  # fail if it is out of date
+"""
+
+import argparse
+import pathlib
+import sys
+
+import yaml
+
+RULES_DIR = (
+    pathlib.Path(__file__).resolve().parent.parent
+    / "charts"
+    / "kube-prometheus-stack"
+    / "rules"
+)
+
+# long window, short window, burn rate, severity, for
+BURN_RATE_ALERTS = [
+    ("1h", "5m", 14.4, "critical", "2m"),
+    ("6h", "30m", 6, "critical", "15m"),
+    ("1d", "2h", 3, "warning", "1h"),
+    ("3d", "6h", 1, "warning", "3h"),
+]
+SHORT_WINDOWS = ["5m", "30m", "1h"]
+LONG_WINDOWS = ["2h", "6h", "1d", "3d"]
+LONG_WINDOWS_INTERVAL = "5m"
+
+HEADER = """\
+# Generated by scripts/slo-rules.py from slos.yaml, do not edit.
+#
+# Multi-window burn-rate recording and alerting rules of the platform's
+# performance objectives, evaluated by the Thanos ruler over the series of
+# every Prometheus shard.
+"""
+
+
+class _Dumper(yaml.SafeDumper):
+    """Indents lists and writes multi-line strings as blocks."""
+
+    def increase_indent(self, flow=False, indentless=False):
+        return super().increase_indent(flow, False)
+
+
+def _represent_str(dumper, value):
+    style = "|" if "\n" in value else None
+    return dumper.represent_scalar("tag:yaml.org,2002:str", value, style=style)
+
+
+_Dumper.add_representer(str, _represent_str)
+
+
+def error_ratio(objective, window):
+    """
+    Returns the PromQL of the error ratio of an objective over a window. It is
+    0 rather than missing while there are events but no bad ones.
+    """
+    errors = objective["errors"].replace("$window", window)
+    total = objective["total"].replace("$window", window)
+    return f"(\n  {errors}\n  or\n  {total} * 0\n)\n/\n{total}\n"
+
+
+def recording_rules(objective, windows):
+    return [
+        {
+            "record": f"slo:sli_error:ratio_rate{window}",
+            "expr": error_ratio(objective, window),
+            "labels": {"slo": objective["name"]},
+        }
+        for window in windows
+    ]
+
+
+def alerting_rules(objective):
+    name = objective["name"]
+    budget = round(1 - objective["objective"], 6)
+    rules = [
+        {
+            "record": "slo:error_budget:ratio",
+            "expr": f"vector({budget:g})",
+            "labels": {"slo": name},
+        }
+    ]
+    for long, short, burn_rate, severity, duration in BURN_RATE_ALERTS:
+        threshold = f"({burn_rate:g} * {budget:g})"
+        rules.append(
+            {
+                "alert": f"{objective['alert']}ErrorBudgetBurn",
+                "expr": (
+                    f'slo:sli_error:ratio_rate{long}{{slo="{name}"}} > {threshold}\n'
+                    "and\n"
+                    f'slo:sli_error:ratio_rate{short}{{slo="{name}"}} > {threshold}\n'
+                ),
+                "for": duration,
+                "labels": {
+                    "severity": severity,
+                    "slo": name,
+                    "long": long,
+                    "short": short,
+                },
+                "annotations": {
+                    "summary": f"The {name} objective is burning its error budget.",
+                    "description": (
+                        f"The objective that {objective['description']} spends "
+                        f"its error budget more than {burn_rate:g}x as fast as "
+                        f"its 30 day period allows, over both the last {long} "
+                        f"and {short}."
+                    ),
+                },
+            }
+        )
+    return rules
+
+
+def render(objectives):
+    """Returns the rule file of the objectives."""
+    groups = []
+    for objective in objectives:
+        if not 0 < objective["objective"] < 1:
+            sys.exit(f"{objective['name']}: objective must be between 0 and 1")
+        groups.append(
+            {
+                "name": f"slo-{objective['name']}",
+                "rules": recording_rules(objective, SHORT_WINDOWS)
+                + alerting_rules(objective),
+            }
+        )
+        groups.append(
+            {
+                "name": f"slo-{objective['name']}-long-windows",
+                "interval": LONG_WINDOWS_INTERVAL,
+                "rules": recording_rules(objective, LONG_WINDOWS),
+            }
+        )
+    body = yaml.dump({"groups": groups}, Dumper=_Dumper, sort_keys=False, width=1000)
+    return HEADER + body
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the SLO rules")
+    parser.add_argument("--slos", type=pathlib.Path, default=RULES_DIR / "slos.yaml")
+    parser.add_argument(
+        "--output", type=pathlib.Path, default=RULES_DIR / "slo.rules.yaml"
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="fail if the output is not up to date instead of writing it",
+    )
+    args = parser.parse_args()
+
+    rules = render(yaml.safe_load(args.slos.read_text())["objectives"])
+    if args.check:
+        if not args.output.exists() or args.output.read_text() != rules:
+            sys.exit(f"{args.output} is out of date, run {sys.argv[0]}")
+        return
+    args.output.write_text(rules)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
 """
 Pytest configuration and fixtures for infrastructure testing.
 """
+import importlib.util
 import os
+import sys
 import pytest
 import yaml
 import subprocess
@@ -75,3 +77,64 @@ def run_command(cmd: List[str], cwd: Path = None) -> subprocess.CompletedProcess
         text=True,
         check=False
     )
+
+
+def load_module(path: Path, name: str = None):
+    """
+    Import the module at path, a file or a package directory, as name, by
+    default its file name. Packages are registered in sys.modules, so that
+    their modules can be imported as name.module.
+    """
+    if path.is_dir():
+        name = name or path.name
+        spec = importlib.util.spec_from_file_location(
+            name, path / "__init__.py", submodule_search_locations=[str(path)]
+        )
+    else:
+        name = name or path.stem.replace("-", "_")
+        spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    if path.is_dir():
+        sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class Counter:
+    """
+    A fake metrics Counter, counting by the values of the given tags:
+    Counter("result").counts == {"hit": 1}, or by None without tags.
+    """
+
+    def __init__(self, *tag_keys: str):
+        self.tag_keys = tag_keys
+        self.tags = []
+        self.counts = {}
+
+    def inc(self, value=1, tags=None):
+        tags = tags or {}
+        self.tags.append(tags)
+        key = tuple(tags.get(tag_key) for tag_key in self.tag_keys)
+        if len(key) <= 1:
+            key = key[0] if key else None
+        self.counts[key] = self.counts.get(key, 0) + value
+
+
+class Gauge:
+    """A fake metrics Gauge, recording the values set."""
+
+    def __init__(self):
+        self.values = []
+
+    def set(self, value, tags=None):
+        self.values.append(value)
+
+
+class Histogram:
+    """A fake metrics Histogram, recording the values observed."""
+
+    def __init__(self):
+        self.values = []
+
+    def observe(self, value, tags=None):
+        self.values.append(value)
@@ -0,0 +1,91 @@
+"""
+Tests for the compiled tree ensembles of the serve image.
+"""
+
+import numpy as np
+import pytest
+
+from .conftest import load_module
+
+
+@pytest.fixture(scope="module")
+def compiled(docker_dir):
+    """Import docker/serve/src/compiled.py."""
+    return load_module(docker_dir / "serve" / "src" / "compiled.py")
+
+
+class TestCompiledModels:
+    """Test suite for compiling tree ensembles and loading them to serve."""
+
+    def test_predictions_of_raw_outputs(self, compiled):
+        """Test the labels and values predicted from the ensemble's outputs."""
+        rows = np.array([[0.2, 1.0], [np.nan, 3.0], [0.9, 2.0]])
+        # imputes 0.5, then scales the first feature by 2
+        preprocessing = (np.array([1.0, np.nan]), np.array([2.0, 1.0]), np.zeros(2))
+
+        regressor = compiled.CompiledModel(lambda x: x[:, :1], preprocessing, None, 2)
+        assert regressor.predict(rows).tolist() == [0.4, 1.0, 1.8]
+
+        binary = compiled.CompiledModel(
+            lambda x: x[:, :1] / 2, preprocessing, np.array(["no", "yes"]), 2
+        )
+        assert binary.predict(rows).tolist() == ["no", "no", "yes"]
+
+        classes = np.array([3, 5, 7])
+        multiclass = compiled.CompiledModel(
+            lambda x: np.eye(3)[x[:, 1].astype(int) - 1], None, classes, 2
+        )
+        assert multiclass.predict(rows).tolist() == [3, 7, 5]
+
+    def test_fused_preprocessing(self, compiled):
+        """Test that scalers and imputers fuse into one equivalent pass."""
+        pytest.importorskip("sklearn")
+        from sklearn.impute import SimpleImputer
+        from sklearn.pipeline import make_pipeline
+        from sklearn.preprocessing import MinMaxScaler, StandardScaler
+        from sklearn.tree import DecisionTreeRegressor
+
+        rng = np.random.default_rng(0)
+        X = rng.normal(size=(200, 3)) * [1, 10, 100]
+        X[rng.random(X.shape) < 0.1] = np.nan
+        pipeline = make_pipeline(
+            StandardScaler(),
+            SimpleImputer(),
+            MinMaxScaler(),
+            DecisionTreeRegressor(max_depth=3),
+        ).fit(X, rng.normal(size=200))
+
+        (fill, scale, offset), estimator = compiled.fuse_preprocessing(pipeline)
+
+        fused = np.where(np.isnan(X), fill, X * scale + offset)
+        assert np.allclose(fused, pipeline[:-1].transform(X))
+        assert estimator is pipeline[-1]
+
+    def test_compile_and_load(self, compiled, tmp_path):
+        """Test a compile, its parity, and that the dump it is of is checked."""
+        pytest.importorskip("tl2cgen")
+        pytest.importorskip("treelite")
+        pytest.importorskip("sklearn")
+        from sklearn.ensemble import RandomForestClassifier
+
+        rng = np.random.default_rng(0)
+        X = rng.normal(size=(500, 4))
+        model = RandomForestClassifier(n_estimators=10, random_state=0)
+        model.fit(X, X[:, 0] + X[:, 1] > 0)
+        path = tmp_path / "model.joblib"
+
+        directory = compiled.export_model(model, str(path), sample_rows=X)
+
+        assert directory == compiled.compiled_path(str(path))
+        loaded = compiled.load_compiled(str(path))
+        assert compiled.parity(model, loaded, X) == 0
+        # a new dump without its compiled model is loaded as it is
+        path.write_bytes(path.read_bytes() + b"\0")
+        assert compiled.load_compiled(str(path)) is None
+
+    def test_load_without_compiled_model(self, compiled, tmp_path):
+        """Test that dumps without a compiled model load as they are."""
+        path = tmp_path / "model.joblib"
+        path.write_bytes(b"model")
+
+        assert compiled.load_compiled(str(path)) is None
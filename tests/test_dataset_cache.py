@@ -0,0 +1,234 @@
+"""
+Tests for the node-local dataset cache served by charts/dataset-cache.
+"""
+
+import os
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from .conftest import load_module
+
+
+@pytest.fixture(scope="module")
+def cache_module(charts_dir):
+    """Import the cache server from the chart's files."""
+    return load_module(
+        charts_dir / "dataset-cache" / "files" / "cache.py", "dataset_cache"
+    )
+
+
+@pytest.fixture
+def upstream():
+    """A fake object store serving an in-memory bucket, counting GETs."""
+    objects = {
+        "/datasets/a.parquet": b"a" * 1000,
+        "/datasets/copy-of-a.parquet": b"a" * 1000,
+        "/datasets/b.parquet": b"b" * 1000,
+    }
+    gets = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_HEAD(self):
+            self.do_GET(head=True)
+
+        def do_GET(self, head=False):
+            body = objects.get(self.path)
+            if body is None:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if not head:
+                gets.append(self.path)
+                time.sleep(0.05)
+            self.send_response(200)
+            self.send_header("ETag", f'"{hash(body)}"')
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if not head:
+                self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}", gets
+    server.shutdown()
+
+
+@pytest.fixture
+def cache(cache_module, upstream, tmp_path):
+    """A dataset cache with room for two distinct objects."""
+    endpoint, _ = upstream
+    return cache_module.DatasetCache(
+        str(tmp_path), 2000, cache_module.Upstream(endpoint)
+    )
+
+
+class TestDatasetCache:
+    """Test suite for the dataset cache."""
+
+    def test_parse_quantity(self, cache_module):
+        """Test that k8s quantities are parsed into bytes."""
+        assert cache_module.parse_quantity("100Gi") == 100 * 2**30
+        assert cache_module.parse_quantity("1.5M") == 1_500_000
+        assert cache_module.parse_quantity(4096) == 4096
+
+    def test_concurrent_misses_fetch_once(self, cache, upstream):
+        """Test that concurrent readers of one object share a single fetch."""
+        _, gets = upstream
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            results = list(executor.map(cache.get, ["datasets/a.parquet"] * 10))
+        assert gets == ["/datasets/a.parquet"]
+        assert len({path for _, path in results}) == 1
+        assert cache.stats["misses"] == 1
+        assert cache.stats["hits"] == 9
+
+    def test_identical_content_is_stored_once(self, cache, tmp_path):
+        """Test that objects with the same content share a blob and file."""
+        _, a_path = cache.get("datasets/a.parquet")
+        _, copy_path = cache.get("datasets/copy-of-a.parquet")
+        assert a_path == copy_path
+        assert cache.size == 1000
+        assert cache.stats["deduplicated"] == 1
+        mounted = tmp_path / "objects" / "datasets" / "copy-of-a.parquet"
+        assert mounted.read_bytes() == b"a" * 1000
+
+    def test_least_recently_used_is_evicted(self, cache_module, upstream, tmp_path):
+        """Test that the least recently used blob is evicted over budget."""
+        endpoint, _ = upstream
+        cache = cache_module.DatasetCache(
+            str(tmp_path), 1500, cache_module.Upstream(endpoint)
+        )
+        cache.get("datasets/a.parquet")
+        cache.get("datasets/b.parquet")
+        assert "datasets/a.parquet" not in cache.objects
+        assert "datasets/b.parquet" in cache.objects
+        assert not (tmp_path / "objects" / "datasets" / "a.parquet").exists()
+        assert cache.stats["evictions"] == 1
+
+    def test_index_survives_restart(self, cache_module, cache, upstream, tmp_path):
+        """Test that a restarted cache serves what it cached before."""
+        endpoint, gets = upstream
+        cache.get("datasets/a.parquet")
+        restarted = cache_module.DatasetCache(
+            str(tmp_path), 2000, cache_module.Upstream(endpoint)
+        )
+        restarted.get("datasets/a.parquet")
+        assert gets == ["/datasets/a.parquet"]
+
+    def test_open_blobs_outlive_their_eviction(self, cache):
+        """Test that a blob opened to be served stays readable when evicted."""
+        _, f = cache.open("datasets/a.parquet")
+        with f:
+            # a is evicted to make room for b
+            cache.size_budget = 1000
+            cache.get("datasets/b.parquet")
+
+            assert "datasets/a.parquet" not in cache.objects
+            assert f.read() == b"a" * 1000
+        assert cache._fetch_locks == {}
+
+    def test_range_requests(self, cache_module, cache):
+        """Test that byte ranges of cached objects are served over HTTP."""
+        cache_module.CacheHandler.cache = cache
+        server = ThreadingHTTPServer(("127.0.0.1", 0), cache_module.CacheHandler)
+        # so that server_close waits for the handlers to count what they served
+        server.daemon_threads = False
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            request = urllib.request.Request(
+                f"http://127.0.0.1:{server.server_port}/datasets/b.parquet",
+                headers={"Range": "bytes=-10"},
+            )
+            with urllib.request.urlopen(request) as r:
+                assert r.status == 206
+                assert r.headers["Content-Range"] == "bytes 990-999/1000"
+                assert r.read() == b"b" * 10
+            # a range without either end is ignored
+            request.headers["Range"] = "bytes=-"
+            with urllib.request.urlopen(request) as r:
+                assert r.status == 200
+                assert r.read() == b"b" * 1000
+        finally:
+            server.shutdown()
+            server.server_close()
+        assert cache.stats["served_bytes"] == 1010
+
+    def test_unlisted_buckets_are_refused(self, cache_module, upstream, tmp_path):
+        """Test that only the configured buckets are served and listed."""
+        endpoint, gets = upstream
+        cache = cache_module.DatasetCache(
+            str(tmp_path), 2000, cache_module.Upstream(endpoint), buckets=["public"]
+        )
+        with pytest.raises(PermissionError):
+            cache.get("datasets/a.parquet")
+        with pytest.raises(PermissionError):
+            cache.prefetch("s3://datasets/")
+        assert gets == []
+
+        cache_module.CacheHandler.cache = cache
+        server = ThreadingHTTPServer(("127.0.0.1", 0), cache_module.CacheHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            for path in ["/datasets/a.parquet", "/datasets?list-type=2"]:
+                with pytest.raises(urllib.error.HTTPError) as error:
+                    urllib.request.urlopen(
+                        f"http://127.0.0.1:{server.server_port}{path}"
+                    )
+                assert error.value.code == 403
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_unreachable_upstream(self, cache_module, tmp_path):
+        """Test that an unreachable object store is answered with a 502."""
+        # a port nothing listens on once the socket is closed
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        cache_module.CacheHandler.cache = cache_module.DatasetCache(
+            str(tmp_path), 2000, cache_module.Upstream(f"http://127.0.0.1:{port}")
+        )
+        server = ThreadingHTTPServer(("127.0.0.1", 0), cache_module.CacheHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            for path in ["/datasets/a.parquet", "/datasets?list-type=2"]:
+                with pytest.raises(urllib.error.HTTPError) as error:
+                    urllib.request.urlopen(
+                        f"http://127.0.0.1:{server.server_port}{path}"
+                    )
+                assert error.value.code == 502
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_files_are_written_outside_the_lock(self, cache_module, cache, monkeypatch):
+        """Test that evicted blobs and the index are written without _lock."""
+        written = []
+
+        def check(function):
+            def checked(path, *args):
+                written.append((os.path.basename(path), cache._lock.locked()))
+                return function(path, *args)
+
+            return checked
+
+        monkeypatch.setattr(cache_module.os, "remove", check(os.remove))
+        monkeypatch.setattr(cache_module.os, "replace", check(os.replace))
+        cache.size_budget = 1000
+        cache.get("datasets/a.parquet")
+        cache.get("datasets/b.parquet")
+
+        deleted = [name for name, _ in written if name.startswith(".evicted-")]
+        assert len(deleted) == 1
+        assert (deleted[0], False) in written
+        assert written.count(("index.json.tmp", False)) == 2
@@ -0,0 +1,74 @@
+"""
+Tests for the DaemonSet rendered by charts/dataset-cache.
+"""
+
+import shutil
+
+import pytest
+import yaml
+
+from .conftest import run_command
+
+
+@pytest.fixture
+def render_dataset_cache(charts_dir, tmp_path):
+    """
+    Render the chart's resources by kind, with values layered over
+    values.yaml.
+    """
+    if not shutil.which("helm"):
+        pytest.skip("helm not installed")
+
+    def render(values=None):
+        cmd = ["helm", "template", "test", str(charts_dir / "dataset-cache")]
+        if values:
+            values_file = tmp_path / "values.yaml"
+            values_file.write_text(yaml.safe_dump(values))
+            cmd += ["--values", str(values_file)]
+        result = run_command(cmd)
+        assert result.returncode == 0, result.stderr
+        docs = [doc for doc in yaml.safe_load_all(result.stdout) if doc]
+        return {doc["kind"]: doc for doc in docs}
+
+    return render
+
+
+class TestDatasetCacheChart:
+    """Test suite for the node-local dataset cache's chart."""
+
+    def test_default_layout(self, render_dataset_cache, charts_dir):
+        """Test the DaemonSet, its code and the node-local Service."""
+        resources = render_dataset_cache()
+
+        config_map = resources["ConfigMap"]
+        code = (charts_dir / "dataset-cache" / "files" / "cache.py").read_text()
+        assert config_map["data"]["cache.py"] == code
+
+        pod = resources["DaemonSet"]["spec"]["template"]["spec"]
+        [container] = pod["containers"]
+        env = {e["name"]: e.get("value") for e in container["env"]}
+        assert env["CACHE_SIZE"] == "100Gi"
+        assert env["CACHE_DIR"] == "/cache"
+        assert env["CACHE_BUCKETS"] == "datasets"
+        volumes = {volume["name"]: volume for volume in pod["volumes"]}
+        assert volumes["cache"]["hostPath"]["path"] == "/mnt/dataset-cache"
+        assert volumes["code"]["configMap"]["name"] == config_map["metadata"]["name"]
+
+        service = resources["Service"]
+        assert service["spec"]["internalTrafficPolicy"] == "Local"
+        assert service["spec"]["selector"] == (
+            resources["DaemonSet"]["spec"]["selector"]["matchLabels"]
+        )
+
+    def test_volume_replaces_host_path(self, render_dataset_cache):
+        """Test that storage.volume replaces the hostPath of the cache."""
+        resources = render_dataset_cache(
+            {"storage": {"volume": {"emptyDir": {"sizeLimit": "10Gi"}}}}
+        )
+
+        pod = resources["DaemonSet"]["spec"]["template"]["spec"]
+        volumes = {volume["name"]: volume for volume in pod["volumes"]}
+        assert volumes["cache"] == {
+            "name": "cache",
+            "emptyDir": {"sizeLimit": "10Gi"},
+        }
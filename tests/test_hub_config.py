@@ -0,0 +1,253 @@
+"""
+Tests for the hub configuration helpers in the JupyterHub chart's z2jh.py.
+"""
+
+import os
+import sys
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def z2jh(charts_dir):
+    """Import z2jh.py the way jupyterhub_config.py does."""
+    sys.path.insert(0, str(charts_dir / "jupyterhub" / "files" / "hub"))
+    try:
+        import z2jh
+    finally:
+        sys.path.pop(0)
+    return z2jh
+
+
+class TestHubDbPerformance:
+    """Test suite for hub.db.performance."""
+
+    def test_db_backend(self, z2jh):
+        """Test that hub.db.type and db_url resolve to a backend."""
+        assert z2jh.get_db_backend("sqlite-pvc") == "sqlite"
+        assert z2jh.get_db_backend("postgres") == "postgres"
+        assert z2jh.get_db_backend("other", "mysql+pymysql://hub@db/hub") == "mysql"
+        assert z2jh.get_db_backend("other", "oracle://hub@db/hub") == "other"
+
+    def test_postgres_db_kwargs(self, z2jh):
+        """Test that pool and statement settings become create_engine kwargs."""
+        performance = {
+            "pool": {"size": 20, "maxOverflow": 5, "prePing": True},
+            "statementTimeout": 5000,
+            "preparedStatements": True,
+        }
+        db_kwargs = z2jh.get_db_kwargs(
+            "postgres", "postgresql+psycopg://hub@db/hub", performance
+        )
+        assert db_kwargs["pool_size"] == 20
+        assert db_kwargs["max_overflow"] == 5
+        assert db_kwargs["pool_pre_ping"] is True
+        assert db_kwargs["connect_args"] == {
+            "options": "-c statement_timeout=5000",
+            "prepare_threshold": 1,
+        }
+
+    def test_sqlite_has_no_db_kwargs(self, z2jh):
+        """Test that SQLite keeps JupyterHub's own connect_args."""
+        assert z2jh.get_db_kwargs("sqlite", "sqlite://", {"pool": {"size": 5}}) == {}
+
+    def test_sqlite_pragmas(self, z2jh):
+        """Test that the PRAGMAs are applied to new SQLite connections."""
+        sqlalchemy = pytest.importorskip("sqlalchemy")
+        z2jh.register_sqlite_pragmas({"busyTimeout": 1000})
+        pragmas = z2jh.register_sqlite_pragmas(
+            {"journalMode": "wal", "synchronous": "normal", "busyTimeout": 5000}
+        )
+        assert "PRAGMA journal_mode=wal" in pragmas
+
+        try:
+            engine = sqlalchemy.create_engine("sqlite://")
+            with engine.connect() as connection:
+                busy_timeout = connection.exec_driver_sql(
+                    "PRAGMA busy_timeout"
+                ).scalar()
+            assert busy_timeout == 5000
+        finally:
+            sqlalchemy.event.remove(
+                sqlalchemy.engine.Engine, "connect", z2jh._set_sqlite_pragmas
+            )
+
+    def test_write_rate_check(self, z2jh):
+        """Test the activity write rate against the backend's capacity."""
+        write_rate = z2jh.get_db_activity_write_rate(3000, 60, 300)
+        assert write_rate == pytest.approx(60.0)
+
+        untuned = z2jh.get_db_sustainable_write_rate("sqlite-pvc", "sqlite", {})
+        tuned = z2jh.get_db_sustainable_write_rate(
+            "sqlite-pvc",
+            "sqlite",
+            {"enabled": True, "sqlite": {"journalMode": "wal"}},
+        )
+        assert untuned < write_rate < tuned
+
+
+class TestConfigSnippetCache:
+    """Test suite for hub.configCache."""
+
+    def test_bytecode_is_cached_by_content(self, z2jh, tmp_path):
+        """Test that snippets are compiled once and recompiled on change."""
+        z2jh.compile_config_snippet("x = 1", "extraConfig.a", str(tmp_path))
+        cached = list((tmp_path / "config-snippets").glob("*.pyc"))
+        assert len(cached) == 1
+
+        namespace = {}
+        code = z2jh.compile_config_snippet("x = 1", "extraConfig.a", str(tmp_path))
+        exec(code, namespace)
+        assert namespace["x"] == 1
+        assert code.co_filename == "extraConfig.a"
+
+        z2jh.compile_config_snippet("x = 2", "extraConfig.a", str(tmp_path))
+        assert len(list((tmp_path / "config-snippets").glob("*.pyc"))) == 2
+
+    def test_stale_bytecode_is_pruned(self, z2jh, tmp_path):
+        """Test that only bytecode of changed snippets is removed."""
+        cache_dir = tmp_path / "config-snippets"
+        cache_dir.mkdir()
+        (cache_dir / "stale.pyc").write_bytes(b"")
+        (cache_dir / "notes.txt").write_text("kept")
+        (tmp_path / "jupyterhub.sqlite").write_bytes(b"")
+        (tmp_path / "other.pyc").write_bytes(b"")
+        z2jh.compile_config_snippet("y = 1", "extraConfig.b", str(tmp_path))
+        z2jh.prune_config_snippet_cache(str(tmp_path))
+        assert not (cache_dir / "stale.pyc").exists()
+        assert len(list(cache_dir.glob("*.pyc"))) == 1
+        assert (cache_dir / "notes.txt").exists()
+        assert (tmp_path / "jupyterhub.sqlite").exists()
+        assert (tmp_path / "other.pyc").exists()
+
+    def test_deferred_imports(self, z2jh):
+        """Test that imports of lazyImports modules are deferred."""
+        sys.modules.pop("colorsys", None)
+        code = z2jh.compile_config_snippet(
+            "import os, colorsys as cs", "extraConfig.c", lazy_imports=["colorsys"]
+        )
+        namespace = {}
+        exec(code, namespace)
+        assert namespace["os"] is os
+        assert type(namespace["cs"]).__name__ == "_LazyModule"
+        assert namespace["cs"].rgb_to_hsv(0, 0, 0) == (0.0, 0.0, 0.0)
+
+    def test_deferred_submodule_imports(self, z2jh):
+        """Test that imports of dotted lazyImports modules are deferred."""
+        sys.modules.pop("xml.dom.pulldom", None)
+        code = z2jh.compile_config_snippet(
+            "import xml.dom.pulldom\nimport xml.dom.pulldom as pd",
+            "extraConfig.d",
+            lazy_imports=["xml.dom.pulldom"],
+        )
+        namespace = {}
+        exec(code, namespace)
+        assert namespace["xml"] is sys.modules["xml"]
+        assert namespace["xml"].dom.pulldom is namespace["pd"]
+        assert type(namespace["pd"]).__name__ == "_LazyModule"
+        assert namespace["pd"].START_ELEMENT == "START_ELEMENT"
+
+
+class TestUserRayClusters:
+    """Test suite for singleuser.rayCluster."""
+
+    ray_cluster = {
+        "enabled": True,
+        "rayVersion": "2.48.0",
+        "image": {"name": "rayproject/ray", "tag": "2.48.0-py312-cpu"},
+        "head": {"cpu": 1, "memory": "2Gi"},
+        "worker": {"cpu": 2, "memory": "4Gi", "minReplicas": 0, "maxReplicas": 4},
+        "idleTimeoutSeconds": 60,
+    }
+
+    def test_profile_sizes_the_cluster(self, z2jh):
+        """Test that the picked profile's ray_cluster entry sizes the cluster."""
+        profiles = [
+            {"display_name": "Small", "slug": "small", "default": True},
+            {
+                "display_name": "Large",
+                "slug": "large",
+                "ray_cluster": {"worker": {"cpu": 8, "maxReplicas": 8}},
+            },
+        ]
+        assert z2jh.get_profile(profiles)["slug"] == "small"
+        profile = z2jh.get_profile(profiles, "large")
+
+        manifest = z2jh.get_ray_cluster_manifest(
+            "jupyter-alice-ray", "jhub", self.ray_cluster, profile
+        )
+        [workers] = manifest["spec"]["workerGroupSpecs"]
+        [container] = workers["template"]["spec"]["containers"]
+        assert container["resources"]["limits"] == {"cpu": "8", "memory": "4Gi"}
+        assert workers["maxReplicas"] == 8
+        assert container["image"] == "rayproject/ray:2.48.0-py312-cpu"
+
+    def test_idle_workers_scale_to_zero(self, z2jh):
+        """Test that the cluster starts without workers and autoscales."""
+        manifest = z2jh.get_ray_cluster_manifest(
+            "jupyter-alice-ray", "jhub", self.ray_cluster
+        )
+        spec = manifest["spec"]
+        assert spec["enableInTreeAutoscaling"] is True
+        assert spec["autoscalerOptions"]["idleTimeoutSeconds"] == 60
+        assert spec["workerGroupSpecs"][0]["replicas"] == 0
+        assert spec["workerGroupSpecs"][0]["minReplicas"] == 0
+        assert spec["headGroupSpec"]["rayStartParams"]["num-cpus"] == "0"
+
+    def test_env_is_set_on_every_node(self, z2jh):
+        """Test that env, e.g. the tracing collector, is set on head and workers."""
+        env = {"OTEL_EXPORTER_OTLP_ENDPOINT": "http://collector:4317"}
+        manifest = z2jh.get_ray_cluster_manifest(
+            "jupyter-alice-ray", "jhub", self.ray_cluster, env=env
+        )
+        spec = manifest["spec"]
+        for template in [spec["headGroupSpec"]["template"]] + [
+            group["template"] for group in spec["workerGroupSpecs"]
+        ]:
+            [container] = template["spec"]["containers"]
+            assert container["env"] == [
+                {
+                    "name": "OTEL_EXPORTER_OTLP_ENDPOINT",
+                    "value": "http://collector:4317",
+                }
+            ]
+
+    def test_connection_env(self, z2jh):
+        """Test the cluster names and the environment pointing at them."""
+        name = z2jh.get_ray_cluster_name("jupyter-" + "a" * 60)
+        assert len(f"{name}-head-svc") <= 63
+        assert name != z2jh.get_ray_cluster_name("jupyter-" + "a" * 61)
+
+        env = z2jh.get_ray_cluster_env("jupyter-alice-ray", "jhub")
+        head = "jupyter-alice-ray-head-svc.jhub.svc.cluster.local"
+        assert env["RAY_ADDRESS"] == f"ray://{head}:10001"
+        assert env["RAY_API_SERVER_ADDRESS"] == f"http://{head}:8265"
+
+    def test_network_policies(self, z2jh):
+        """Test that only the cluster's own server may reach its head."""
+        owner = {
+            "apiVersion": "ray.io/v1",
+            "kind": "RayCluster",
+            "metadata": {"name": "jupyter-alice-ray", "uid": "1234"},
+        }
+        head, server = z2jh.get_ray_cluster_network_policies(
+            "jupyter-alice-ray", "jhub", owner
+        )
+
+        assert head["spec"]["podSelector"]["matchLabels"] == {
+            "ray.io/cluster": "jupyter-alice-ray",
+            "ray.io/node-type": "head",
+        }
+        clients = [
+            rule
+            for rule in head["spec"]["ingress"]
+            if rule.get("ports") == [{"port": 10001}, {"port": 8265}]
+        ]
+        [source] = clients[0]["from"]
+        assert source["podSelector"]["matchLabels"] == {
+            "component": "singleuser-server",
+            z2jh.RAY_CLUSTER_LABEL: "jupyter-alice-ray",
+        }
+        assert server["spec"]["podSelector"] == source["podSelector"]
+        for policy in (head, server):
+            assert policy["metadata"]["ownerReferences"][0]["uid"] == "1234"
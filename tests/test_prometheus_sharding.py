@@ -0,0 +1,151 @@
+"""
+Tests for the sharded Prometheus of charts/kube-prometheus-stack, its sizing
+script and its long-term tier.
+"""
+
+import re
+import sys
+
+import pytest
+import yaml
+
+from .conftest import load_module
+
+
+@pytest.fixture(scope="module")
+def values(charts_dir):
+    """The values of the kube-prometheus-stack wrapper chart."""
+    return yaml.safe_load(
+        (charts_dir / "kube-prometheus-stack" / "values.yaml").read_text()
+    )
+
+
+@pytest.fixture(scope="module")
+def sizing(project_root):
+    """Import scripts/prometheus-sizing.py."""
+    return load_module(project_root / "scripts" / "prometheus-sizing.py")
+
+
+class TestPrometheusSharding:
+    """Test suite for the Prometheus shards and the Thanos query layer."""
+
+    def test_ray_workers_scraped_once(self, values, charts_dir):
+        """Test that only the Ray worker Prometheus selects the workers' PodMonitor."""
+        template = (
+            charts_dir
+            / "kube-prometheus-stack"
+            / "templates"
+            / "ray-servicemonitor.yaml"
+        ).read_text()
+        assert "ml-platform/prometheus: ray-workers" in template
+
+        selector = values["kube-prometheus-stack"]["prometheus"]["prometheusSpec"][
+            "podMonitorSelector"
+        ]
+        assert {
+            "key": "ml-platform/prometheus",
+            "operator": "NotIn",
+            "values": ["ray-workers"],
+        } in selector["matchExpressions"]
+
+    def test_scrape_configs_are_sharded(self, values, charts_dir):
+        """Test that every target is scraped by one shard only."""
+        prometheus_spec = values["kube-prometheus-stack"]["prometheus"][
+            "prometheusSpec"
+        ]
+        for scrape_config in prometheus_spec["additionalScrapeConfigs"]:
+            assert {
+                "source_labels": ["__tmp_hash"],
+                "action": "keep",
+                "regex": "$(SHARD)",
+            } in scrape_config["relabel_configs"], scrape_config["job_name"]
+
+        template = (
+            charts_dir
+            / "kube-prometheus-stack"
+            / "templates"
+            / "mlflow-servicemonitor.yaml"
+        ).read_text()
+        assert "kind: ServiceMonitor" in template
+        assert values["mlflowMetrics"]["enabled"]
+
+    def test_every_shard_is_queried(self, values, charts_dir):
+        """Test that the Thanos query fans out to the sidecars of both Prometheus."""
+        stack = values["kube-prometheus-stack"]["prometheus"]
+        assert stack["thanosService"]["enabled"]
+        assert stack["prometheusSpec"]["thanos"]["image"]
+        # replicas would be deduplicated away with the partial sums of shards
+        assert stack["prometheusSpec"].get("replicas", 1) == 1
+
+        template = (
+            charts_dir / "kube-prometheus-stack" / "templates" / "thanos-query.yaml"
+        ).read_text()
+        assert "-thanos-discovery." in template
+        assert "-ray-workers." in template
+        assert "--query.partial-response" in template
+
+    def test_shard_projection(self, sizing, monkeypatch, capsys):
+        """Test that the guide projects shards from the measured series."""
+        measured = {
+            "prometheus_tsdb_head_series": [({"pod": "prometheus-0"}, 1_000_000)],
+            "container_memory_working_set_bytes": [({"pod": "prometheus-0"}, 2**31)],
+            "scrape_samples_post_metric_relabeling": [
+                ({"job": "monitoring/ray-workers"}, 400_000),
+                ({"job": "kubelet"}, 600_000),
+            ],
+            "count(up": [({}, 100)],
+        }
+
+        def query(prometheus, promql):
+            return next(v for k, v in measured.items() if k in promql)
+
+        monkeypatch.setattr(sizing, "query", query)
+        monkeypatch.setattr(
+            sys, "argv", ["prometheus-sizing.py", "--workers", "100", "1000"]
+        )
+        sizing.main()
+        rows = [
+            line.split("|")[1:-1]
+            for line in capsys.readouterr().out.splitlines()
+            if line.startswith("| 1")
+        ]
+        # 2 KiB per series, 1.5x headroom and 8Gi shards
+        assert [cell.strip() for cell in rows[0]] == ["100", "400,000", "1", "1"]
+        assert [cell.strip() for cell in rows[1]] == ["1000", "4,000,000", "2", "1"]
+
+
+class TestLongTermStorage:
+    """Test suite for the downsampled long-term tier."""
+
+    @pytest.fixture
+    def overlay(self, charts_dir):
+        return yaml.safe_load(
+            (charts_dir / "kube-prometheus-stack" / "values-long-term.yaml").read_text()
+        )
+
+    def test_overlay_uploads_blocks(self, values, overlay):
+        """Test that the overlay enables the tier and points the sidecars at it."""
+        assert not values["longTermStorage"]["enabled"]
+        assert overlay["longTermStorage"]["enabled"]
+        spec = overlay["kube-prometheus-stack"]["prometheus"]["prometheusSpec"]
+        secret = spec["thanos"]["objectStorageConfig"]["existingSecret"]
+        assert secret == {
+            "name": values["longTermStorage"]["existingSecret"],
+            "key": "objstore.yml",
+        }
+
+    def test_retention_allows_downsampling(self, values):
+        """Test that raw and 5m blocks live long enough to be downsampled."""
+        units = {"h": 1, "d": 24, "w": 24 * 7, "y": 24 * 365}
+
+        def hours(duration):
+            value, unit = re.fullmatch(r"(\d+)([hdwy])", duration).groups()
+            return int(value) * units[unit]
+
+        retention = values["longTermStorage"]["retention"]
+        # 5m blocks are made from raw blocks older than 40h, 1h from 5m
+        # blocks older than 10 days
+        assert hours(retention["raw"]) > 40
+        assert hours(retention["5m"]) > 10 * 24
+        assert hours(retention["raw"]) <= hours(retention["5m"])
+        assert hours(retention["5m"]) <= hours(retention["1h"])
@@ -0,0 +1,234 @@
+"""
+Tests for the caching query frontend served by charts/kube-prometheus-stack.
+"""
+
+import json
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from .conftest import load_module
+
+NOW = 1_700_000_000
+
+
+@pytest.fixture(scope="module")
+def frontend_module(charts_dir):
+    """Import the query frontend from the chart's files."""
+    return load_module(
+        charts_dir / "kube-prometheus-stack" / "files" / "query-frontend.py"
+    )
+
+
+@pytest.fixture
+def upstream():
+    """A fake Prometheus whose series have the timestamp as their value."""
+    queries = []
+    state = {"warnings": False}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body):
+            body = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            params = dict(urllib.parse.parse_qsl(url.query))
+            queries.append((url.path, params))
+            self._send(200, {"status": "success", "data": ["up"]})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            params = dict(urllib.parse.parse_qsl(self.rfile.read(length).decode()))
+            queries.append((self.path, params))
+            time.sleep(0.05)
+            if params["query"] == "bad(":
+                return self._send(
+                    400, {"status": "error", "errorType": "bad_data", "error": "parse"}
+                )
+            start, end, step = (float(params[k]) for k in ("start", "end", "step"))
+            timestamps = []
+            t = start
+            while t <= end:
+                timestamps.append(t)
+                t += step
+            body = {
+                "status": "success",
+                "data": {
+                    "resultType": "matrix",
+                    "result": [
+                        {
+                            "metric": {"job": job},
+                            "values": [[t, str(t)] for t in timestamps],
+                        }
+                        for job in ("a", "b")
+                    ],
+                },
+            }
+            if state["warnings"]:
+                body["warnings"] = ["shard down"]
+            self._send(200, body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}", queries, state
+    server.shutdown()
+
+
+@pytest.fixture
+def clock():
+    return {"now": NOW}
+
+
+@pytest.fixture
+def frontend(frontend_module, upstream, clock):
+    """A query frontend with chunks of 10 steps and a 10 minute delay."""
+    endpoint, _, _ = upstream
+    return frontend_module.QueryFrontend(
+        endpoint,
+        1 << 20,
+        points_per_chunk=10,
+        max_delay=600,
+        fresh_ttl=10,
+        clock=lambda: clock["now"],
+    )
+
+
+def range_params(start, end, step="60", query="up"):
+    return [("query", query), ("start", str(start)), ("end", str(end)), ("step", step)]
+
+
+class TestQueryFrontend:
+    """Test suite for the caching query frontend."""
+
+    def test_parse_duration(self, frontend_module):
+        """Test that Prometheus durations and seconds are parsed into ms."""
+        assert frontend_module.parse_duration("1m30s") == 90_000
+        assert frontend_module.parse_duration("15") == 15_000
+        assert frontend_module.parse_duration("0.5") == 500
+        with pytest.raises(ValueError):
+            frontend_module.parse_duration("1x")
+
+    def test_split_query_is_merged(self, frontend, upstream):
+        """Test that a split range query returns every step of every series."""
+        _, queries, _ = upstream
+        start = NOW - 3600
+        status, _, body = frontend.request(
+            "POST", "/api/v1/query_range", range_params(start + 7, NOW)
+        )
+        assert status == 200
+        result = json.loads(body)["data"]["result"]
+        aligned = (start + 7) // 60 * 60
+        expected = [float(t) for t in range(aligned, NOW // 60 * 60 + 1, 60)]
+        assert [s["metric"]["job"] for s in result] == ["a", "b"]
+        for series in result:
+            assert [t for t, _ in series["values"]] == expected
+        # 61 steps in chunks of 10 steps aligned to the epoch
+        assert len(queries) == 7
+
+    def test_immutable_chunks_are_cached(self, frontend, upstream, clock):
+        """Test that only chunks within the delay are queried again."""
+        _, queries, _ = upstream
+        params = range_params(NOW - 3600, NOW)
+        frontend.request("GET", "/api/v1/query_range", params)
+        first = len(queries)
+        # within the fresh TTL, every chunk is served from the cache
+        frontend.request("GET", "/api/v1/query_range", params)
+        assert len(queries) == first
+
+        clock["now"] += 60
+        frontend.request("GET", "/api/v1/query_range", params)
+        refetched = [q for _, q in queries[first:]]
+        assert refetched
+        assert all(float(q["end"]) > NOW - 600 for q in refetched)
+        assert frontend.stats["hits"] > 0
+
+    def test_concurrent_queries_are_coalesced(self, frontend, upstream):
+        """Test that identical queries in flight reach upstream once."""
+        _, queries, _ = upstream
+        params = range_params(NOW - 600, NOW)
+        with ThreadPoolExecutor(10) as pool:
+            responses = list(
+                pool.map(
+                    lambda _: frontend.request("POST", "/api/v1/query_range", params),
+                    range(10),
+                )
+            )
+        assert len({body for _, _, body in responses}) == 1
+        assert len(queries) == 2
+        assert frontend.stats["coalesced"] + frontend.stats["hits"] == 18
+
+    def test_partial_responses_are_not_cached(self, frontend, upstream):
+        """Test that results with warnings are queried again."""
+        _, queries, state = upstream
+        state["warnings"] = True
+        params = range_params(NOW - 7200, NOW - 3600)
+        _, _, body = frontend.request("POST", "/api/v1/query_range", params)
+        assert json.loads(body)["warnings"] == ["shard down"]
+        first = len(queries)
+        frontend.request("POST", "/api/v1/query_range", params)
+        assert len(queries) == 2 * first
+
+    def test_errors_are_passed_on(self, frontend):
+        """Test that upstream errors reach the client with their status."""
+        status, _, body = frontend.request(
+            "POST", "/api/v1/query_range", range_params(NOW - 600, NOW, query="bad(")
+        )
+        assert status == 400
+        assert json.loads(body)["errorType"] == "bad_data"
+
+    def test_unreachable_upstream(self, frontend_module, upstream):
+        """Test that a stopped upstream is answered with a 502 in the API's shape."""
+        endpoint, _, _ = upstream
+        frontend = frontend_module.QueryFrontend(endpoint, 1 << 20)
+        with ThreadingHTTPServer(("127.0.0.1", 0), BaseHTTPRequestHandler) as stopped:
+            frontend.upstream = f"http://127.0.0.1:{stopped.server_port}"
+
+        for path, params in [
+            ("/api/v1/query_range", range_params(NOW - 1200, NOW - 1200)),
+            ("/api/v1/labels", {}),
+        ]:
+            status, content_type, body = frontend.request("GET", path, params)
+
+            assert status == 502
+            assert content_type == "application/json"
+            assert json.loads(body)["errorType"] == "unavailable"
+        assert frontend.stats["upstream_errors"] == 2
+
+    def test_other_requests_are_cached_briefly(self, frontend, upstream, clock):
+        """Test that other API requests are cached for the fresh TTL."""
+        _, queries, _ = upstream
+        params = [("match[]", "up")]
+        frontend.request("GET", "/api/v1/labels", params)
+        frontend.request("GET", "/api/v1/labels", params)
+        assert len(queries) == 1
+        clock["now"] += 11
+        frontend.request("GET", "/api/v1/labels", params)
+        assert len(queries) == 2
+
+    def test_eviction(self, frontend_module, upstream):
+        """Test that the least recently used results are evicted over budget."""
+        endpoint, _, _ = upstream
+        frontend = frontend_module.QueryFrontend(
+            endpoint, 3000, points_per_chunk=10, clock=lambda: NOW
+        )
+        for hour in range(3, 0, -1):
+            frontend.request(
+                "GET",
+                "/api/v1/query_range",
+                range_params(NOW - 3600 * hour, NOW - 3600 * hour + 540),
+            )
+        assert frontend.stats["evictions"] > 0
+        assert 0 < frontend._size <= 3000
+        assert "query_frontend_evictions_total" in frontend.metrics()
@@ -0,0 +1,385 @@
+"""
+Tests for the RayCluster rendered by charts/ray-cluster.
+"""
+
+import json
+import shutil
+
+import pytest
+import yaml
+
+from .conftest import run_command
+
+
+@pytest.fixture
+def render_ray_cluster(charts_dir, tmp_path):
+    """
+    Render the chart's RayCluster, or its resources of a kind, with values
+    layered over values.yaml.
+    """
+    if not shutil.which("helm"):
+        pytest.skip("helm not installed")
+
+    def render(values=None, kind=None):
+        cmd = ["helm", "template", "test", str(charts_dir / "ray-cluster")]
+        if values:
+            values_file = tmp_path / "values.yaml"
+            values_file.write_text(yaml.safe_dump(values))
+            cmd += ["--values", str(values_file)]
+        result = run_command(cmd)
+        assert result.returncode == 0, result.stderr
+        docs = [doc for doc in yaml.safe_load_all(result.stdout) if doc]
+        [ray_cluster] = [doc for doc in docs if doc["kind"] == "RayCluster"]
+        if kind:
+            return [doc for doc in docs if doc["kind"] == kind]
+        return ray_cluster
+
+    return render
+
+
+def worker_groups(ray_cluster):
+    return {g["groupName"]: g for g in ray_cluster["spec"]["workerGroupSpecs"]}
+
+
+class TestRayClusterAutoscaling:
+    """Test suite for the worker groups and autoscaling of the Ray cluster."""
+
+    def test_default_layout(self, render_ray_cluster):
+        """Test the default worker groups and their autoscaling settings."""
+        ray_cluster = render_ray_cluster()
+        spec = ray_cluster["spec"]
+        assert spec["enableInTreeAutoscaling"] is True
+        assert spec["autoscalerOptions"]["version"] == "v2"
+
+        groups = worker_groups(ray_cluster)
+        assert set(groups) == {"cpu-optimized", "memory-optimized", "serve"}
+        for group in groups.values():
+            assert group["minReplicas"] <= group["replicas"] <= group["maxReplicas"]
+            assert "idleTimeoutSeconds" in group
+            [container] = group["template"]["spec"]["containers"]
+            resources = container["resources"]
+            assert resources["requests"] == resources["limits"]
+            assert container["env"], "worker template is not merged in"
+
+        # idle cpu and memory workers scale down to zero
+        assert groups["cpu-optimized"]["minReplicas"] == 0
+        assert groups["memory-optimized"]["minReplicas"] == 0
+        assert groups["memory-optimized"]["rayStartParams"]["resources"] == (
+            '"{\\"memory_optimized\\":1}"'
+        )
+
+    def test_static_layout(self, render_ray_cluster):
+        """Test a fixed size cluster without the autoscaler."""
+        ray_cluster = render_ray_cluster(
+            {
+                "autoscaling": {"enabled": False},
+                "spec": {
+                    "workerGroupSpecs": [
+                        {"groupName": "workers", "replicas": 3, "maxReplicas": 3}
+                    ]
+                },
+            }
+        )
+        assert "enableInTreeAutoscaling" not in ray_cluster["spec"]
+        assert "autoscalerOptions" not in ray_cluster["spec"]
+        [group] = ray_cluster["spec"]["workerGroupSpecs"]
+        assert group["replicas"] == 3
+        assert group["template"]["spec"]["containers"][0]["name"] == "ray-worker"
+
+    def test_v1_autoscaler_drops_group_idle_timeouts(self, render_ray_cluster):
+        """Test that only the cluster wide idle timeout is used with v1."""
+        ray_cluster = render_ray_cluster(
+            {"autoscaling": {"version": "v1", "idleTimeoutSeconds": 120}}
+        )
+        assert ray_cluster["spec"]["autoscalerOptions"]["idleTimeoutSeconds"] == 120
+        for group in ray_cluster["spec"]["workerGroupSpecs"]:
+            assert "idleTimeoutSeconds" not in group
+
+    def test_disabled_group(self, render_ray_cluster, charts_dir):
+        """Test that a worker group can be disabled."""
+        values = yaml.safe_load(
+            (charts_dir / "ray-cluster" / "values.yaml").read_text()
+        )
+        groups = values["spec"]["workerGroupSpecs"]
+        for group in groups:
+            if group["groupName"] == "serve":
+                group["enabled"] = False
+        ray_cluster = render_ray_cluster({"spec": {"workerGroupSpecs": groups}})
+        assert set(worker_groups(ray_cluster)) == {"cpu-optimized", "memory-optimized"}
+
+    def test_min_above_max_fails(self, charts_dir):
+        """Test that a group with minReplicas above maxReplicas is rejected."""
+        if not shutil.which("helm"):
+            pytest.skip("helm not installed")
+        result = run_command(
+            [
+                "helm",
+                "template",
+                "test",
+                str(charts_dir / "ray-cluster"),
+                "--set",
+                "spec.workerGroupSpecs[0].groupName=workers",
+                "--set",
+                "spec.workerGroupSpecs[0].minReplicas=4",
+                "--set",
+                "spec.workerGroupSpecs[0].maxReplicas=2",
+            ]
+        )
+        assert result.returncode != 0
+        assert "minReplicas 4 is above maxReplicas 2" in result.stderr
+
+
+def ray_container(group):
+    return group["template"]["spec"]["containers"][0]
+
+
+def env(container):
+    return {e["name"]: e.get("value", e.get("valueFrom")) for e in container["env"]}
+
+
+class TestRayObjectStore:
+    """Test suite for the object store sizing and spilling of the Ray cluster."""
+
+    def test_sized_from_memory_limit(self, render_ray_cluster):
+        """Test that the object store and /dev/shm are sized from the limit."""
+        ray_cluster = render_ray_cluster()
+        groups = worker_groups(ray_cluster)
+        for group, memory, fraction in (
+            (groups["cpu-optimized"], 8 * 2**30, 0.3),
+            (groups["memory-optimized"], 32 * 2**30, 0.5),
+            (ray_cluster["spec"]["headGroupSpec"], 4 * 2**30, 0.3),
+        ):
+            object_store_memory = int(group["rayStartParams"]["object-store-memory"])
+            assert object_store_memory == int(memory * fraction)
+
+            [shm] = [
+                v for v in group["template"]["spec"]["volumes"] if v["name"] == "dshm"
+            ]
+            assert shm["emptyDir"]["medium"] == "Memory"
+            assert object_store_memory < int(shm["emptyDir"]["sizeLimit"]) < memory
+            assert {"name": "dshm", "mountPath": "/dev/shm"} in ray_container(group)[
+                "volumeMounts"
+            ]
+
+    def test_spill_to_local_volume(self, render_ray_cluster):
+        """Test spilling to a dedicated local PV with a write buffer."""
+        ray_cluster = render_ray_cluster(
+            {"objectStore": {"spilling": {"local": {"storageClassName": "local-ssd"}}}}
+        )
+        group = worker_groups(ray_cluster)["cpu-optimized"]
+        spill_config = json.loads(
+            env(ray_container(group))["RAY_object_spilling_config"]
+        )
+        assert spill_config == {
+            "type": "filesystem",
+            "params": {"directory_path": "/ray-spill", "buffer_size": 1048576},
+        }
+        [volume] = [
+            v for v in group["template"]["spec"]["volumes"] if v["name"] == "ray-spill"
+        ]
+        claim = volume["ephemeral"]["volumeClaimTemplate"]["spec"]
+        assert claim["storageClassName"] == "local-ssd"
+
+    def test_spill_to_minio(self, render_ray_cluster):
+        """Test spilling to a MinIO bucket through smart_open."""
+        ray_cluster = render_ray_cluster(
+            {"objectStore": {"spilling": {"type": "s3", "s3": {"prefix": "dev"}}}}
+        )
+        container = ray_container(ray_cluster["spec"]["headGroupSpec"])
+        spill_env = env(container)
+        assert json.loads(spill_env["RAY_object_spilling_config"]) == {
+            "type": "smart_open",
+            "params": {"uri": "s3://ray-spill/dev", "buffer_size": 8388608},
+        }
+        assert spill_env["AWS_ENDPOINT_URL"].startswith("http://minio.")
+        assert "RAY_GRAFANA_HOST" in spill_env
+        volumes = ray_cluster["spec"]["headGroupSpec"]["template"]["spec"]["volumes"]
+        assert [v["name"] for v in volumes] == ["dshm"]
+
+    def test_shm_must_hold_the_object_store(self, charts_dir):
+        """Test that a /dev/shm smaller than the object store is rejected."""
+        if not shutil.which("helm"):
+            pytest.skip("helm not installed")
+        result = run_command(
+            [
+                "helm",
+                "template",
+                "test",
+                str(charts_dir / "ray-cluster"),
+                "--set",
+                "objectStore.shmFraction=0.1",
+            ]
+        )
+        assert result.returncode != 0
+        assert "would not fit in /dev/shm" in result.stderr
+
+
+class TestRayColdStart:
+    """Test suite for the cold start reduction of Ray workers."""
+
+    def test_image_warmer_pulls_all_images(self, render_ray_cluster):
+        """Test that the image warmer pulls every head and worker image once."""
+        [daemonset] = render_ray_cluster(
+            {
+                "spec": {
+                    "workerGroupSpecs": [
+                        {"groupName": "cpu", "maxReplicas": 2},
+                        {
+                            "groupName": "gpu",
+                            "maxReplicas": 2,
+                            "template": {
+                                "spec": {
+                                    "containers": [
+                                        {
+                                            "name": "ray-worker",
+                                            "image": "rayproject/ray:2.48.0-py312-gpu",
+                                        }
+                                    ]
+                                }
+                            },
+                        },
+                    ]
+                },
+                "imageWarmer": {
+                    "enabled": True,
+                    "extraImages": ["registry.local/trainer:1.0.0"],
+                    "nodeSelector": {"node-pool": "ray-workers"},
+                },
+            },
+            kind="DaemonSet",
+        )
+        pod_spec = daemonset["spec"]["template"]["spec"]
+        assert pod_spec["nodeSelector"] == {"node-pool": "ray-workers"}
+        assert [c["image"] for c in pod_spec["initContainers"]] == [
+            "rayproject/ray:2.48.0-py312-cpu",
+            "rayproject/ray:2.48.0-py312-gpu",
+            "registry.local/trainer:1.0.0",
+        ]
+
+    def test_image_warmer_is_opt_in(self, render_ray_cluster):
+        """Test that images are not pulled onto every node by default."""
+        assert render_ray_cluster(kind="DaemonSet") == []
+
+    def test_prestarted_workers(self, render_ray_cluster):
+        """Test that prestart has workers start early and preload modules."""
+        ray_cluster = render_ray_cluster(
+            {"prestart": {"enabled": True, "preloadModules": ["numpy", "xgboost"]}}
+        )
+        for group in ray_cluster["spec"]["workerGroupSpecs"]:
+            container = ray_container(group)
+            assert container["imagePullPolicy"] == "IfNotPresent"
+            worker_env = env(container)
+            assert worker_env["RAY_enable_worker_prestart"] == "true"
+            assert worker_env["RAY_preload_python_modules"] == "numpy,xgboost"
+
+        ray_cluster = render_ray_cluster()
+        container = ray_container(worker_groups(ray_cluster)["cpu-optimized"])
+        assert "RAY_enable_worker_prestart" not in env(container)
+
+
+def dedicated_values(charts_dir, **profile):
+    """Returns values with the cpu-dedicated group enabled."""
+    values = yaml.safe_load((charts_dir / "ray-cluster" / "values.yaml").read_text())
+    groups = values["spec"]["workerGroupSpecs"]
+    for group in groups:
+        group["enabled"] = True
+    return {"spec": {"workerGroupSpecs": groups}, "profiles": {"dedicated": profile}}
+
+
+class TestRayDedicatedProfile:
+    """Test suite for the dedicated worker profile with exclusive cores."""
+
+    def test_guaranteed_cores(self, render_ray_cluster, charts_dir):
+        """Test that dedicated workers get whole cores and spread across nodes."""
+        ray_cluster = render_ray_cluster(dedicated_values(charts_dir))
+        group = worker_groups(ray_cluster)["cpu-dedicated"]
+        assert group["rayStartParams"]["num-cpus"] == "4"
+        assert group["rayStartParams"]["resources"] == '"{\\"dedicated_cpu\\":4}"'
+
+        container = ray_container(group)
+        assert container["resources"]["requests"] == container["resources"]["limits"]
+        assert env(container)["RAY_WORKER_PROFILE"] == "dedicated"
+
+        affinity = group["template"]["spec"]["affinity"]["podAntiAffinity"]
+        [term] = affinity["preferredDuringSchedulingIgnoredDuringExecution"]
+        assert term["podAffinityTerm"]["topologyKey"] == "kubernetes.io/hostname"
+        assert term["podAffinityTerm"]["labelSelector"]["matchLabels"] == {
+            "ray.io/cluster": "test",
+            "ray.io/group": "cpu-dedicated",
+        }
+
+        # the other groups share cores
+        shared = worker_groups(ray_cluster)["cpu-optimized"]
+        assert "num-cpus" not in shared["rayStartParams"]
+        assert "affinity" not in shared["template"]["spec"]
+
+    def test_hugepages(self, render_ray_cluster, charts_dir):
+        """Test that hugepages are reserved and mounted when enabled."""
+        ray_cluster = render_ray_cluster(
+            dedicated_values(charts_dir, hugepages={"enabled": True, "size": "2Gi"})
+        )
+        group = worker_groups(ray_cluster)["cpu-dedicated"]
+        resources = ray_container(group)["resources"]
+        assert resources["limits"]["hugepages-2Mi"] == "2Gi"
+        assert resources["requests"] == resources["limits"]
+        [volume] = [
+            v for v in group["template"]["spec"]["volumes"] if v["name"] == "hugepages"
+        ]
+        assert volume["emptyDir"]["medium"] == "HugePages-2Mi"
+
+    def test_fractional_cpu_fails(self, charts_dir, tmp_path):
+        """Test that a dedicated group without whole cores is rejected."""
+        if not shutil.which("helm"):
+            pytest.skip("helm not installed")
+        values = dedicated_values(charts_dir)
+        for group in values["spec"]["workerGroupSpecs"]:
+            if group["groupName"] == "cpu-dedicated":
+                group["resources"]["limits"]["cpu"] = "3500m"
+                group["resources"]["requests"]["cpu"] = "3500m"
+        values_file = tmp_path / "values.yaml"
+        values_file.write_text(yaml.safe_dump(values))
+        result = run_command(
+            [
+                "helm",
+                "template",
+                "test",
+                str(charts_dir / "ray-cluster"),
+                "--values",
+                str(values_file),
+            ]
+        )
+        assert result.returncode != 0
+        assert "needs an integer CPU limit" in result.stderr
+
+    def test_benchmark(self, render_ray_cluster):
+        """Test the helm test comparing shared and dedicated cores."""
+        assert render_ray_cluster(kind="Pod") == []
+        [pod] = render_ray_cluster({"benchmark": {"enabled": True}}, kind="Pod")
+        assert pod["metadata"]["annotations"]["helm.sh/hook"] == "test"
+        [container] = pod["spec"]["containers"]
+        benchmark_env = env(container)
+        assert benchmark_env["RAY_ADDRESS"] == "ray://test-head-svc:10001"
+        runs = json.loads(benchmark_env["BENCHMARK_RUNS"])
+        assert [run["name"] for run in runs] == ["shared", "dedicated"]
+
+
+class TestRayProfiling:
+    """Test suite for opting the Ray pods in to continuous profiling."""
+
+    def test_pods_are_annotated(self, render_ray_cluster):
+        """Test that profiling annotates the head and every worker group."""
+        annotation = "profiling.microplat.io/enabled"
+        ray_cluster = render_ray_cluster({"profiling": {"enabled": True}})
+        spec = ray_cluster["spec"]
+        templates = [spec["headGroupSpec"]["template"]] + [
+            group["template"] for group in spec["workerGroupSpecs"]
+        ]
+        for template in templates:
+            annotations = template["metadata"]["annotations"]
+            assert annotations[annotation] == "true"
+            # the scrape annotations are kept
+            assert annotations["prometheus.io/scrape"] == "true"
+
+        ray_cluster = render_ray_cluster()
+        head = ray_cluster["spec"]["headGroupSpec"]["template"]
+        assert annotation not in head["metadata"]["annotations"]
@@ -0,0 +1,150 @@
+"""
+Tests for the Ray recording rules and the dashboards that query them.
+"""
+
+import json
+import re
+
+import pytest
+import yaml
+
+# Raw series the Ray dashboards may still query, by metric name prefix. These
+# are a single series per cluster or per run, or come from dashboards of
+# workloads this platform does not run.
+RAW_SERIES_ALLOWLIST = {
+    "ray_serve_controller_": "exported once by the Serve controller",
+    "ray_serve_num_scheduling_tasks": "exported once by the Serve controller",
+    "ray_train_": "a few series per Ray Train run",
+    "ray_vllm:": "Serve LLM dashboard, no LLMs are served",
+    "ray_serve_llm_": "Serve LLM dashboard, no LLMs are served",
+    "traces_span_metrics_": "span metrics of the tracing collector, with exemplars",
+}
+
+KEYWORDS = {"by", "on", "and", "or", "unless", "without", "ignoring", "bool"}
+
+
+@pytest.fixture(scope="module")
+def recorded(charts_dir):
+    """The recorded series of rules/ray.rules.yaml and the labels they keep."""
+    rules_file = charts_dir / "kube-prometheus-stack" / "rules" / "ray.rules.yaml"
+    recorded = {}
+    for group in yaml.safe_load(rules_file.read_text())["groups"]:
+        for rule in group["rules"]:
+            assert rule["record"] not in recorded, f"{rule['record']} recorded twice"
+            labels = re.match(r"sum by \(([^)]*)\)", rule["expr"]).group(1)
+            recorded[rule["record"]] = {
+                "labels": {label.strip() for label in labels.split(",")},
+                "expr": rule["expr"],
+            }
+    return recorded
+
+
+@pytest.fixture(scope="module")
+def dashboard_queries(project_root, charts_dir):
+    """Every panel and variable query of the Ray dashboards."""
+    files = sorted((project_root / "dashboards").glob("*.json"))
+    files.append(
+        charts_dir / "kube-prometheus-stack" / "dashboards" / "ray-cluster.json"
+    )
+    queries = []
+
+    def walk(name, node):
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key in ("expr", "query", "definition") and isinstance(value, str):
+                    queries.append((name, value))
+                else:
+                    walk(name, value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(name, value)
+
+    for path in files:
+        dashboard = json.loads(path.read_text())
+        walk(path.name, dashboard.get("panels", []))
+        walk(path.name, dashboard.get("templating", {}))
+    return sorted({(name, query) for name, query in queries if query != "prometheus"})
+
+
+def selectors(query):
+    """Returns the metric names, or __name__ regexes, and labels of a query."""
+    label_values = re.fullmatch(r"label_values\((.*),\s*(\w+)\)", query)
+    if label_values:
+        query, label = label_values.groups()
+        return [(name, labels | {label}) for name, labels in selectors(query)]
+    found = []
+    for match in re.finditer(r"([a-zA-Z_:][a-zA-Z0-9_:]*)?\{([^}]*)\}", query):
+        name, matchers = match.groups()
+        names = re.search(r'__name__\s*=~?\s*"([^"]*)"', matchers)
+        labels = {
+            m.group(1)
+            for m in re.finditer(r"([a-zA-Z_]\w*)\s*(?:=~|!~|!=|=)", matchers)
+        }
+        labels.discard("__name__")
+        found.append((names.group(1) if names else name, labels))
+    # bare metric names, without any matchers
+    bare = re.sub(r'"[^"]*"|\'[^\']*\'|\{[^}]*\}|\[[^\]]*\]|\$\w+', " ", query)
+    bare = re.sub(
+        r"\b(?:by|on|without|ignoring|group_left|group_right)\s*\([^)]*\)", " ", bare
+    )
+    for name in re.findall(r"(?<![\w.])([a-zA-Z_:][\w:]*)\b(?!\s*\()", bare):
+        if name not in KEYWORDS and not re.fullmatch(r"e\d+", name):
+            found.append((name, set()))
+    return [(name, labels) for name, labels in found if name]
+
+
+class TestRayRecordingRules:
+    """Test suite for the recording rules of the Ray dashboards."""
+
+    def test_dashboards_query_recorded_series(self, recorded, dashboard_queries):
+        """Test that every dashboard query reads recorded or allowlisted series."""
+        raw = []
+        for dashboard, query in dashboard_queries:
+            for name, labels in selectors(query):
+                if name.startswith(tuple(RAW_SERIES_ALLOWLIST)):
+                    continue
+                matching = [r for r in recorded if re.fullmatch(name, r)]
+                if not matching:
+                    raw.append(f"{dashboard}: {name} in {query}")
+                    continue
+                for record in matching:
+                    dropped = labels - recorded[record]["labels"]
+                    assert not dropped, f"{dashboard}: {record} has no {dropped}"
+        assert not raw, "queries of raw series:\n" + "\n".join(raw)
+
+    def test_grouping_labels_are_kept(self, recorded, dashboard_queries):
+        """Test that dashboards only group recorded series by labels they keep."""
+        for dashboard, query in dashboard_queries:
+            kept = set()
+            for name, _ in selectors(query):
+                kept |= {
+                    label
+                    for record, rule in recorded.items()
+                    if re.fullmatch(name, record)
+                    for label in rule["labels"]
+                }
+            if not kept:
+                continue
+            for grouping in re.findall(r"\bby\s*\(([^)]*)\)", query):
+                for label in filter(None, map(str.strip, grouping.split(","))):
+                    assert label in kept, f"{dashboard}: {label} is not kept"
+
+    def test_sources_are_not_dropped(self, recorded, charts_dir):
+        """Test that no recorded metric is dropped at scrape time."""
+        values = yaml.safe_load(
+            (charts_dir / "kube-prometheus-stack" / "values.yaml").read_text()
+        )
+        drops = [
+            relabeling["regex"]
+            for relabeling in values["rayMetrics"]["metricRelabelings"]
+            if relabeling.get("action") == "drop"
+        ]
+        for record, rule in recorded.items():
+            source = re.search(
+                r"\((?:rate\()?([a-zA-Z_:]\w*)(?:\[\w+\]\))?\)$", rule["expr"]
+            )
+            assert source, f"{record} has no source metric"
+            for regex in drops:
+                assert not re.fullmatch(
+                    regex, source.group(1)
+                ), f"{source.group(1)} of {record} is dropped by {regex}"
@@ -0,0 +1,140 @@
+"""
+Tests for the RayService rendered by charts/ray-serve.
+"""
+
+import shutil
+
+import pytest
+import yaml
+
+from .conftest import load_module, run_command
+
+
+@pytest.fixture
+def render_ray_service(charts_dir, tmp_path):
+    """
+    Render the chart's RayService with values layered over values.yaml, or
+    return the failed helm result with expect_failure.
+    """
+    if not shutil.which("helm"):
+        pytest.skip("helm not installed")
+
+    def render(values=None, expect_failure=False):
+        cmd = ["helm", "template", "test", str(charts_dir / "ray-serve")]
+        if values:
+            values_file = tmp_path / "values.yaml"
+            values_file.write_text(yaml.safe_dump(values))
+            cmd += ["--values", str(values_file)]
+        result = run_command(cmd)
+        if expect_failure:
+            assert result.returncode != 0
+            return result
+        assert result.returncode == 0, result.stderr
+        docs = [doc for doc in yaml.safe_load_all(result.stdout) if doc]
+        [ray_service] = [doc for doc in docs if doc["kind"] == "RayService"]
+        return ray_service
+
+    return render
+
+
+def deployments(ray_service):
+    serve_config = yaml.safe_load(ray_service["spec"]["serveConfigV2"])
+    return {
+        f"{application['name']}/{deployment['name']}": deployment
+        for application in serve_config["applications"]
+        for deployment in application["deployments"]
+    }
+
+
+class TestRayServiceChart:
+    """Test suite for the RayService of the serve image and its autoscaling."""
+
+    def test_default_layout(self, render_ray_service):
+        """Test the default application, its autoscaling and the Ray cluster."""
+        ray_service = render_ray_service()
+
+        predictor = deployments(ray_service)["predictor/Predictor"]
+        autoscaling = predictor["autoscaling_config"]
+        assert autoscaling["min_replicas"] <= autoscaling["max_replicas"]
+        assert (
+            predictor["max_ongoing_requests"] >= autoscaling["target_ongoing_requests"]
+        )
+        assert autoscaling["upscale_delay_s"] < autoscaling["downscale_delay_s"]
+        assert predictor["max_queued_requests"] > 0
+
+        cluster = ray_service["spec"]["rayClusterConfig"]
+        assert cluster["enableInTreeAutoscaling"] is True
+        # replicas only run on the workers the autoscaler adds
+        assert cluster["headGroupSpec"]["rayStartParams"]["num-cpus"] == "0"
+        [workers] = cluster["workerGroupSpecs"]
+        assert workers["minReplicas"] <= workers["maxReplicas"]
+        [container] = workers["template"]["spec"]["containers"]
+        assert {port["name"] for port in container["ports"]} >= {"serve", "metrics"}
+
+    def test_deployments_override_defaults(self, render_ray_service, charts_dir):
+        """Test that a deployment's own settings are merged over the defaults."""
+        values = yaml.safe_load((charts_dir / "ray-serve" / "values.yaml").read_text())
+        [application] = values["serveConfig"]["applications"]
+        application["deployments"] = [
+            {
+                "name": "Predictor",
+                "autoscaling_config": {"max_replicas": 32, "upscale_delay_s": 5},
+            }
+        ]
+
+        predictor = deployments(render_ray_service(values))["predictor/Predictor"]
+
+        autoscaling = predictor["autoscaling_config"]
+        assert autoscaling["max_replicas"] == 32
+        assert autoscaling["upscale_delay_s"] == 5
+        assert autoscaling["downscale_delay_s"] == 600
+        assert predictor["ray_actor_options"] == {"num_cpus": 1}
+
+    def test_args_are_those_of_the_serve_image(self, render_ray_service, docker_dir):
+        """Test that the application's args are accepted by the serve image."""
+        ray_service = render_ray_service()
+        serve_config = yaml.safe_load(ray_service["spec"]["serveConfigV2"])
+        [application] = serve_config["applications"]
+        args = application["args"]
+
+        prediction_cache = load_module(
+            docker_dir / "serve" / "src" / "prediction_cache.py"
+        )
+        config = dict(args["prediction_cache"])
+        assert config.pop("scope") in ("replica", "cluster", "none")
+        prediction_cache.PredictionCache(**config)
+
+        admission = load_module(docker_dir / "serve" / "src" / "admission.py")
+        admission.AdmissionController(**args["admission"])
+
+    def test_target_above_max_ongoing_requests_fails(self, render_ray_service):
+        """Test that replicas that could never reach their target are refused."""
+        result = render_ray_service(
+            {"deploymentDefaults": {"max_ongoing_requests": 64}},
+            expect_failure=True,
+        )
+        assert "target_ongoing_requests" in result.stderr
+
+    def test_models_volume(self, render_ray_service):
+        """Test that a models claim is mounted read-only into every pod."""
+        ray_service = render_ray_service({"models": {"existingClaim": "models"}})
+
+        cluster = ray_service["spec"]["rayClusterConfig"]
+        for group in [cluster["headGroupSpec"], *cluster["workerGroupSpecs"]]:
+            spec = group["template"]["spec"]
+            [mount] = [
+                m
+                for m in spec["containers"][0]["volumeMounts"]
+                if m["name"] == "models"
+            ]
+            assert mount["readOnly"] is True
+            [volume] = [v for v in spec["volumes"] if v["name"] == "models"]
+            assert volume["persistentVolumeClaim"]["claimName"] == "models"
+
+    def test_admission_above_max_ongoing_requests_fails(self, render_ray_service):
+        """Test that replicas cannot be sent fewer requests than they admit."""
+        result = render_ray_service(
+            {"deploymentDefaults": {"max_ongoing_requests": 512}},
+            expect_failure=True,
+        )
+        assert "admission" in result.stderr
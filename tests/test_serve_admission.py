@@ -0,0 +1,154 @@
+"""
+Tests for the admission control of the serve image's replicas.
+"""
+
+import asyncio
+
+import pytest
+
+from .conftest import Counter, load_module
+
+
+@pytest.fixture(scope="module")
+def admission(docker_dir):
+    """Import docker/serve/src/admission.py."""
+    return load_module(docker_dir / "serve" / "src" / "admission.py")
+
+
+async def serve(controller, order, name, priority_class=None, seconds=0.01):
+    """A request holding its place in flight for seconds once admitted."""
+    ticket = await controller.acquire(priority_class)
+    order.append(name)
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        controller.release(ticket)
+    return name
+
+
+class TestAdmissionController:
+    """Test suite for the bounded, prioritized queue of a replica's requests."""
+
+    def test_in_flight_bound_and_priority(self, admission):
+        """Test that queued requests are admitted by class, then arrival."""
+        controller = admission.AdmissionController(max_in_flight=1, max_queued=8)
+        order = []
+
+        async def run():
+            first = asyncio.ensure_future(serve(controller, order, "first"))
+            await asyncio.sleep(0)
+            queued = [
+                asyncio.ensure_future(serve(controller, order, name, priority_class))
+                for name, priority_class in [
+                    ("batch-1", "batch"),
+                    ("interactive-1", None),
+                    ("batch-2", "batch"),
+                    ("interactive-2", "interactive"),
+                ]
+            ]
+            await asyncio.sleep(0)
+            assert controller.in_flight == 1 and len(controller) == 4
+            await asyncio.gather(first, *queued)
+
+        asyncio.run(run())
+
+        assert order == [
+            "first",
+            "interactive-1",
+            "interactive-2",
+            "batch-1",
+            "batch-2",
+        ]
+        assert controller.in_flight == 0 and len(controller) == 0
+
+    def test_full_queue_sheds_lowest_priority(self, admission):
+        """Test that a full queue displaces batch requests, then refuses."""
+        shed = Counter("reason", "priority_class")
+        controller = admission.AdmissionController(
+            max_in_flight=1, max_queued=1, shed=shed
+        )
+        order = []
+
+        async def run():
+            first = asyncio.ensure_future(serve(controller, order, "first"))
+            await asyncio.sleep(0)
+            batch = asyncio.ensure_future(serve(controller, order, "batch", "batch"))
+            await asyncio.sleep(0)
+            interactive = asyncio.ensure_future(serve(controller, order, "interactive"))
+            await asyncio.sleep(0)
+            with pytest.raises(admission.Rejected) as full:
+                await controller.acquire("interactive")
+            return (
+                full.value,
+                await asyncio.gather(first, batch, interactive, return_exceptions=True),
+            )
+
+        full, (first, batch, interactive) = asyncio.run(run())
+
+        assert isinstance(batch, admission.Rejected)
+        assert (batch.reason, batch.status) == ("displaced", 429)
+        assert (full.reason, full.status) == ("queue_full", 503)
+        assert full.retry_after >= 1
+        assert interactive == "interactive"
+        assert shed.counts == {
+            ("displaced", "batch"): 1,
+            ("queue_full", "interactive"): 1,
+        }
+
+    def test_without_a_queue(self, admission):
+        """Test that with max_queued 0 requests beyond those in flight are shed."""
+        shed = Counter("reason", "priority_class")
+        controller = admission.AdmissionController(
+            max_in_flight=1, max_queued=0, shed=shed
+        )
+
+        async def run():
+            ticket = await controller.acquire()
+            with pytest.raises(admission.Rejected) as full:
+                await controller.acquire("batch")
+            controller.release(ticket)
+            controller.release(await controller.acquire())
+            return full.value
+
+        full = asyncio.run(run())
+
+        assert (full.reason, full.status) == ("queue_full", 503)
+        assert shed.counts == {("queue_full", "batch"): 1}
+        assert controller.in_flight == 0
+
+    def test_requests_past_their_deadline_are_shed(self, admission):
+        """Test that requests that cannot be served in time are dropped early."""
+        shed = Counter("reason", "priority_class")
+        controller = admission.AdmissionController(
+            max_in_flight=1, max_queued=8, shed=shed
+        )
+        order = []
+
+        async def run():
+            # teaches the controller that requests take 50ms
+            await serve(controller, order, "warm", seconds=0.05)
+            slow = asyncio.ensure_future(serve(controller, order, "slow", seconds=0.05))
+            await asyncio.sleep(0)
+            with pytest.raises(admission.Rejected) as early:
+                await controller.acquire(budget_ms=20)
+            waited = asyncio.ensure_future(controller.acquire(budget_ms=70))
+            await asyncio.sleep(0)
+            results = await asyncio.gather(slow, waited, return_exceptions=True)
+            return early.value, results
+
+        early, (slow, waited) = asyncio.run(run())
+
+        assert (early.reason, early.status) == ("deadline", 503)
+        assert slow == "slow"
+        # admissible when it arrived, but no longer once its turn came
+        assert isinstance(waited, admission.Rejected)
+        assert waited.reason == "deadline"
+        assert shed.counts == {("deadline", "interactive"): 2}
+        assert controller.in_flight == 0
+
+    def test_unknown_priority_class(self, admission):
+        """Test that requests of unknown classes are refused."""
+        controller = admission.AdmissionController()
+
+        with pytest.raises(ValueError, match="interactive, batch"):
+            asyncio.run(controller.acquire("urgent"))
@@ -0,0 +1,96 @@
+"""
+Tests for the Ray Serve application of the serve image.
+"""
+
+import importlib
+
+import numpy as np
+import pytest
+
+from .conftest import load_module
+
+
+@pytest.fixture(scope="module")
+def serve_app(docker_dir):
+    """Import docker/serve/src/serve.py, where Ray Serve and FastAPI are."""
+    pytest.importorskip("fastapi")
+    pytest.importorskip("ray.serve")
+    load_module(docker_dir / "serve" / "src", "serve_src")
+    return importlib.import_module("serve_src.serve")
+
+
+class Deployment:
+    """Records the options and arguments a deployment is bound with."""
+
+    def __init__(self):
+        self.options_kwargs = None
+        self.bind_kwargs = None
+
+    def options(self, **kwargs):
+        self.options_kwargs = kwargs
+        return self
+
+    def bind(self, **kwargs):
+        self.bind_kwargs = kwargs
+        return self
+
+
+class TestServeApp:
+    """Test suite for the application builders and request helpers."""
+
+    def test_max_ongoing_requests(self, serve_app):
+        """Test that Serve sends a replica what its admission runs and queues."""
+        assert serve_app._max_ongoing_requests({}, 256) == 1024
+        assert (
+            serve_app._max_ongoing_requests(
+                {"admission": {"max_in_flight": 64, "max_queued": 16}}, 256
+            )
+            == 80
+        )
+        assert serve_app._max_ongoing_requests({"max_ongoing_requests": "8"}, 256) == 8
+
+    def test_build_app(self, serve_app, monkeypatch):
+        """Test that build_app binds Predictor with its args and defaults."""
+        predictor = Deployment()
+        monkeypatch.setattr(serve_app, "Predictor", predictor)
+
+        assert serve_app.build_app({"max_batch_size": "32", "max_wait_ms": "2"}) is (
+            predictor
+        )
+        assert predictor.options_kwargs == {"max_ongoing_requests": 128}
+        assert predictor.bind_kwargs["max_batch_size"] == 32
+        assert predictor.bind_kwargs["max_wait_ms"] == 2.0
+        assert predictor.bind_kwargs["model_path"] == serve_app.MODEL_PATH
+        assert predictor.bind_kwargs["swap_interval_s"] == 30.0
+
+    def test_build_multi_model_app(self, serve_app, monkeypatch):
+        """Test that multiplexed models are not shared by default."""
+        predictor = Deployment()
+        monkeypatch.setattr(serve_app, "MultiModelPredictor", predictor)
+
+        serve_app.build_multi_model_app({"warmup_models": ["a"]})
+        assert predictor.options_kwargs == {"max_ongoing_requests": 1024}
+        assert predictor.bind_kwargs["model_sharing"] == "none"
+        assert predictor.bind_kwargs["warmup_models"] == ["a"]
+
+    def test_invalid_configs(self, serve_app):
+        """Test that unknown prediction cache scopes and registries fail."""
+        assert serve_app._prediction_cache({"scope": "none"}) is None
+        with pytest.raises(ValueError, match="scope"):
+            serve_app._prediction_cache({"scope": "node"})
+        with pytest.raises(ValueError, match="registry"):
+            serve_app._model_source({"registry": "s3"}, "/models/model.joblib")
+
+    def test_request_errors(self, serve_app):
+        """Test the 422 of rows of another width and the 406 of predictions."""
+        from fastapi import HTTPException
+
+        with pytest.raises(HTTPException) as error:
+            serve_app._check_features(np.ones((2, 3)), 4)
+        assert error.value.status_code == 422
+        serve_app._check_features(np.ones((2, 3)), None)
+
+        predictions = np.array([{"label": 1}], dtype=object)
+        with pytest.raises(HTTPException) as error:
+            serve_app._response("application/x-numpy", predictions)
+        assert error.value.status_code == 406
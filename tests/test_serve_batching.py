@@ -0,0 +1,140 @@
+"""
+Tests for the micro-batching of the serve image's predictions.
+"""
+
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from .conftest import Histogram, load_module
+
+
+@pytest.fixture(scope="module")
+def batching(docker_dir):
+    """Import docker/serve/src/batching.py."""
+    return load_module(docker_dir / "serve" / "src" / "batching.py")
+
+
+class Recorder:
+    """A model summing each row, recording the batches it predicts."""
+
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, rows):
+        self.batches.append(len(rows))
+        return rows.sum(axis=1)
+
+
+class TestMicroBatcher:
+    """Test suite for the MicroBatcher of the serve application."""
+
+    def test_concurrent_requests_share_a_batch(self, batching):
+        """Test that concurrent requests are predicted in one call."""
+        model = Recorder()
+        sizes, waits = Histogram(), Histogram()
+        batcher = batching.MicroBatcher(
+            model.predict,
+            max_batch_size=64,
+            max_wait_ms=50,
+            batch_size=sizes,
+            wait_ms=waits,
+        )
+
+        async def run():
+            requests = [np.full((n, 3), n, dtype=float) for n in (1, 2, 3)]
+            return await asyncio.gather(*(batcher.submit(rows) for rows in requests))
+
+        results = asyncio.run(run())
+
+        assert model.batches == [6]
+        # each request gets the predictions of its own rows
+        assert [result.tolist() for result in results] == [[3], [6, 6], [9, 9, 9]]
+        assert sizes.values == [6]
+        assert len(waits.values) == 3
+
+    def test_batches_are_bounded(self, batching):
+        """Test that batches hold whole requests of at most max_batch_size rows."""
+        model = Recorder()
+        batcher = batching.MicroBatcher(model.predict, max_batch_size=4, max_wait_ms=50)
+
+        async def run():
+            requests = [np.ones((n, 2)) for n in (3, 2, 1, 6)]
+            return await asyncio.gather(*(batcher.submit(rows) for rows in requests))
+
+        results = asyncio.run(run())
+
+        # a request larger than a batch is predicted on its own
+        assert model.batches == [3, 3, 6]
+        assert [len(result) for result in results] == [3, 2, 1, 6]
+
+    def test_sparse_requests_do_not_wait(self, batching):
+        """Test that requests further apart than the max wait start right away."""
+        model = Recorder()
+        waits = Histogram()
+        batcher = batching.MicroBatcher(
+            model.predict, max_batch_size=64, max_wait_ms=20, wait_ms=waits
+        )
+
+        async def run():
+            for _ in range(4):
+                await batcher.submit(np.ones(2))
+                await asyncio.sleep(0.05)
+
+        asyncio.run(run())
+
+        assert model.batches == [1, 1, 1, 1]
+        # only the first request waits, before the interval is known
+        assert all(wait < 10 for wait in waits.values[2:])
+
+    def test_errors_fail_the_batch(self, batching):
+        """Test that a failed predict fails every request of its batch only."""
+        calls = []
+
+        def predict(rows):
+            calls.append(len(rows))
+            if len(calls) == 1:
+                raise ValueError("bad model")
+            return rows[:, 0]
+
+        batcher = batching.MicroBatcher(predict, max_batch_size=64, max_wait_ms=20)
+
+        async def run():
+            failed = await asyncio.gather(
+                batcher.submit(np.ones(2)),
+                batcher.submit(np.ones(2)),
+                return_exceptions=True,
+            )
+            return failed, await batcher.submit(np.ones(2))
+
+        failed, result = asyncio.run(run())
+
+        assert all(isinstance(error, ValueError) for error in failed)
+        assert result.tolist() == [1.0]
+
+    def test_close_answers_the_rows_it_was_given(self, batching):
+        """Test that closing a batcher from another thread lets it drain."""
+        batcher = batching.MicroBatcher(
+            lambda rows: time.sleep(0.05) or rows[:, 0], max_wait_ms=1
+        )
+
+        async def run():
+            predicting = asyncio.ensure_future(batcher.submit(np.ones(2)))
+            await asyncio.sleep(0.01)
+            # queued while the first batch is predicted, then closed
+            queued = asyncio.ensure_future(batcher.submit(np.full(2, 2.0)))
+            await asyncio.sleep(0)
+            thread = threading.Thread(target=batcher.close)
+            thread.start()
+            thread.join()
+            results = await asyncio.wait_for(asyncio.gather(predicting, queued), 1)
+            await asyncio.sleep(0.01)
+            return results, batcher._worker
+
+        results, worker = asyncio.run(run())
+
+        assert [result.tolist() for result in results] == [[1.0], [2.0]]
+        assert worker.done() and not worker.cancelled()
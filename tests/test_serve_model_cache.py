@@ -0,0 +1,133 @@
+"""
+Tests for the model cache of the serve image's multiplexed deployment.
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from .conftest import Counter, load_module
+
+
+@pytest.fixture(scope="module")
+def model_cache(docker_dir):
+    """Import docker/serve/src/model_cache.py."""
+    return load_module(docker_dir / "serve" / "src" / "model_cache.py")
+
+
+class Loader:
+    """Loads models of the size in their ID, counting the loads of each."""
+
+    def __init__(self):
+        self.loads = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, model_id):
+        with self.lock:
+            self.loads[model_id] = self.loads.get(model_id, 0) + 1
+        if model_id == "missing":
+            raise FileNotFoundError(model_id)
+        return f"model {model_id}", int(model_id.split("-")[1])
+
+
+class TestModelCache:
+    """Test suite for the LRU model cache of multiplexed Serve replicas."""
+
+    def test_hits_and_misses(self, model_cache):
+        """Test that models are loaded once and counted as hits after."""
+        load, requests = Loader(), Counter("result")
+        cache = model_cache.ModelCache(load, max_bytes=100, requests=requests)
+
+        async def run():
+            assert await cache.get("a-10") == "model a-10"
+            assert await cache.get("a-10") == "model a-10"
+            assert await cache.get("b-10") == "model b-10"
+
+        asyncio.run(run())
+
+        assert load.loads == {"a-10": 1, "b-10": 1}
+        assert requests.counts == {"hit": 1, "miss": 2}
+
+    def test_concurrent_misses_load_once(self, model_cache):
+        """Test that concurrent gets of a model wait for the same load."""
+        load = Loader()
+        cache = model_cache.ModelCache(load, max_bytes=100)
+
+        async def run():
+            return await asyncio.gather(*(cache.get("a-10") for _ in range(8)))
+
+        assert asyncio.run(run()) == ["model a-10"] * 8
+        assert load.loads == {"a-10": 1}
+
+    def test_least_recently_used_are_evicted(self, model_cache):
+        """Test that models beyond the memory budget are evicted LRU first."""
+        evictions = Counter()
+        cache = model_cache.ModelCache(Loader(), max_bytes=100, evictions=evictions)
+
+        async def run():
+            await cache.get("a-40")
+            await cache.get("b-40")
+            await cache.get("a-40")
+            await cache.get("c-40")
+
+        asyncio.run(run())
+
+        assert "b-40" not in cache
+        assert "a-40" in cache and "c-40" in cache
+        assert cache.bytes == 80
+        assert evictions.counts == {None: 1}
+
+    def test_evicted_models_are_handed_to_on_evict(self, model_cache):
+        """Test that on_evict gets each model evicted or replaced, once."""
+        evicted = []
+        cache = model_cache.ModelCache(Loader(), max_bytes=100, on_evict=evicted.append)
+
+        async def run():
+            for model_id in ["a-60", "b-60", "c-60"]:
+                await cache.get(model_id)
+
+        asyncio.run(run())
+        cache.add("c-60", "c-60 v2", 60)
+
+        assert evicted == ["model a-60", "model b-60", "model c-60"]
+
+    def test_model_larger_than_the_budget(self, model_cache):
+        """Test that a model larger than the budget is still served, alone."""
+        cache = model_cache.ModelCache(Loader(), max_bytes=100)
+
+        async def run():
+            await cache.get("a-40")
+            return await cache.get("b-400")
+
+        assert asyncio.run(run()) == "model b-400"
+        assert len(cache) == 1
+
+    def test_failed_loads_are_retried(self, model_cache):
+        """Test that a failed load is raised and not cached."""
+        load = Loader()
+        cache = model_cache.ModelCache(load, max_bytes=100)
+
+        async def run():
+            for _ in range(2):
+                with pytest.raises(FileNotFoundError):
+                    await cache.get("missing")
+
+        asyncio.run(run())
+
+        assert load.loads == {"missing": 2}
+        assert len(cache) == 0
+
+    def test_models_added_beforehand(self, model_cache):
+        """Test that models added when warming up are held and counted once."""
+        load = Loader()
+        cache = model_cache.ModelCache(load, max_bytes=100)
+        cache.add("a-40", "model a-40", 40)
+        cache.add("a-40", "model a-40", 40)
+
+        async def run():
+            return await cache.get("a-40")
+
+        assert asyncio.run(run()) == "model a-40"
+        assert load.loads == {}
+        assert cache.bytes == 40
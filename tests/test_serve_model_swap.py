@@ -0,0 +1,216 @@
+"""
+Tests for the hot swaps of the serve image's models.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import types
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from .conftest import Counter, Gauge, load_module
+
+
+@pytest.fixture(scope="module")
+def batching(docker_dir):
+    """Import docker/serve/src/batching.py."""
+    return load_module(docker_dir / "serve" / "src" / "batching.py")
+
+
+@pytest.fixture(scope="module")
+def model_swap(docker_dir):
+    """Import docker/serve/src/model_swap.py."""
+    return load_module(docker_dir / "serve" / "src" / "model_swap.py")
+
+
+class Model:
+    n_features_in_ = 3
+
+    def __init__(self, version):
+        self.version = version
+
+
+class Batcher:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def generation(model_swap, version, closed=None):
+    on_close = None if closed is None else lambda: closed.append(version)
+    return model_swap.Generation(Model(version), version, Batcher(), on_close)
+
+
+class TestHotSwapper:
+    """Test suite for swapping a replica's model for its new versions."""
+
+    def test_swap_waits_for_the_previous_version_to_drain(self, model_swap):
+        """Test that the previous version is closed once its requests ended."""
+        closed = []
+        swaps, seconds = Counter(), Gauge()
+        swapper = model_swap.HotSwapper(
+            latest=lambda: "2",
+            load=lambda version: generation(model_swap, version, closed),
+            prepare=lambda generation: None,
+            current=generation(model_swap, "1", closed),
+            swaps=swaps,
+            swap_seconds=seconds,
+        )
+
+        with swapper.use() as previous:
+            swap = threading.Thread(target=swapper.check)
+            swap.start()
+            while swapper.current.version == "1":
+                time.sleep(0.01)
+            # new requests get the new version, the previous one still serves
+            with swapper.use() as current:
+                assert current.version == "2"
+            assert previous.model.version == "1"
+            assert not closed
+        swap.join()
+
+        assert closed == ["1"]
+        assert previous.model is None and previous.batcher is None
+        assert swaps.tags == [{"result": "swapped"}]
+        assert len(seconds.values) == 1
+        # the latest version is the current one
+        assert swapper.check() is False
+
+    def test_failed_warm_up_keeps_the_current_version(self, model_swap):
+        """Test that a version failing its warm-up is not swapped in."""
+        closed = []
+        swaps = Counter()
+
+        def prepare(generation):
+            raise ValueError("bad model")
+
+        current = generation(model_swap, "1", closed)
+        swapper = model_swap.HotSwapper(
+            latest=lambda: "2",
+            load=lambda version: generation(model_swap, version, closed),
+            prepare=prepare,
+            current=current,
+            swaps=swaps,
+        )
+
+        assert swapper.check() is False
+        assert swapper.current is current
+        # the failed version, e.g. its download, is let go of
+        assert closed == ["2"]
+        assert swaps.tags == [{"result": "failed"}]
+
+    def test_p99_latency_of_a_swap(self, model_swap):
+        """Test that the latencies observed during a swap only are exported."""
+        p99 = Gauge()
+        swapper = None
+
+        def prepare(generation):
+            for latency in range(1, 101):
+                swapper.observe(float(latency))
+
+        swapper = model_swap.HotSwapper(
+            latest=lambda: "2",
+            load=lambda version: generation(model_swap, version),
+            prepare=prepare,
+            current=generation(model_swap, "1"),
+            swap_p99_ms=p99,
+        )
+        swapper.observe(1000.0)
+
+        swapper.swap("2")
+        swapper.observe(1000.0)
+
+        assert p99.values == [pytest.approx(99.01)]
+
+    def test_drain_timeout(self, model_swap):
+        """Test that a version still in use is closed after drain_timeout_s."""
+        swapper = model_swap.HotSwapper(
+            latest=lambda: "2",
+            load=lambda version: generation(model_swap, version),
+            prepare=lambda generation: None,
+            current=generation(model_swap, "1"),
+            drain_timeout_s=0.1,
+        )
+
+        with swapper.use() as previous:
+            assert swapper.check() is True
+            assert previous.model is None
+
+    def test_requests_outlasting_the_drain_timeout(self, model_swap, batching):
+        """Test that a request still predicted after the drain is answered."""
+        batcher = batching.MicroBatcher(
+            lambda rows: time.sleep(0.2) or rows[:, 0], max_wait_ms=1
+        )
+        current = model_swap.Generation(Model("1"), "1", batcher)
+        swapper = model_swap.HotSwapper(
+            latest=lambda: "2",
+            load=lambda version: generation(model_swap, version),
+            prepare=lambda generation: None,
+            current=current,
+            drain_timeout_s=0.05,
+        )
+
+        async def predict(rows):
+            with swapper.use() as generation:
+                return await generation.batcher.submit(rows)
+
+        async def run():
+            slow = asyncio.ensure_future(predict(np.ones(2)))
+            await asyncio.sleep(0.01)
+            queued = asyncio.ensure_future(predict(np.full(2, 2.0)))
+            await asyncio.sleep(0)
+            swapped = asyncio.get_running_loop().run_in_executor(None, swapper.check)
+            return await asyncio.wait_for(asyncio.gather(slow, queued, swapped), 2)
+
+        slow, queued, swapped = asyncio.run(run())
+
+        assert swapped is True
+        assert current.model is None
+        assert (slow.tolist(), queued.tolist()) == ([1.0], [2.0])
+        assert current.in_flight == 0
+
+    def test_file_source(self, model_swap, tmp_path):
+        """Test that a model written in place is a new version."""
+        path = tmp_path / "model.joblib"
+        path.write_bytes(b"model")
+        source = model_swap.FileSource(str(path))
+        version = source.latest()
+
+        assert source.latest() == version
+        assert source.path(version) == str(path)
+        os.utime(path, ns=(0, 0))
+        assert source.latest() != version
+
+    def test_mlflow_source(self, model_swap, tmp_path, monkeypatch):
+        """Test that the model store fetches MLflow versions by their own key."""
+
+        def download_artifacts(artifact_uri, dst_path):
+            (Path(dst_path) / "model.joblib").write_text(artifact_uri)
+            return dst_path
+
+        mlflow = types.SimpleNamespace(
+            set_tracking_uri=lambda uri: None,
+            artifacts=types.SimpleNamespace(download_artifacts=download_artifacts),
+        )
+        monkeypatch.setitem(sys.modules, "mlflow", mlflow)
+        source = model_swap.MlflowSource("churn", directory=str(tmp_path / "a"))
+        os.makedirs(source.directory)
+
+        path = source.path("3")
+        assert Path(path).read_text() == "models:/churn/3"
+        store = source.store("3")
+        # the same for every replica, unlike the paths of their downloads
+        assert store["key"] == ("mlflow:churn", "3")
+        (tmp_path / "b").mkdir()
+        fetched = store["fetch"](str(tmp_path / "b"))
+        assert fetched == str(tmp_path / "b" / "model.joblib")
+
+        source.remove("3")
+        assert not os.path.exists(path)
@@ -0,0 +1,53 @@
+"""
+Tests for the model loading of the serve image.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from .conftest import load_module
+
+
+@pytest.fixture(scope="module")
+def models(docker_dir):
+    """Import docker/serve/src/models.py."""
+    return load_module(docker_dir / "serve" / "src" / "models.py")
+
+
+class TestModelLoading:
+    """Test suite for the models shared by the Serve replicas of a node."""
+
+    def test_memmapped_arrays_are_shared(self, models, tmp_path):
+        """Test that mmap sharing maps the model's arrays from its file."""
+        joblib = pytest.importorskip("joblib")
+        path = tmp_path / "model.joblib"
+        joblib.dump({"coef": np.arange(1000, dtype=np.float64)}, path)
+
+        model, seconds = models.load_model(str(path), sharing="mmap")
+
+        assert isinstance(model["coef"], np.memmap)
+        assert not model["coef"].flags.writeable
+        assert seconds >= 0
+
+    def test_unknown_sharing(self, models):
+        """Test that an unknown way of sharing is rejected before loading."""
+        with pytest.raises(ValueError, match="object-store"):
+            models.load_model("/nonexistent/model.joblib", sharing="fork")
+
+    @pytest.mark.skipif(
+        not os.path.exists("/proc/self/smaps_rollup"), reason="needs Linux 4.14+"
+    )
+    def test_memory_usage(self, models):
+        """Test that the replica's memory is read from the kernel."""
+        usage = models.memory_usage()
+
+        assert usage["rss"] > 0
+        assert 0 < usage["pss"] <= usage["rss"]
+        assert usage["shared"] <= usage["rss"]
+        assert models.memory_usage(pid=2**22 + 1) == {
+            "rss": None,
+            "pss": None,
+            "shared": None,
+        }
@@ -0,0 +1,91 @@
+"""
+Tests for the request and response encodings of the serve image.
+"""
+
+import numpy as np
+import pytest
+
+from .conftest import load_module
+
+
+@pytest.fixture(scope="module")
+def payloads(docker_dir):
+    """Import docker/serve/src/payloads.py."""
+    return load_module(docker_dir / "serve" / "src" / "payloads.py")
+
+
+class TestPayloads:
+    """Test suite for the JSON, numpy and Arrow encodings of /predict."""
+
+    def test_numpy_rows_are_not_copied(self, payloads):
+        """Test that numpy rows are decoded in place, in their own dtype."""
+        rows = np.arange(12, dtype=np.float32).reshape(3, 4)
+        body, headers = payloads.encode_rows(payloads.NUMPY, rows)
+
+        # as HTTP headers may be capitalized
+        headers = {key.title(): value for key, value in headers.items()}
+        decoded = payloads.decode_rows("application/x-numpy", headers, body)
+
+        assert headers["X-Dtype"] == "<f4"
+        assert decoded.dtype == np.float32
+        assert np.array_equal(decoded, rows)
+        assert not decoded.flags.owndata
+
+    def test_numpy_headers_must_match_the_buffer(self, payloads):
+        """Test that buffers of another size, dtype or shape are refused."""
+        body = np.ones((2, 3)).tobytes()
+
+        for headers in [
+            {"x-shape": "2,4", "x-dtype": "<f8"},
+            {"x-shape": "2,3", "x-dtype": "<U1"},
+            {"x-shape": "two,3"},
+            {"x-dtype": "<f8"},
+        ]:
+            with pytest.raises(payloads.PayloadError):
+                payloads.decode_rows(payloads.NUMPY, headers, body)
+
+    def test_numpy_string_predictions(self, payloads):
+        """Test that string labels are encoded as strings, not as pointers."""
+        for labels in [
+            np.array(["cat", "dog", "cat"]),
+            np.array(["cat", "dog", "cat"], dtype=object),
+        ]:
+            body, headers = payloads.encode_predictions(payloads.NUMPY, labels)
+
+            assert headers["x-dtype"] == "<U3"
+            decoded = payloads.decode_predictions(payloads.NUMPY, headers, body)
+            assert decoded.tolist() == ["cat", "dog", "cat"]
+
+        with pytest.raises(payloads.PayloadError):
+            payloads.encode_predictions(
+                payloads.NUMPY, np.array([{"cat": 0.9}], dtype=object)
+            )
+
+    def test_json_and_media_types(self, payloads):
+        """Test JSON, the default, and that other media types are refused."""
+        body, headers = payloads.encode_rows(payloads.JSON, [[1, 2], [3, 4]])
+
+        assert payloads.decode_rows(None, {}, body).tolist() == [[1, 2], [3, 4]]
+        with pytest.raises(payloads.PayloadError):
+            payloads.decode_rows(payloads.JSON, {}, b'{"rows": [[1, 2], [3]]}')
+        with pytest.raises(payloads.UnsupportedMediaType):
+            payloads.decode_rows("text/csv", {}, b"1,2\n3,4\n")
+
+        body, headers = payloads.encode_predictions(payloads.JSON, np.array([1, 0]))
+        assert body == b'{"predictions": [1, 0]}'
+
+    def test_arrow_round_trip(self, payloads):
+        """Test Arrow rows and predictions, one column per feature or class."""
+        pytest.importorskip("pyarrow")
+        rows = np.random.default_rng(0).random((100, 3))
+        body, headers = payloads.encode_rows(payloads.ARROW, rows)
+
+        decoded = payloads.decode_rows(headers["content-type"], headers, body)
+        assert np.array_equal(decoded, rows)
+
+        for predictions in [rows[:, 0], rows[:, :2]]:
+            body, headers = payloads.encode_predictions(payloads.ARROW, predictions)
+            assert np.array_equal(
+                payloads.decode_predictions(headers["content-type"], headers, body),
+                predictions,
+            )
@@ -0,0 +1,176 @@
+"""
+Tests for the prediction cache of the serve image.
+"""
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from .conftest import Counter, load_module
+
+
+@pytest.fixture(scope="module")
+def prediction_cache(docker_dir):
+    """Import docker/serve/src/prediction_cache.py."""
+    return load_module(docker_dir / "serve" / "src" / "prediction_cache.py")
+
+
+class Model:
+    """Predicts the sum of each row, slowly, counting its predictions."""
+
+    def __init__(self, fail=False, delay=0.01):
+        self.calls = 0
+        self.fail = fail
+        self.delay = delay
+
+    async def predict(self, rows):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ValueError("bad rows")
+        return np.asarray(rows).sum(axis=1)
+
+
+class TestPredictionCache:
+    """Test suite for the cache of predictions by model version and rows."""
+
+    def test_input_key_is_canonical(self, prediction_cache):
+        """Test that equal rows hash the same whatever their dtype or layout."""
+        key = prediction_cache.input_key
+        rows = np.array([[1.0, 0.0], [3.0, 4.0]])
+
+        assert key(rows) == key(rows.astype(np.int32))
+        assert key(rows) == key(np.asfortranarray(rows))
+        assert key(rows) == key(np.array([[1.0, -0.0], [3.0, 4.0]]))
+        assert key(rows) != key(rows.reshape(1, 4))
+        assert key(rows) != key(rows + 1e-9)
+
+    def test_hits_and_coalescing(self, prediction_cache):
+        """Test that repeated and concurrent rows are predicted once."""
+        model, requests = Model(), Counter("result")
+        cache = prediction_cache.PredictionCache(requests=requests)
+        rows = np.ones((2, 3))
+
+        def get():
+            key = prediction_cache.input_key(rows)
+            return cache.get_or_compute("m", "1", key, lambda: model.predict(rows))
+
+        async def run():
+            results = await asyncio.gather(*(get() for _ in range(5)))
+            return results + [await get()]
+
+        results = asyncio.run(run())
+
+        assert model.calls == 1
+        assert all(result.tolist() == [3.0, 3.0] for result in results)
+        assert requests.counts == {"miss": 1, "coalesced": 4, "hit": 1}
+
+    def test_expiry_and_eviction(self, prediction_cache, monkeypatch):
+        """Test that predictions expire after the TTL and beyond max_bytes."""
+        now = [1000.0]
+        monkeypatch.setattr(prediction_cache.time, "monotonic", lambda: now[0])
+        # without timers, which the frozen clock would stop
+        model = Model(delay=0)
+        # room for two predictions of a row, of 8 bytes each
+        cache = prediction_cache.PredictionCache(max_bytes=16, ttl_s=60)
+
+        def get(value):
+            rows = np.full((1, 2), value)
+            return cache.get_or_compute(
+                "m", "1", str(value), lambda: model.predict(rows)
+            )
+
+        async def run():
+            await get(1)
+            await get(2)
+            await get(1)
+            now[0] += 30
+            await get(3)  # evicts 2, the least recently used
+            await get(1)
+            await get(2)
+            now[0] += 61
+            await get(3)
+
+        asyncio.run(run())
+
+        # 1, 2, 3, 2 again, and 3 once expired
+        assert model.calls == 5
+        assert len(cache) == 2
+        assert cache.bytes == 16
+
+    def test_large_predictions_are_not_cached(self, prediction_cache):
+        """Test that predictions larger than max_bytes are not cached."""
+        evictions = Counter()
+        cache = prediction_cache.PredictionCache(max_bytes=100, evictions=evictions)
+        cache.put("m", "1", "small", np.zeros(10))
+        cache.put("m", "1", "large", np.zeros(20))
+        cache.put("m", "1", "other", np.zeros(10))
+
+        assert len(cache) == 1
+        assert cache.bytes == 80
+        assert evictions.counts == {None: 1}
+
+    def test_views_are_not_kept(self, prediction_cache):
+        """Test that a view of a batch's predictions doesn't keep the batch."""
+        cache = prediction_cache.PredictionCache(max_bytes=100)
+        batch = np.zeros(1000)
+        cache.put("m", "1", "rows", batch[:1])
+
+        assert cache.bytes == 8
+        assert cache._entries[("m", "1", "rows")][1].base is None
+
+    def test_versions_are_kept_apart(self, prediction_cache):
+        """Test that the versions of a model served at once keep their own."""
+        model = Model()
+        cache = prediction_cache.PredictionCache()
+        rows = np.ones((1, 2))
+
+        async def get(name, version):
+            return await cache.get_or_compute(
+                name, version, "rows", lambda: model.predict(rows)
+            )
+
+        async def run():
+            await get("a", "1")
+            await get("b", "1")
+            await get("a", "2")
+            # replicas still serving a's version 1 during a swap
+            await get("a", "1")
+            await get("a", "2")
+            await get("b", "1")
+
+        asyncio.run(run())
+
+        assert model.calls == 3
+        assert len(cache) == 3
+
+    def test_old_versions_are_evicted_first(self, prediction_cache):
+        """Test that the predictions of versions no longer served go first."""
+        cache = prediction_cache.PredictionCache(max_bytes=24)
+        for key in ["x", "y"]:
+            cache.put("m", "1", key, np.zeros(1))
+        for key in ["x", "y", "z"]:
+            cache.put("m", "2", key, np.zeros(1))
+
+        assert list(cache._entries) == [("m", "2", key) for key in ["x", "y", "z"]]
+
+    def test_failures_are_not_cached(self, prediction_cache):
+        """Test that a failed prediction leaves its waiters to try themselves."""
+        model = Model(fail=True)
+        cache = prediction_cache.PredictionCache()
+        rows = np.ones((1, 2))
+
+        def get():
+            return cache.get_or_compute("m", "1", "rows", lambda: model.predict(rows))
+
+        async def run():
+            return await asyncio.gather(
+                *(get() for _ in range(3)), return_exceptions=True
+            )
+
+        results = asyncio.run(run())
+
+        assert all(isinstance(result, ValueError) for result in results)
+        assert model.calls == 3
+        assert len(cache) == 0
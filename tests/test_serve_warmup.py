@@ -0,0 +1,60 @@
+"""
+Tests for the warm-up of the serve image's replicas.
+"""
+
+import numpy as np
+import pytest
+
+from .conftest import Gauge, load_module
+
+
+@pytest.fixture(scope="module")
+def warmup(docker_dir):
+    """Import docker/serve/src/warmup.py."""
+    return load_module(docker_dir / "serve" / "src" / "warmup.py")
+
+
+class TestWarmUp:
+    """Test suite for the synthetic batches replicas warm up with."""
+
+    def test_batches_and_steps(self, warmup):
+        """Test that every batch size runs through predict and the steps."""
+        predicted, stepped = [], []
+
+        def predict(rows):
+            predicted.append(rows.shape)
+            return rows.sum(axis=1)
+
+        seconds = warmup.warm_up(
+            predict,
+            n_features=3,
+            max_batch_size=20,
+            rounds=2,
+            steps=[lambda rows, predictions: stepped.append(len(predictions))],
+        )
+
+        assert warmup.batch_sizes(20) == [1, 2, 4, 8, 16, 20]
+        assert predicted == [(n, 3) for n in [1, 2, 4, 8, 16, 20]] * 2
+        assert stepped == [n for n, _ in predicted]
+        assert seconds >= 0
+
+    def test_cold_start_instead_of_failing(self, warmup):
+        """Test that models which cannot warm up leave the replica to start."""
+
+        def predict(rows):
+            raise ValueError("categorical features expected")
+
+        assert warmup.warm_up(predict, 3, 8) is None
+        assert warmup.warm_up(predict, None, 8) is None
+        assert warmup.warm_up(predict, 3, 8, rounds=0) is None
+
+    def test_first_request(self, warmup):
+        """Test that only the first request's latency is exported."""
+        gauge = Gauge()
+        first_request = warmup.FirstRequest(gauge)
+
+        for seconds in [0.2, 0.01, 0.3]:
+            first_request.observe(seconds)
+
+        assert gauge.values == [0.2]
+        assert np.isclose(first_request.seconds, 0.2)
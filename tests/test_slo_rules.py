@@ -0,0 +1,70 @@
+"""
+Tests for the SLO burn-rate rules generated by scripts/slo-rules.py.
+"""
+
+import shutil
+import subprocess
+
+import pytest
+import yaml
+
+from .conftest import load_module
+
+
+@pytest.fixture(scope="module")
+def slo_rules(project_root):
+    """Import scripts/slo-rules.py."""
+    return load_module(project_root / "scripts" / "slo-rules.py")
+
+
+@pytest.fixture(scope="module")
+def rules_dir(charts_dir):
+    """The rules directory of the kube-prometheus-stack chart."""
+    return charts_dir / "kube-prometheus-stack" / "rules"
+
+
+class TestSloRules:
+    """Test suite for the performance objectives' alerting rules."""
+
+    def test_rules_are_up_to_date(self, slo_rules, rules_dir):
+        """Test that slo.rules.yaml is the rendering of slos.yaml."""
+        objectives = yaml.safe_load((rules_dir / "slos.yaml").read_text())
+        rendered = slo_rules.render(objectives["objectives"])
+        assert (
+            rendered == (rules_dir / "slo.rules.yaml").read_text()
+        ), "slo.rules.yaml is out of date, run python scripts/slo-rules.py"
+
+    def test_every_objective_has_burn_rate_alerts(self, rules_dir):
+        """Test that each objective records every window and alerts on each pair."""
+        objectives = yaml.safe_load((rules_dir / "slos.yaml").read_text())
+        groups = yaml.safe_load((rules_dir / "slo.rules.yaml").read_text())["groups"]
+        for objective in objectives["objectives"]:
+            rules = [
+                rule
+                for group in groups
+                if group["name"].startswith(f"slo-{objective['name']}")
+                for rule in group["rules"]
+            ]
+            windows = {
+                rule["record"].removeprefix("slo:sli_error:ratio_rate")
+                for rule in rules
+                if rule.get("record", "").startswith("slo:sli_error:")
+            }
+            alerts = [rule for rule in rules if "alert" in rule]
+
+            assert windows == {"5m", "30m", "1h", "2h", "6h", "1d", "3d"}
+            assert len(alerts) == 4
+            for alert in alerts:
+                assert alert["labels"]["slo"] == objective["name"]
+                assert alert["labels"]["severity"] in {"critical", "warning"}
+                assert {alert["labels"]["long"], alert["labels"]["short"]} <= windows
+
+    def test_promtool_unit_tests(self, rules_dir):
+        """Test the rules against the synthetic series of rules/tests."""
+        if shutil.which("promtool") is None:
+            pytest.skip("promtool not installed")
+        tests = sorted(str(path) for path in (rules_dir / "tests").glob("*.test.yaml"))
+        result = subprocess.run(
+            ["promtool", "test", "rules", *tests], capture_output=True, text=True
+        )
+        assert result.returncode == 0, result.stdout + result.stderr
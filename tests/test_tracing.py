@@ -0,0 +1,52 @@
+"""
+Tests for the tracing module of the serve image and the exemplar links of the
+Serve dashboard.
+"""
+
+import json
+
+import pytest
+
+from .conftest import load_module
+
+
+@pytest.fixture(scope="module")
+def tracing(docker_dir):
+    """Import docker/serve/src/tracing.py."""
+    return load_module(docker_dir / "serve" / "src" / "tracing.py")
+
+
+class TestTracing:
+    """Test suite for the OpenTelemetry tracing of the platform's services."""
+
+    def test_without_collector(self, tracing, monkeypatch):
+        """Test that spans cost nothing and change nothing without a collector."""
+        monkeypatch.delenv("OTEL_EXPORTER_OTLP_ENDPOINT", raising=False)
+        assert tracing.setup_tracing("serve") is False
+
+        context = tracing.extract(
+            {"traceparent": "00-" + "1" * 32 + "-" + "2" * 16 + "-01"}
+        )
+        with tracing.span(
+            "predict", context=context, kind="server", attributes={"rows": 1}
+        ) as current:
+            assert current is None or not current.is_recording()
+
+        with pytest.raises(ValueError):
+            with tracing.span("predict"):
+                raise ValueError("bad features")
+
+    def test_latency_panel_links_to_traces(self, project_root):
+        """Test that the traced Serve latency panel queries exemplars."""
+        dashboard = json.loads(
+            (project_root / "dashboards" / "serve_grafana_dashboard.json").read_text()
+        )
+        [panel] = [
+            p
+            for p in dashboard["panels"]
+            if "traces_span_metrics_duration_milliseconds_bucket"
+            in p["targets"][0]["expr"]
+        ]
+        # the graph panels of the other latency panels do not show exemplars
+        assert panel["type"] == "timeseries"
+        assert all(target["exemplar"] for target in panel["targets"])